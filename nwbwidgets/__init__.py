@@ -1,7 +1,28 @@
+import importlib
+
 import plotly.io as pio
 
-from .panel import Panel
 from .version import version as __version__
-from .view import default_neurodata_vis_spec, nwb2widget
 
 pio.templates.default = "simple_white"
+
+# Panel and the widgets are imported on first access, so that importing nwbwidgets stays fast
+_lazy_attributes = {
+    "Panel": "panel",
+    "default_neurodata_vis_spec": "view",
+    "nwb2widget": "view",
+}
+
+__all__ = ["Panel", "default_neurodata_vis_spec", "nwb2widget", "__version__"]
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_lazy_attributes[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
@@ -1,5 +1,8 @@
+import importlib
+import sys
 from collections.abc import Iterable
 from datetime import datetime
+from functools import lru_cache, partial
 from typing import Union
 
 import h5py
@@ -13,6 +16,8 @@ from pynwb import ProcessingModule
 from pynwb.base import DynamicTable
 from pynwb.core import MultiContainerInterface, NWBDataInterface
 
+from .utils.cache import get_widget_cache
+
 GroupingWidget = Union[widgets.Accordion, widgets.Tab]
 
 
@@ -40,12 +45,11 @@ def render_dataframe(dynamic_table: DynamicTable):
 def show_neurodata_base(node: NWBDataInterface, neurodata_vis_spec: dict) -> widgets.Widget:
     """
     Gets a pynwb object and returns a Vertical Box containing textual info and
-    an expandable Accordion with it's children.
+    an expandable Accordion with it's children. Children are rendered when their panel is first expanded.
     """
     field_lay = widgets.Layout(max_height="40px", max_width="500px", min_height="30px", min_width="180px")
     info = []  # string data type, exposed as a Text widget
-    neuro_data = []  # more complex data types, also with children
-    labels = []
+    neuro_data = dict()  # more complex data types, also with children
     for key, value in node.fields.items():
         if isinstance(value, (str, datetime)):
             lbl_key = widgets.Label(key + ":", layout=field_lay)
@@ -67,20 +71,27 @@ def show_neurodata_base(node: NWBDataInterface, neurodata_vis_spec: dict) -> wid
             hbox_exp = widgets.HBox(children=[lbl_experimenter, lbl_names])
             info.append(hbox_exp)
         elif (isinstance(value, Iterable) and len(value)) or value:
-            neuro_data.append(nwb2widget(value, neurodata_vis_spec=neurodata_vis_spec))
-            labels.append(key)
-    accordion = widgets.Accordion(children=neuro_data, selected_index=None)
-    for i, label in enumerate(labels):
-        if hasattr(node.fields[label], "description") and node.fields[label].description:
-            accordion.set_title(i, label + ": " + node.fields[label].description)
-        else:
-            accordion.set_title(i, label)
+            neuro_data[key] = value
+    accordion = lazy_accordion(neuro_data, partial(nwb2widget, neurodata_vis_spec=neurodata_vis_spec))
     return widgets.VBox(info + [accordion])
 
 
-def dict2accordion(d: dict, neurodata_vis_spec: dict, **pass_kwargs) -> widgets.Widget:
-    if len(d) == 1:
-        return nwb2widget(list(d.values())[0], neurodata_vis_spec=neurodata_vis_spec)
+def lazy_accordion(d: dict, func_) -> widgets.Accordion:
+    """Creates an Accordion whose panels are generated when they are first expanded
+
+    Parameters
+    ----------
+    d: dict
+        keys are labels for the panels and values are the data they show
+    func_: callable
+        creates the widget of a panel from its data
+
+    Returns
+    -------
+    ipywidgets.Accordion
+
+    """
+    values = list(d.values())
     children = [widgets.HTML("Rendering...") for _ in d]
     accordion = widgets.Accordion(children=children, selected_index=None)
     for i, label in enumerate(d):
@@ -89,11 +100,14 @@ def dict2accordion(d: dict, neurodata_vis_spec: dict, **pass_kwargs) -> widgets.
         else:
             accordion.set_title(i, label)
 
+    rendered = set()
+
     def on_selected_index(change):
-        if change.new is not None and isinstance(change.owner.children[change.new], widgets.HTML):
-            children[change.new] = nwb2widget(
-                list(d.values())[change.new], neurodata_vis_spec=neurodata_vis_spec, **pass_kwargs
-            )
+        if change.new is None:
+            return
+        if change.new not in rendered:
+            children[change.new] = func_(values[change.new])
+            rendered.add(change.new)
             change.owner.children = children
 
     accordion.observe(on_selected_index, names="selected_index")
@@ -101,6 +115,12 @@ def dict2accordion(d: dict, neurodata_vis_spec: dict, **pass_kwargs) -> widgets.
     return accordion
 
 
+def dict2accordion(d: dict, neurodata_vis_spec: dict, **pass_kwargs) -> widgets.Widget:
+    if len(d) == 1:
+        return nwb2widget(list(d.values())[0], neurodata_vis_spec=neurodata_vis_spec)
+    return lazy_accordion(d, partial(nwb2widget, neurodata_vis_spec=neurodata_vis_spec, **pass_kwargs))
+
+
 def lazy_tabs(in_dict: dict, node, style: GroupingWidget = widgets.Tab) -> GroupingWidget:
     """Creates a lazy tab object where multiple visualizations can be used for a single node and are generated on the
     fly
@@ -121,13 +141,13 @@ def lazy_tabs(in_dict: dict, node, style: GroupingWidget = widgets.Tab) -> Group
     """
     tabs_spec = list(in_dict.items())
 
-    children = [tabs_spec[0][1](node)] + [widgets.HTML("Rendering...") for _ in range(len(tabs_spec) - 1)]
+    children = [load_vis(tabs_spec[0][1])(node)] + [widgets.HTML("Rendering...") for _ in range(len(tabs_spec) - 1)]
     tab = style(children=children)
     [tab.set_title(i, label) for i, (label, _) in enumerate(tabs_spec)]
 
     def on_selected_index(change):
         if isinstance(change.owner.children[change.new], widgets.HTML):
-            children[change.new] = vis2widget(tabs_spec[change.new][1](node))
+            children[change.new] = vis2widget(load_vis(tabs_spec[change.new][1])(node))
             change.owner.children = children
 
     tab.observe(on_selected_index, names="selected_index")
@@ -149,7 +169,8 @@ class LazyTab(widgets.Tab):
         """
 
         tabs_spec = list(func_dict.items())
-        children = [tabs_spec[0][1](data)] + [widgets.HTML("Rendering...") for _ in range(len(tabs_spec) - 1)]
+        children = [load_vis(tabs_spec[0][1])(data)]
+        children += [widgets.HTML("Rendering...") for _ in range(len(tabs_spec) - 1)]
 
         super().__init__(children=children)
 
@@ -157,7 +178,7 @@ class LazyTab(widgets.Tab):
 
         def on_selected_index(change):
             if isinstance(change.owner.children[change.new], widgets.HTML):
-                children[change.new] = vis2widget(tabs_spec[change.new][1](data))
+                children[change.new] = vis2widget(load_vis(tabs_spec[change.new][1])(data))
                 change.owner.children = children
 
         self.observe(on_selected_index, names="selected_index")
@@ -194,21 +215,139 @@ def lazy_show_over_data(list_, func_, labels=None, style: GroupingWidget = widge
     return out
 
 
-def nwb2widget(node, neurodata_vis_spec: dict, **pass_kwargs) -> widgets.Widget:
+def nwb2widget(node, neurodata_vis_spec: dict, use_cache: bool = True, **pass_kwargs) -> widgets.Widget:
+    """Widget of `node`, from the first entry of `neurodata_vis_spec` matching its type.
+
+    Values of `neurodata_vis_spec`, and of its tab specs, can be "module:attribute" strings of visualizations, imported
+    on first use, see `load_vis`. Use a `VisSpec` to also resolve them when indexing the spec directly.
+
+    Widgets are cached, see `nwbwidgets.utils.cache.WidgetCache`, so that navigating back to an object, or calling
+    `nwb2widget` on it again, reuses its live widget. Set `use_cache` to False to always build a new one.
+    """
     for ndtype in type(node).__mro__:
         if ndtype in neurodata_vis_spec:
             spec = neurodata_vis_spec[ndtype]
+            cache_key = _get_widget_cache_key(neurodata_vis_spec, spec, pass_kwargs) if use_cache else None
+            if cache_key is not None:
+                widget = get_widget_cache().get(node, cache_key)
+                if widget is not None:
+                    return widget
             if isinstance(spec, dict):
-                return lazy_tabs(spec, node)
-            elif callable(spec):
-                visualization = spec(node, neurodata_vis_spec=neurodata_vis_spec, **pass_kwargs)
-                return vis2widget(visualization)
+                widget = lazy_tabs(spec, node)
+            elif isinstance(spec, str) or callable(spec):
+                visualization = load_vis(spec)(node, neurodata_vis_spec=neurodata_vis_spec, **pass_kwargs)
+                widget = vis2widget(visualization)
+            else:
+                continue
+            if cache_key is not None:
+                get_widget_cache().put(node, cache_key, widget)
+            return widget
     out1 = widgets.Output()
     with out1:
         print(node)  # Is this necessary?
     return out1
 
 
+def load_vis(vis):
+    """Visualization function or class of a neurodata_vis_spec entry, imported if given as a "module:attribute"
+    string, e.g. "nwbwidgets.ecephys:ElectricalSeriesWidget"."""
+    if isinstance(vis, str):
+        return _import_attribute(vis)
+    return vis
+
+
+@lru_cache(maxsize=None)
+def _import_attribute(path: str):
+    module_name, attribute = path.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class _IdentityKey:
+    """Hashable reference to an object that may not be hashable, e.g. a spec dict, equal only to references to the
+    same object. Holding the object keeps its id from being reused while the key is in use."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _IdentityKey) and other.obj is self.obj
+
+
+class VisSpec(dict):
+    """neurodata_vis_spec whose "module:attribute" strings are resolved on access.
+
+    Values given as strings are imported by `spec[ndtype]` and `spec.get(ndtype)`, so that the visualizations are only
+    imported when used, and can still be called directly, e.g. `spec[ndtype](node)`.
+
+    Keys given as strings are types of optional extensions, e.g. "ndx_spectrum:Spectrum". Their module is imported
+    once it is already imported elsewhere, or once a type of its namespace, e.g. "ndx-spectrum", is looked up. Types
+    of extensions are matched by namespace and neurodata_type, so that the classes generated by pynwb from the
+    namespaces cached in a file match the classes of the extension module.
+    """
+
+    @staticmethod
+    def _get_namespace_key(ndtype):
+        namespace = getattr(ndtype, "namespace", None)
+        neurodata_type = getattr(ndtype, "neurodata_type", None)
+        if isinstance(namespace, str) and isinstance(neurodata_type, str):
+            return namespace, neurodata_type
+        return None
+
+    def _resolve_keys(self, ndtype=None):
+        namespace_key = self._get_namespace_key(ndtype)
+        # e.g. "ndx-spectrum" -> "ndx_spectrum"
+        namespace_module = namespace_key[0].replace("-", "_") if namespace_key else None
+        for key in [key for key in dict.keys(self) if isinstance(key, str) and ":" in key]:
+            module_name = key.partition(":")[0]
+            if module_name not in sys.modules and module_name.split(".")[0] != namespace_module:
+                continue
+            value = dict.pop(self, key)
+            try:
+                dict.__setitem__(self, _import_attribute(key), value)
+            except (ImportError, AttributeError):
+                pass
+
+    def _get_key(self, key):
+        """`key`, or the type of the spec with the same namespace and neurodata_type"""
+        self._resolve_keys(key)
+        if dict.__contains__(self, key):
+            return key
+        namespace_key = self._get_namespace_key(key)
+        if namespace_key is None or namespace_key[0] == "core":
+            return key
+        for other in dict.keys(self):
+            if isinstance(other, type) and self._get_namespace_key(other) == namespace_key:
+                return other
+        return key
+
+    def __contains__(self, key):
+        return dict.__contains__(self, self._get_key(key))
+
+    def __getitem__(self, key):
+        return load_vis(dict.__getitem__(self, self._get_key(key)))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def copy(self):
+        return type(self)(self)
+
+
+def _get_widget_cache_key(neurodata_vis_spec: dict, spec, pass_kwargs: dict):
+    """Key of the widget built with `spec` in the WidgetCache, or None if the arguments are not hashable"""
+    key = (_IdentityKey(neurodata_vis_spec), _IdentityKey(spec), tuple(sorted(pass_kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def vis2widget(vis) -> widgets.Widget:
     if isinstance(vis, widgets.Widget):
         out = vis
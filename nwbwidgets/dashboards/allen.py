@@ -154,7 +154,7 @@ class AllenDashboard(widgets.VBox):
             else:
                 path_ext_file = Path(file_path)
             image = imread(path_ext_file, key=frame_number)
-            self.photon_series.out_fig.data[0].z = image
+            self.photon_series.image_view.show_frame(image)
 
     def updated_time_range(self, change=None):
         """Operations to run whenever time range gets updated"""
@@ -1,12 +1,26 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import plotly.graph_objects as go
-from ipywidgets import Layout, fixed, widgets
+from ipywidgets import HBox, Layout, fixed, widgets
 from pynwb import TimeSeries
 from pynwb.image import GrayscaleImage, ImageSeries, RGBImage
-from tifffile import TiffFile, imread
-
-from .base import fig2widget
-from .controllers import StartAndDurationController
+from tifffile import TiffFile
+
+from .base import fig2widget, load_vis
+from .controllers import ProgressBar, StartAndDurationController
+from .utils.frames import FrameReader, uses_external_file
+from .utils.images import (
+    encode_image,
+    get_colormap_lut,
+    get_contrast_limits,
+    to_data_uri,
+    to_uint8_image,
+)
+from .utils.summary import (
+    SUMMARY_IMAGES,
+    get_summary_images_path,
+    load_or_compute_summary_images,
+)
 from .utils.timeseries import (
     get_timeseries_maxt,
     get_timeseries_mint,
@@ -14,6 +28,109 @@ from .utils.timeseries import (
 )
 
 
+class ImageFrameWidget(widgets.VBox):
+    """Shows frames as compressed PNG or JPEG images, encoded in the kernel.
+
+    A frame of 1024x1024 pixels sent as a heatmap costs megabytes of JSON, while its PNG is typically a few hundred
+    kilobytes. By default, the image is the single layout image of a FigureWidget, whose source is replaced in place so
+    that the figure keeps its zoom. With `use_figure=False`, it is shown in an ipywidgets.Image, which sends the bytes
+    without base64 encoding.
+    """
+
+    def __init__(
+        self,
+        format: str = "png",
+        cmap: str = "gray",
+        contrast=None,
+        percentiles=None,
+        use_figure: bool = True,
+        quality: int = 90,
+    ):
+        """
+
+        Parameters
+        ----------
+        format: {'png', 'jpeg'}, optional
+        cmap: str, optional
+            matplotlib colormap of 2D frames
+        contrast: (float, float), optional
+            Values mapped to the first and last colors. Defaults to the range of each frame.
+        percentiles: (float, float), optional
+            Percentiles of the values of each frame mapped to the first and last colors, when `contrast` is not given
+        use_figure: bool, optional
+        quality: int, optional
+            JPEG quality
+        """
+        super().__init__()
+        self.format = format
+        self.quality = quality
+        self.cmap = cmap
+        self.lut = get_colormap_lut(cmap)
+        self.contrast = contrast
+        self.percentiles = percentiles
+        self.frame = None
+        self.out_fig = None
+        self.image = None
+
+        if use_figure:
+            self.out_fig = go.FigureWidget()
+            self.out_fig.update_layout(
+                xaxis=go.layout.XAxis(showticklabels=False, ticks="", showgrid=False, zeroline=False),
+                yaxis=go.layout.YAxis(
+                    showticklabels=False, ticks="", showgrid=False, zeroline=False, scaleanchor="x", scaleratio=1
+                ),
+                images=[
+                    go.layout.Image(
+                        xref="x", yref="y", x=0, y=0, xanchor="left", yanchor="top", sizing="stretch", layer="below"
+                    )
+                ],
+            )
+            self.children = [self.out_fig]
+        else:
+            self.image = widgets.Image(format=format)
+            self.children = [self.image]
+
+    def set_display(self, cmap: str = None, contrast=None, percentiles=None):
+        """Change the colormap or the contrast, and redraw the current frame"""
+        if cmap is not None:
+            self.cmap = cmap
+            self.lut = get_colormap_lut(cmap)
+        if contrast is not None or percentiles is not None:
+            self.contrast = contrast
+            self.percentiles = percentiles
+        if self.frame is not None:
+            self.show_frame(self.frame)
+
+    def encode_frame(self, frame) -> bytes:
+        """Compressed image of `frame`, of shape (height, width) or (height, width, 3 or 4)"""
+        frame = np.asarray(frame)
+        if self.contrast is not None:
+            vmin, vmax = self.contrast
+        elif frame.ndim == 3 and frame.dtype == np.uint8:
+            vmin, vmax = 0, 255
+        else:
+            vmin, vmax = get_contrast_limits(frame, self.percentiles)
+        return encode_image(to_uint8_image(frame, self.lut, vmin, vmax), self.format, self.quality)
+
+    def show_frame(self, frame, title: str = None):
+        """Show `frame`, of shape (height, width) or (height, width, 3 or 4)"""
+        self.frame = frame
+        data = self.encode_frame(frame)
+        if self.image is not None:
+            self.image.value = data
+            return
+        height, width = np.shape(frame)[:2]
+        with self.out_fig.batch_update():
+            image = self.out_fig.layout.images[0]
+            if (image.sizex, image.sizey) != (width, height):
+                image.update(sizex=width, sizey=height)
+                self.out_fig.layout.xaxis.range = [0, width]
+                self.out_fig.layout.yaxis.range = [height, 0]
+            image.source = to_data_uri(data, self.format)
+            if title is not None:
+                self.out_fig.layout.title = title
+
+
 class ImageSeriesWidget(widgets.VBox):
     """Widget showing ImageSeries."""
 
@@ -54,31 +171,113 @@ class ImageSeriesWidget(widgets.VBox):
         self.controls.update({key: widgets.fixed(val) for key, val in kwargs.items()})
 
     def get_frame(self, idx):
-        if self.imageseries.external_file is not None:
-            return imread(self.imageseries.external_file, key=idx)
-        else:
-            return self.image_series.data[idx].T
+        frame = self.reader.get_frame(idx)
+        # frames of external files are shown as they are
+        return frame if uses_external_file(self.imageseries) else np.swapaxes(frame, 0, 1)
 
     def set_out_fig(self):
-        self.out_fig = go.FigureWidget(
-            data=go.Heatmap(
-                z=self.get_frame(0),
-                colorscale="gray",
-                showscale=False,
-            )
-        )
-        self.out_fig.update_layout(
-            xaxis=go.layout.XAxis(showticklabels=False, ticks=""),
-            yaxis=go.layout.YAxis(showticklabels=False, ticks="", scaleanchor="x", scaleratio=1),
-        )
+        self.reader = FrameReader.from_image_series(self.imageseries)
+        self.image_view = ImageFrameWidget()
+        self.image_view.show_frame(self.get_frame(0))
+        self.out_fig = self.image_view.out_fig
 
         def on_change(change):
             # Read frame
-            frame_number = self.time_to_index(change["new"][0])
-            image = self.get_frame(frame_number)
-            self.out_fig.data[0].z = image
+            frame_number = min(max(self.time_to_index(change["new"][0]), 0), len(self.reader) - 1)
+            self.image_view.show_frame(self.get_frame(frame_number))
+            self.reader.prefetch(frame_number)
+
+        self.controls["time_window"].observe(on_change, names="value")
+
 
-        self.controls["time_window"].observe(on_change)
+class SummaryImagesWidget(widgets.VBox):
+    """Mean, max, std and local correlation images of an ImageSeries of 2D frames, over a range of frames.
+
+    The images are computed in a single streaming pass over the frames and saved to a sidecar file, so that they are
+    shown instantly the next time.
+    """
+
+    def __init__(self, image_series: ImageSeries, neurodata_vis_spec: dict = None, cache_path: str = "nwb-cache"):
+        """
+
+        Parameters
+        ----------
+        image_series: ImageSeries
+        neurodata_vis_spec: dict, optional
+        cache_path: str, optional
+            Directory where the summary images are saved. Set to None to not save them.
+        """
+        super().__init__()
+        self.image_series = image_series
+        self.cache_path = cache_path
+        self.reader = FrameReader.from_image_series(image_series)
+        self.images = None
+        self.frame_range = None
+        n_frames = len(self.reader)
+
+        self.controls = dict(
+            frames=widgets.IntRangeSlider(
+                value=(0, n_frames), min=0, max=n_frames, description="frames:", continuous_update=False
+            ),
+            image=widgets.Dropdown(options=SUMMARY_IMAGES, description="image:", layout=Layout(width="200px")),
+        )
+        self.button = widgets.Button(description="Compute")
+        self.progress_bar = ProgressBar()
+        self.status = widgets.Label()
+        self.image_view = ImageFrameWidget()
+        self.button.on_click(lambda button: self.compute())
+        self.controls["image"].observe(lambda change: self.show_image(), names="value")
+        self.children = [
+            HBox([self.controls["frames"], self.controls["image"], self.button, self.progress_bar.container]),
+            self.status,
+            self.image_view,
+        ]
+
+        path = get_summary_images_path(image_series, 0, n_frames, cache_path)
+        if path is not None and path.exists():
+            self.compute()
+
+    def compute(self):
+        """Compute the summary images of the selected range of frames, or load them if they were saved"""
+        start, stop = self.controls["frames"].value
+        if stop <= start:
+            self.status.value = "Select a range of at least one frame."
+            return
+        self.status.value = ""
+        self.progress_bar.reset(total=stop - start)
+        self.progress_bar.set_description("Computing summary images")
+        try:
+            self.images = load_or_compute_summary_images(
+                self.image_series,
+                start,
+                stop,
+                reader=self.reader,
+                cache_path=self.cache_path,
+                on_progress=self.progress_bar.update,
+            )
+        except ValueError as error:
+            # e.g. frames that are not 2D, otherwise only logged by the button callback
+            self.status.value = f"Could not compute the summary images: {error}"
+            return
+        self.frame_range = (start, stop)
+        self.show_image()
+
+    def show_image(self):
+        if self.images is None:
+            return
+        kind = self.controls["image"].value
+        image = self.images[kind]
+        # frames of external files are shown as they are
+        if not uses_external_file(self.image_series):
+            image = image.T
+        self.image_view.show_frame(image, title=f"{kind} of frames {self.frame_range[0]} to {self.frame_range[1]}")
+
+    def close(self):
+        """Close the frame reader, e.g. the file of an external ImageSeries, with the widget"""
+        if getattr(self, "reader", None) is not None:
+            self.reader.close()
+            self.reader = None
+        super().close()
 
 
 def show_image_series(image_series: ImageSeries, neurodata_vis_spec: dict):
@@ -132,7 +331,7 @@ def show_grayscale_image_series(image_series: ImageSeries, neurodata_vis_spec: d
 
 
 def show_index_series(index_series, neurodata_vis_spec: dict):
-    show_timeseries = neurodata_vis_spec[TimeSeries]
+    show_timeseries = load_vis(neurodata_vis_spec[TimeSeries])
     series_widget = show_timeseries(index_series)
 
     indexed_timeseries = index_series.indexed_timeseries
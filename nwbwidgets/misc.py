@@ -2,15 +2,16 @@ from functools import partial
 
 import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 import scipy
 from ipywidgets import FloatProgress, Layout, fixed, widgets
 from matplotlib.collections import PatchCollection
+from matplotlib.lines import Line2D
 from matplotlib.patches import Rectangle
 from pynwb.epoch import TimeIntervals
 from pynwb.misc import AnnotationSeries, DecompositionSeries, Units
 
-from .analysis.spikes import compute_smoothed_firing_rate
 from .controllers import (
     GroupAndSortController,
     ProgressBar,
@@ -18,19 +19,34 @@ from .controllers import (
     make_trial_event_controller,
 )
 from .utils.dynamictable import extract_data_from_intervals, infer_categorical_columns
-from .utils.mpl import create_big_ax
-from .utils.plotly import event_group
+from .utils.mpl import create_big_ax, rasterize_events
+from .utils.plotly import event_group_trace, event_raster_traces, set_traces
 from .utils.units import (
     align_by_time_intervals,
+    align_units_by_time_intervals,
+    bin_aligned_spikes,
+    bin_events,
     get_max_spike_time,
     get_min_spike_time,
-    get_spike_times,
+    get_spike_train_index,
+    get_trial_spike_counts,
     get_unobserved_intervals,
 )
 from .utils.widgets import clean_axes, interactive_output
 
 color_wheel = plt.rcParams["axes.prop_cycle"].by_key()["color"]
 
+# number of events above which rasters are rendered as an image in render_mode="auto"
+RASTER_THRESHOLD = 100_000
+
+
+def use_raster_rendering(data, render_mode="auto"):
+    if render_mode not in ("auto", "markers", "raster"):
+        raise ValueError("render_mode must be 'auto', 'markers' or 'raster', got {}".format(render_mode))
+    if render_mode == "auto":
+        return sum(len(x) for x in data) > RASTER_THRESHOLD
+    return render_mode == "raster"
+
 
 def show_annotations(annotations: AnnotationSeries, **kwargs):
     fig, ax = plt.subplots()
@@ -49,6 +65,7 @@ def show_session_raster(
     labels=None,
     show_legend=True,
     progress_bar=None,
+    render_mode="auto",
 ):
     """
 
@@ -65,6 +82,8 @@ def show_session_raster(
         default = True
         Does not show legend if color_by is None or 'id'.
     progress_bar: FloatProgress, optional
+    render_mode: {'auto', 'markers', 'raster'}, optional
+        see plot_grouped_events
 
     Returns
     -------
@@ -72,8 +91,9 @@ def show_session_raster(
 
     """
 
+    spike_train_index = get_spike_train_index(units)
     if time_window is None:
-        time_window = [get_min_spike_time(units), get_max_spike_time(units)]
+        time_window = [spike_train_index.get_min_spike_time(), spike_train_index.get_max_spike_time()]
 
     if units_window is None:
         units_window = [0, len(units)]
@@ -81,14 +101,7 @@ def show_session_raster(
     if order is None:
         order = np.arange(len(units), dtype="int")
 
-    if progress_bar:
-        this_iter = ProgressBar(order, desc="reading spike data", leave=False)
-        progress_bar = this_iter.container
-    else:
-        this_iter = order
-    data = []
-    for unit in this_iter:
-        data.append(get_spike_times(units, unit, time_window))
+    data = spike_train_index.get_spike_times(order, time_window)
 
     if show_obs_intervals:
         unobserved_intervals_list = get_unobserved_intervals(units, time_window, order)
@@ -104,10 +117,11 @@ def show_session_raster(
         offset=units_window[0],
         unobserved_intervals_list=unobserved_intervals_list,
         progress_bar=progress_bar,
+        render_mode=render_mode,
     )
     ax.set_ylabel("unit #")
     if len(data) <= 30:
-        unit_id_display = np.array(units.id.data[:])[[x for x in this_iter]]
+        unit_id_display = np.array(units.id.data[:])[order]
         ax.set_yticklabels(unit_id_display)
     else:
         ax.axes.yaxis.set_visible(False)
@@ -326,7 +340,7 @@ class PSTHWidget(widgets.VBox):
             # progress_bar=fixed(progress_bar)
         )
 
-        out_fig = interactive_output(self.update, self.controls)
+        out_fig = interactive_output(self.update, self.controls, fetch=self.fetch)
 
         self.children = [
             widgets.HBox(
@@ -361,6 +375,57 @@ class PSTHWidget(widgets.VBox):
     def make_group_and_sort(self, window=None, control_order=False):
         return GroupAndSortController(self.trials, window=window, control_order=control_order)
 
+    def fetch(
+        self,
+        index: int,
+        start_labels: tuple = ("start_time",),
+        start: float = 0.0,
+        end: float = 1.0,
+        order=None,
+        sigma_in_secs=0.05,
+        plot_type="histogram",
+        progress_bar=None,
+        **kwargs,
+    ):
+        """Align the spikes plotted by `update`. Does not touch matplotlib, so it can run in a worker thread.
+
+        Returns
+        -------
+        dict
+            {'aligned': [(data, expanded_data), ...]}, one pair per start label. `expanded_data` is only computed
+            for the gaussian plot type.
+
+        """
+        aligned = []
+        for start_label in start_labels:
+            data = align_by_time_intervals(
+                self.units,
+                index,
+                self.trials,
+                start_label,
+                start_label,
+                start,
+                end,
+                order,
+                progress_bar=progress_bar,
+            )
+            expanded_data = None
+            if plot_type == "gaussian":
+                # expanded data so that gaussian smoother uses larger window than is viewed
+                expanded_data = align_by_time_intervals(
+                    units=self.units,
+                    index=index,
+                    intervals=self.trials,
+                    start_label=start_label,
+                    stop_label=start_label,
+                    start=start - sigma_in_secs * 4,
+                    end=end + sigma_in_secs * 4,
+                    rows_select=order,
+                    progress_bar=progress_bar,
+                )
+            aligned.append((data, expanded_data))
+        return dict(aligned=aligned)
+
     def update(
         self,
         index: int,
@@ -377,6 +442,7 @@ class PSTHWidget(widgets.VBox):
         nbins=30,
         plot_type="histogram",
         align_line_color=(0.7, 0.7, 0.7),
+        aligned=None,
     ):
         """
 
@@ -399,12 +465,26 @@ class PSTHWidget(widgets.VBox):
             Number of time points to use for smooth curve
         progress_bar:
         figsize: tuple, optional
+        aligned: list, optional
+            Output of `fetch`. Computed here if not provided.
 
         Returns
         -------
         matplotlib.Figure
 
         """
+        if aligned is None:
+            aligned = self.fetch(
+                index,
+                start_labels,
+                start,
+                end,
+                order,
+                sigma_in_secs=sigma_in_secs,
+                plot_type=plot_type,
+                progress_bar=progress_bar,
+            )["aligned"]
+
         fig, axs = plt.subplots(2, len(start_labels), figsize=figsize, sharex=True)
         clean_axes(axs.ravel())
 
@@ -417,17 +497,7 @@ class PSTHWidget(widgets.VBox):
                 ax0 = axs[0]
                 ax1 = axs[1]
 
-            data = align_by_time_intervals(
-                self.units,
-                index,
-                self.trials,
-                start_label,
-                start_label,
-                start,
-                end,
-                order,
-                progress_bar=progress_bar,
-            )
+            data, expanded_data = aligned[i_s]
 
             if i_s == len(start_labels) - 1:
                 show_legend = True
@@ -460,18 +530,6 @@ class PSTHWidget(widgets.VBox):
                 self.bins_ft.layout.height = "0px"
                 self.gaussian_sd_ft.layout.visibility = None
                 self.gaussian_sd_ft.layout.height = None
-                # expanded data so that gaussian smoother uses larger window than is viewed
-                expanded_data = align_by_time_intervals(
-                    units=self.units,
-                    index=index,
-                    intervals=self.trials,
-                    start_label=start_label,
-                    stop_label=start_label,
-                    start=start - sigma_in_secs * 4,
-                    end=end + sigma_in_secs * 4,
-                    rows_select=order,
-                    progress_bar=progress_bar,
-                )
                 show_psth_smoothed(
                     data=expanded_data,
                     ax=ax1,
@@ -513,32 +571,37 @@ class PSTHWidget(widgets.VBox):
         return fig
 
 
+def _flatten_trials(data):
+    """Concatenate a list of per-trial spike times into (times, trial_idx)"""
+    lengths = np.array([len(x) for x in data], dtype=int)
+    if not lengths.sum():
+        return np.zeros(0), np.zeros(0, dtype=int)
+    return np.concatenate(data), np.repeat(np.arange(len(data)), lengths)
+
+
 def show_histogram(data, ax: plt.Axes, start: float, end: float, group_inds=None, nbins: int = 30):
     if not len(data):
         return
 
+    times, trial_idx = _flatten_trials(data)
     if group_inds is None:
-        height, x = np.histogram(np.hstack(data), bins=nbins, range=(start, end))
-        width = np.diff(x[:2])
-        height = height / len(data) / width
-        ax.bar(x[:-1], height, edgecolor=(0.3, 0.3, 0.3), width=width, align="edge")
+        group_inds = np.zeros(len(data), dtype=int)
+        colors = [None]
     else:
-        data = np.asarray(data, dtype="object")
-        # group_inds = np.asarray(group_inds)
-        for group in np.unique(group_inds):
-            this_data = np.hstack(data[group_inds == group])
-            height, x = np.histogram(this_data, bins=nbins, range=(start, end))
-            width = np.diff(x[:2])
-            height = height / np.sum(group_inds == group) / width
-            ax.bar(
-                x[:-1],
-                height,
-                color=color_wheel[group % len(color_wheel)],
-                edgecolor=(0.3, 0.3, 0.3),
-                width=width,
-                align="edge",
-                alpha=0.6,
-            )
+        colors = color_wheel
+    group_inds = np.asarray(group_inds)
+    ugroups, group_pos = np.unique(group_inds, return_inverse=True)
+
+    counts = bin_aligned_spikes(times, group_pos[trial_idx], len(ugroups), start, end, nbins)
+    x = np.linspace(start, end, nbins + 1)
+    width = np.diff(x[:2])
+    heights = counts / np.bincount(group_pos, minlength=len(ugroups))[:, np.newaxis] / width
+
+    for group, height in zip(ugroups, heights):
+        kwargs = dict(edgecolor=(0.3, 0.3, 0.3), width=width, align="edge")
+        if colors[0] is not None:
+            kwargs.update(color=colors[group % len(colors)], alpha=0.6)
+        ax.bar(x[:-1], height, **kwargs)
 
 
 def show_psth_smoothed(
@@ -552,14 +615,19 @@ def show_psth_smoothed(
 ):
     if not len(data):  # TODO: when does this occur?
         return
-    all_data = np.hstack(data)
-    if not len(all_data):  # no spikes
+    times, trial_idx = _flatten_trials(data)
+    if not len(times):  # no spikes
         return
     tt = np.linspace(start, end, ntt)
-    smoothed = np.array([compute_smoothed_firing_rate(x, tt, sigma_in_secs) for x in data])
+    dt = tt[1] - tt[0]
+    binned_spikes = np.bincount(
+        trial_idx * ntt + np.minimum(np.searchsorted(tt, times), ntt - 1), minlength=len(data) * ntt
+    ).reshape(len(data), ntt)
+    smoothed = scipy.ndimage.gaussian_filter1d(binned_spikes.astype(float), sigma_in_secs / dt, axis=1) / dt
 
     if group_inds is None:
         group_inds = np.zeros((len(smoothed)), dtype=int)
+    group_inds = np.asarray(group_inds)
     group_stats = []
     for group in np.unique(group_inds):
         this_mean = np.mean(smoothed[group_inds == group], axis=0)
@@ -591,6 +659,8 @@ def plot_grouped_events(
     progress_bar=None,
     figsize=(8, 6),
     fontsize=12,
+    render_mode="auto",
+    n_bins=1000,
 ):
     """
 
@@ -598,7 +668,7 @@ def plot_grouped_events(
     ----------
     data: array-like
     window: array-like [float, float]
-        Time in seconds
+        Time in seconds. Defaults to the range of the events.
     group_inds: array-like dtype=int, optional
     colors: array-like, optional
     ax: plt.Axes, optional
@@ -609,6 +679,10 @@ def plot_grouped_events(
     progress_bar: FloatProgress, optional
     figsize: tuple, optional
     fontsize: int, optional
+    render_mode: {'auto', 'markers', 'raster'}, optional
+        'raster' bins the events into an image with `n_bins` columns instead of drawing every event. 'auto' does so
+        when there are more than RASTER_THRESHOLD events.
+    n_bins: int, optional
 
     Returns
     -------
@@ -623,7 +697,31 @@ def plot_grouped_events(
             fig.canvas.header_visible = False
         else:
             legend_kwargs.update(bbox_to_anchor=(1.01, 1))
-    if group_inds is not None:
+    if use_raster_rendering(data, render_mode):
+        if window is None:
+            all_times = np.concatenate(list(data))
+            window = [np.min(all_times), np.max(all_times)]
+        if group_inds is None:
+            row_colors = ["k"] * len(data)
+        else:
+            row_colors = [colors[group % len(colors)] for group in group_inds]
+        ax.imshow(
+            rasterize_events(list(data), window, row_colors, n_bins=n_bins),
+            extent=[window[0], window[1], offset - 0.5, offset + len(data) - 0.5],
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+        )
+        if group_inds is not None and show_legend:
+            ugroup_inds = np.unique(group_inds)
+            ax.legend(
+                handles=[Line2D([], [], color=colors[ui % len(colors)]) for ui in ugroup_inds][::-1],
+                labels=list(labels[ugroup_inds][::-1]),
+                loc="upper left",
+                bbox_to_anchor=(1.01, 1),
+                **legend_kwargs,
+            )
+    elif group_inds is not None:
         ugroup_inds = np.unique(group_inds)
         handles = []
 
@@ -802,6 +900,12 @@ def raster_grid(
     fig, axs = plt.subplots(nrows, ncols, sharex=True, sharey=True, squeeze=False, figsize=(10, 10))
     big_ax = create_big_ax(fig)
 
+    # align all the trials at once and split them between the subplots afterwards
+    offsets, relative_times, _, _ = align_units_by_time_intervals(
+        units, [index], time_intervals, align_by, align_by, start, end
+    )
+    all_data = np.split(relative_times, offsets[1:-1])
+
     for i, row in enumerate(urow_vals):
         for j, col in enumerate(ucol_vals):
             ax = axs[i, j]
@@ -812,16 +916,7 @@ def raster_grid(
                 ax_trials_select &= col_vals == col
             ax_trials_select = np.where(ax_trials_select)[0]
             if len(ax_trials_select):
-                data = align_by_time_intervals(
-                    units,
-                    index,
-                    time_intervals,
-                    align_by,
-                    align_by,
-                    start,
-                    end,
-                    ax_trials_select,
-                )
+                data = [all_data[i_trial] for i_trial in ax_trials_select]
                 show_psth_raster(data, start, end, ax=ax)
                 ax.set_xlabel("")
                 ax.set_ylabel("")
@@ -846,32 +941,52 @@ def plot_grouped_events_plotly(
     unobserved_intervals_list=None,
     progress_bar=None,
     fig=None,
+    render_mode="auto",
+    n_bins=1000,
     **kwargs,
 ):
     data = np.array(data, dtype=object)
 
     if fig is None:
         fig = go.FigureWidget()
-    if group_inds is not None:
+    if use_raster_rendering(data, render_mode):
+        if window is None:
+            all_times = np.concatenate(list(data))
+            window = [np.min(all_times), np.max(all_times)]
+        if group_inds is not None:
+            ugroup_inds = np.unique(group_inds)
+            # rows are stacked group by group, like for markers
+            row_order = np.concatenate([np.where(group_inds == ui)[0] for ui in ugroup_inds])
+            row_groups = np.searchsorted(ugroup_inds, np.asarray(group_inds)[row_order])
+            traces = event_raster_traces(
+                bin_events(list(data[row_order]), window, n_bins),
+                window,
+                row_groups=row_groups,
+                colors=[colors[ui % len(colors)] for ui in ugroup_inds],
+                labels=[labels[ui] for ui in ugroup_inds],
+            )
+        else:
+            traces = event_raster_traces(bin_events(list(data), window, n_bins), window)
+    elif group_inds is not None:
         ugroup_inds = np.unique(group_inds)
+        traces = []
         offset = 0
-        for i in np.arange(len(ugroup_inds)):
-            ui = ugroup_inds[i]
-            color = colors[ugroup_inds[i] % len(colors)]
+        for ui in ugroup_inds:
             this_data = data[group_inds == ui]
-            event_group(
-                this_data,
-                offset=offset,
-                label=labels[ui],
-                color=color,
-                fig=fig,
-                **kwargs,
+            traces.append(
+                event_group_trace(
+                    this_data,
+                    offset=offset,
+                    label=labels[ui],
+                    color=colors[ui % len(colors)],
+                    **kwargs,
+                )
             )
             offset += len(this_data)
-
     else:
-        event_group(data, fig=fig, **kwargs)
+        traces = [event_group_trace(data, **kwargs)]
 
+    set_traces(fig, traces)
     fig.update_layout(xaxis_title="time (s)")
 
     return fig
@@ -885,10 +1000,12 @@ class RasterWidgetPlotly(widgets.HBox):
         foreign_group_and_sort_controller: GroupAndSortController = None,
         group_by=None,
         fig: go.FigureWidget = None,
+        render_mode="auto",
     ):
         super().__init__()
 
         self.units = units
+        self.render_mode = render_mode
 
         if foreign_time_window_controller is None:
             self.tmin = get_min_spike_time(units)
@@ -909,7 +1026,9 @@ class RasterWidgetPlotly(widgets.HBox):
             self.fig.update_layout(margin=dict(l=20, r=20, t=30, b=20))
         else:
             self.fig = fig
-        show_session_raster_plotly(self.units, self.fig, self.time_window_controller.value, **self.gas.value)
+        show_session_raster_plotly(
+            self.units, self.fig, self.time_window_controller.value, render_mode=self.render_mode, **self.gas.value
+        )
 
         # set children
         if foreign_time_window_controller:
@@ -944,11 +1063,12 @@ class RasterWidgetPlotly(widgets.HBox):
         time_window = self.time_window_controller.value
         gas_kwargs = self.gas.value
         with self.fig.batch_update():
-            self.fig.data = None
-            show_session_raster_plotly(self.units, self.fig, time_window, **gas_kwargs)
+            show_session_raster_plotly(self.units, self.fig, time_window, render_mode=self.render_mode, **gas_kwargs)
 
 
-def show_session_raster_plotly(units: Units, fig, time_window=None, order=None, progress_bar=None, **kwargs):
+def show_session_raster_plotly(
+    units: Units, fig, time_window=None, order=None, progress_bar=None, render_mode="auto", **kwargs
+):
     """
 
     Parameters
@@ -963,6 +1083,8 @@ def show_session_raster_plotly(units: Units, fig, time_window=None, order=None,
         default = True
         Does not show legend if color_by is None or 'id'.
     progress_bar: FloatProgress, optional
+    render_mode: {'auto', 'markers', 'raster'}, optional
+        see plot_grouped_events
 
     Returns
     -------
@@ -970,20 +1092,14 @@ def show_session_raster_plotly(units: Units, fig, time_window=None, order=None,
 
     """
 
+    spike_train_index = get_spike_train_index(units)
     if time_window is None:
-        time_window = [get_min_spike_time(units), get_max_spike_time(units)]
+        time_window = [spike_train_index.get_min_spike_time(), spike_train_index.get_max_spike_time()]
 
     if order is None:
         order = np.arange(len(units), dtype="int")
 
-    if progress_bar:
-        this_iter = ProgressBar(order, desc="reading spike data", leave=False)
-        progress_bar = this_iter.container
-    else:
-        this_iter = order
-    data = []
-    for unit in this_iter:
-        data.append(get_spike_times(units, unit, time_window))
+    data = spike_train_index.get_spike_times(order, time_window)
 
     # if show_obs_intervals:
     #    unobserved_intervals_list = get_unobserved_intervals(units, time_window, order)
@@ -995,7 +1111,7 @@ def show_session_raster_plotly(units: Units, fig, time_window=None, order=None,
         kwargs.update(marker="line-ns", line_width=2)
     else:
         kwargs.update(line_width=1)
-    fig = plot_grouped_events_plotly(data=data, fig=fig, **kwargs)
+    fig = plot_grouped_events_plotly(data=data, window=time_window, fig=fig, render_mode=render_mode, **kwargs)
     if len(order) <= 40:
         fig.update_yaxes(tickvals=np.arange(len(order)), ticktext=[str(i) for i in order])
 
@@ -1207,6 +1323,25 @@ def draw_tuning_curve(
     return draw_tuning_curve_2d(units, time_intervals, index, start, end, rows_label, cols_label, align_by)
 
 
+def _get_class_codes(time_intervals: TimeIntervals, label):
+    """Position of the value of each trial in the classes of `label`, -1 for missing values"""
+    _, classes = extract_data_from_intervals(time_intervals[label])
+    values = pd.Series(np.asarray(time_intervals[label][:], dtype="object"))
+    if len(classes) and isinstance(classes[0], float):
+        values = pd.to_numeric(values, errors="coerce")
+    codes = pd.Categorical(values, categories=pd.unique(pd.Series(classes, dtype=values.dtype))).codes
+    return codes, classes
+
+
+def _average_rates(counts, codes, n_classes: int, duration: float):
+    """Mean rate of the trials of each class, with np.bincount"""
+    valid = codes >= 0
+    n_spikes = np.bincount(codes[valid], weights=counts[valid], minlength=n_classes)
+    n_trials = np.bincount(codes[valid], minlength=n_classes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n_trials > 0, n_spikes / (n_trials * duration), 0)
+
+
 def draw_tuning_curve_1d(
     units: Units,
     time_intervals: TimeIntervals,
@@ -1216,25 +1351,9 @@ def draw_tuning_curve_1d(
     rows_label=None,
     align_by="start_time",
 ) -> plt.Figure:
-    rows_data, var1_classes = extract_data_from_intervals(time_intervals[rows_label])
-
-    avg_rates = []
-    for v1 in var1_classes:
-        indexes = [i for i, d in enumerate(rows_data) if d == v1]
-        data = align_by_time_intervals(
-            units=units,
-            index=index,
-            intervals=time_intervals,
-            start_label=align_by,
-            stop_label=align_by,
-            start=start,
-            end=end,
-            rows_select=indexes,
-        )
-        n_trials = len(data)
-        n_spikes = len(np.hstack(data))
-        duration = end - start
-        avg_rates.append(n_spikes / (n_trials * duration))
+    counts = get_trial_spike_counts(units, time_intervals, align_by, start, end)[:, index]
+    codes, var1_classes = _get_class_codes(time_intervals, rows_label)
+    avg_rates = _average_rates(counts, codes, len(var1_classes), end - start)
 
     x = np.arange(len(var1_classes))  # the label locations
     si = sort_mixed_type_list(var1_classes)
@@ -1252,6 +1371,8 @@ def draw_tuning_curve_1d(
     ax.set_xticklabels([var1_classes[i] for i in si], rotation=45)
     fig.tight_layout()
 
+    return fig
+
 
 def draw_tuning_curve_2d(
     units: Units,
@@ -1263,30 +1384,13 @@ def draw_tuning_curve_2d(
     cols_label=None,
     align_by="start_time",
 ) -> plt.Figure:
-    rows_data, var1_classes = extract_data_from_intervals(time_intervals[rows_label])
-    cols_data, var2_classes = extract_data_from_intervals(time_intervals[cols_label])
-
-    avg_rates = np.zeros((len(var1_classes), len(var2_classes)))
-    for i, v1 in enumerate(var1_classes):
-        for j, v2 in enumerate(var2_classes):
-            indexes1 = [ii for ii, d in enumerate(rows_data) if d == v1]
-            indexes2 = [ii for ii, d in enumerate(cols_data) if d == v2]
-            intersect = list(set(indexes1) & set(indexes2))
-            if len(intersect) > 0:
-                data = align_by_time_intervals(
-                    units=units,
-                    index=index,
-                    intervals=time_intervals,
-                    start_label=align_by,
-                    stop_label=align_by,
-                    start=start,
-                    end=end,
-                    rows_select=intersect,
-                )
-                n_trials = len(data)
-                n_spikes = len(np.hstack(data))
-                duration = end - start
-                avg_rates[i, j] = n_spikes / (n_trials * duration)
+    counts = get_trial_spike_counts(units, time_intervals, align_by, start, end)[:, index]
+    rows_codes, var1_classes = _get_class_codes(time_intervals, rows_label)
+    cols_codes, var2_classes = _get_class_codes(time_intervals, cols_label)
+
+    codes = np.where((rows_codes >= 0) & (cols_codes >= 0), rows_codes * len(var2_classes) + cols_codes, -1)
+    avg_rates = _average_rates(counts, codes, len(var1_classes) * len(var2_classes), end - start)
+    avg_rates = avg_rates.reshape(len(var1_classes), len(var2_classes))
 
     fig, ax = plt.subplots(figsize=(14, 7))
     pos = ax.imshow(avg_rates.T, origin="lower", cmap="Greys")
@@ -1,11 +1,13 @@
-from functools import lru_cache
+import time
 
 import ipywidgets as widgets
 import numpy as np
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from ndx_grayscalevolume import GrayscaleVolume
 from pynwb.base import NWBDataInterface
+from pynwb.image import ImageSeries
 from pynwb.ophys import (
     DfOverF,
     ImageSegmentation,
@@ -13,83 +15,107 @@ from pynwb.ophys import (
     RoiResponseSeries,
     TwoPhotonSeries,
 )
-from skimage import measure
-from tifffile import TiffFile, imread
 
 from .base import df_to_hover_text
 from .controllers import ProgressBar
+from .image import ImageFrameWidget
 from .timeseries import BaseGroupedTraceWidget
 from .utils.cmaps import linear_transfer_function
 from .utils.dynamictable import infer_categorical_columns
+from .utils.frames import FrameReader, uses_external_file
+from .utils.plotly import categorical_colorscale, set_traces
+from .utils.rois import SparseRoiMasks, load_or_compute_outlines
+from .utils.summary import load_or_compute_summary_images
 
 color_wheel = px.colors.qualitative.Dark24
 
 
 class TwoPhotonSeriesWidget(widgets.VBox):
-    """Widget showing Image stack recorded over time from 2-photon microscope."""
+    """Widget showing Image stack recorded over time from 2-photon microscope.
 
-    def __init__(self, indexed_timeseries: TwoPhotonSeries, neurodata_vis_spec: dict):
+    2D frames are read through a FrameReader, which caches them and reads the next ones ahead, and are sent to the
+    browser as PNG images. They can be played at a target frame rate; the frame rate actually reached is shown next to
+    it.
+    """
+
+    def __init__(self, indexed_timeseries: TwoPhotonSeries, neurodata_vis_spec: dict = None, fps: float = 10.0):
         super().__init__()
+        self.figure = None
+        self.reader = None
+        self.fps_label = widgets.Label()
+        self._last_frame_time = None
+        self._fps = None
+
+        external = uses_external_file(indexed_timeseries)
+        if external or len(indexed_timeseries.data.shape) == 3:
+            self.reader = FrameReader.from_image_series(indexed_timeseries)
+            self.image_view = ImageFrameWidget()
+            self.figure = self.image_view.out_fig
+            n_samples = len(self.reader)
+            # frames of external TIFF files are shown as they are
+            transpose = not external
+
+            def update_figure(index=0):
+                frame = self.reader.get_frame(index)
+                self.image_view.show_frame(frame.T if transpose else frame, title=f"Frame no: {index}")
+                self.reader.prefetch(index)
+                self.update_fps()
+
+        elif len(indexed_timeseries.data.shape) == 4:
+            import ipyvolume.pylab as p3
+
+            output = widgets.Output()
+            n_samples = indexed_timeseries.data.shape[0]
+
+            def update_figure(index=0):
+                p3.figure()
+                p3.volshow(
+                    indexed_timeseries.data[index].transpose([1, 0, 2]),
+                    tf=linear_transfer_function([0, 0, 0], max_opacity=0.3),
+                )
+                output.clear_output(wait=True)
+                self.figure = output
+                with output:
+                    p3.show()
 
-        def _add_fig_trace(img_fig: go.Figure, index):
-            if self.figure is None:
-                self.figure = go.FigureWidget(img_fig)
-            else:
-                self.figure.for_each_trace(lambda trace: trace.update(img_fig.data[0]))
-            self.figure.layout.title = f"Frame no: {index}"
-
-        if indexed_timeseries.data is None:
-            if indexed_timeseries.external_file is not None:
-                path_ext_file = indexed_timeseries.external_file[0]
-                # Get Frames dimensions
-                tif = TiffFile(path_ext_file)
-                n_samples = len(tif.pages)
-                page = tif.pages[0]
-
-                def update_figure(index=0):
-                    # Read first frame
-                    img_fig = px.imshow(imread(path_ext_file, key=int(index)), binary_string=True)
-                    _add_fig_trace(img_fig, index)
-
-                slider = widgets.IntSlider(value=0, min=0, max=n_samples - 1, orientation="horizontal")
         else:
-            if len(indexed_timeseries.data.shape) == 3:
-
-                def update_figure(index=0):
-                    img_fig = px.imshow(indexed_timeseries.data[index].T, binary_string=True)
-                    _add_fig_trace(img_fig, index)
-
-            elif len(indexed_timeseries.data.shape) == 4:
-                import ipyvolume.pylab as p3
-
-                output = widgets.Output()
-
-                def update_figure(index=0):
-                    p3.figure()
-                    p3.volshow(
-                        indexed_timeseries.data[index].transpose([1, 0, 2]),
-                        tf=linear_transfer_function([0, 0, 0], max_opacity=0.3),
-                    )
-                    output.clear_output(wait=True)
-                    self.figure = output
-                    with output:
-                        p3.show()
-
-            else:
-                raise NotImplementedError
-
-            slider = widgets.IntSlider(
-                value=0,
-                min=0,
-                max=indexed_timeseries.data.shape[0] - 1,
-                orientation="horizontal",
-            )
+            raise NotImplementedError
 
+        slider = widgets.IntSlider(value=0, min=0, max=n_samples - 1, orientation="horizontal")
         slider.observe(lambda change: update_figure(change.new), names="value")
-        self.figure = None
         self.controls = dict(slider=slider)
         update_figure()
-        self.children = [self.figure, slider]
+
+        if self.reader is None:
+            self.children = [self.figure, slider]
+            return
+
+        play = widgets.Play(value=0, min=0, max=n_samples - 1, interval=int(1000 / fps))
+        widgets.jslink((play, "value"), (slider, "value"))
+        fps_input = widgets.BoundedFloatText(
+            value=fps, min=0.1, max=100.0, description="target fps:", layout=widgets.Layout(width="160px")
+        )
+        fps_input.observe(lambda change: setattr(play, "interval", int(1000 / change.new)), names="value")
+        self.controls.update(play=play, fps=fps_input)
+        self.children = [self.figure, widgets.HBox([play, slider, fps_input, self.fps_label])]
+
+    def update_fps(self):
+        """Measure the frame rate reached while playing, as a moving average over the last frames"""
+        now = time.perf_counter()
+        if "play" in self.controls and self.controls["play"].playing and self._last_frame_time is not None:
+            fps = 1 / max(now - self._last_frame_time, 1e-6)
+            self._fps = fps if self._fps is None else 0.8 * self._fps + 0.2 * fps
+            self.fps_label.value = f"{self._fps:.1f} fps"
+        else:
+            self._fps = None
+        self._last_frame_time = now
+
+    def close(self):
+        """Close the frame reader, e.g. the file of an external TwoPhotonSeries, with the widget"""
+        if getattr(self, "reader", None) is not None:
+            self.reader.close()
+            self.reader = None
+        super().close()
 
 
 def show_df_over_f(df_over_f: DfOverF, neurodata_vis_spec: dict):
@@ -147,11 +173,50 @@ def show_plane_segmentation_3d_mask(plane_seg: PlaneSegmentation):
 
 
 class PlaneSegmentation2DWidget(widgets.VBox):
-    def __init__(self, plane_seg: PlaneSegmentation, color_wheel=color_wheel, **kwargs):
+    MAX_OUTLINE_ROIS = 1000
+
+    def __init__(
+        self,
+        plane_seg: PlaneSegmentation,
+        color_wheel=color_wheel,
+        cache_path: str = "nwb-cache",
+        style: str = None,
+        **kwargs,
+    ):
+        """
+
+        Parameters
+        ----------
+        plane_seg: PlaneSegmentation
+        color_wheel: list, optional
+        cache_path: str, optional
+            Directory where the outlines of the ROIs are saved, so that the plane reopens instantly. Set to None to not
+            save them.
+        style: {'outlines', 'labels'}, optional
+            'outlines' draws the outline of each ROI. 'labels' renders all the ROIs as a single label image, built from
+            sparse masks, so that memory and render time scale with the number of ROI pixels. Defaults to 'outlines'
+            for up to `MAX_OUTLINE_ROIS` ROIs with image masks, and to 'labels' otherwise.
+        kwargs:
+            passed to show_plane_segmentation_2d
+        """
         super().__init__()
         self.categorical_columns = infer_categorical_columns(plane_seg)
         self.plane_seg = plane_seg
         self.color_wheel = color_wheel
+        self.cache_path = cache_path
+        if style is None:
+            use_outlines = "image_mask" in plane_seg and len(plane_seg) <= self.MAX_OUTLINE_ROIS
+            style = "outlines" if use_outlines else "labels"
+        if style not in ("outlines", "labels"):
+            raise ValueError(f"style should be 'outlines' or 'labels', got {style!r}")
+        self.style = style
+        self.outlines = dict()  # threshold -> RoiOutlines
+        self.masks = None
+        self.label_images = dict()  # threshold -> label image
+        self.ref_images = dict()  # name -> summary image
+        self.hover_text = None
+        self.roi_info = widgets.HTML()
+        self.hover_trace = None
         self.progress_bar = ProgressBar()
         self.button = widgets.Button(description="Display ROIs")
         self.children = [widgets.HBox([self.button, self.progress_bar.container])]
@@ -177,23 +242,15 @@ class PlaneSegmentation2DWidget(widgets.VBox):
             self.children += (self.cat_controller, self.fig)
         else:
             self.children += (self.show_plane_segmentation_2d(color_by=None, **self.kwargs),)
+        if self.style == "labels":
+            self.children += (self.roi_info,)
         self.children = self.children[1:]
 
     def update_fig(self, color_by):
-        cats = np.unique(self.plane_seg[color_by][:])
-        legendgroups = []
-        with self.fig.batch_update():
-            for color_val, data in zip(self.plane_seg[color_by][:], self.fig.data):
-                color = self.color_wheel[np.where(cats == color_val)[0][0]]  # store the color
-                data.line.color = color  # set the color
-                data.legendgroup = str(color_val)  # set the legend group to the color
-                data.name = str(color_val)
-            for color_val, data in zip(self.plane_seg[color_by][:], self.fig.data):
-                if color_val not in legendgroups:
-                    data.showlegend = True
-                    legendgroups.append(color_val)
-                else:
-                    data.showlegend = False
+        traces = self.roi_traces(color_by=color_by, threshold=self.kwargs.get("threshold", 0.01))
+        set_traces(self.fig, self.image_traces(self.get_ref_image(self.kwargs.get("ref_image"))) + traces)
+        self.observe_hover(self.fig)
+        self.fig.layout.title = color_by
 
     def show_plane_segmentation_2d(
         self,
@@ -216,7 +273,8 @@ class PlaneSegmentation2DWidget(widgets.VBox):
         width: int, optional
             width of image in pixels. Height is automatically determined
             to be proportional
-        ref_image: image, optional
+        ref_image: image or {'mean', 'max', 'std', 'correlation'}, optional
+            Image shown under the ROIs, or the name of a summary image of the first reference image series of the plane
 
 
         Returns
@@ -227,69 +285,27 @@ class PlaneSegmentation2DWidget(widgets.VBox):
         if color_by:
             if color_by not in self.plane_seg:
                 raise ValueError("specified color_by parameter, {}, not in plane_seg object".format(color_by))
-            cats = np.unique(self.plane_seg[color_by][:])
             layout_kwargs.update(title=color_by)
 
-        data = self.plane_seg["image_mask"].data
-        n_units = len(data)
         if fig is None:
             fig = go.FigureWidget()
 
-        if ref_image is not None:
-            fig.add_trace(go.Heatmap(z=ref_image, hoverinfo="skip", showscale=False, colorscale="gray"))
-
-        aux_leg = []
-        import pandas as pd
-
-        plane_seg_hover_dict = {
-            key: self.plane_seg[key].data for key in self.plane_seg.colnames if key not in ["pixel_mask", "image_mask"]
-        }
-        plane_seg_hover_dict.update(id=self.plane_seg.id.data)
-        plane_seg_hover_df = pd.DataFrame(plane_seg_hover_dict)
-        all_hover = df_to_hover_text(plane_seg_hover_df)
-        self.progress_bar.reset(total=n_units)
-        self.progress_bar.set_description("Loading Image Masks")
-        for i in range(n_units):
-            kwargs = dict(showlegend=False)
-            if color_by is not None:
-                if plane_seg_hover_df[color_by][i] not in aux_leg:
-                    kwargs.update(showlegend=True)
-                    aux_leg.append(plane_seg_hover_df[color_by][i])
-                index = np.where(cats == plane_seg_hover_df[color_by][i])[0][0]
-                c = color_wheel[index % len(color_wheel)]
-                kwargs.update(
-                    line_color=c,
-                    name=str(plane_seg_hover_df[color_by][i]),
-                    legendgroup=str(plane_seg_hover_df[color_by][i]),
-                )
-
-            x, y = self.compute_outline(i, threshold)
-            fig.add_trace(
-                go.Scatter(
-                    x=x,
-                    y=y,
-                    fill="toself",
-                    mode="lines",
-                    text=all_hover[i],
-                    hovertext="text",
-                    line=dict(width=0.5),
-                    **kwargs,
-                )
-            )
-            self.progress_bar.update()
-        # self.progress_bar.close()
+        traces = self.roi_traces(color_by=color_by, threshold=threshold, color_wheel=color_wheel)
+        fig.add_traces(self.image_traces(self.get_ref_image(ref_image)) + traces)
+        self.observe_hover(fig)
+        fov_shape = self.get_fov_shape()
         fig.update_layout(
             width=width,
             yaxis=dict(
                 mirror=True,
                 scaleanchor="x",
                 scaleratio=1,
-                range=[0, self.plane_seg["image_mask"].shape[2]],
+                range=[0, fov_shape[1]],
                 constrain="domain",
             ),
             xaxis=dict(
                 mirror=True,
-                range=[0, self.plane_seg["image_mask"].shape[1]],
+                range=[0, fov_shape[0]],
                 constrain="domain",
             ),
             margin=dict(t=30, b=10),
@@ -297,10 +313,161 @@ class PlaneSegmentation2DWidget(widgets.VBox):
         )
         return fig
 
-    @lru_cache(1000)
-    def compute_outline(self, i, threshold):
-        x, y = zip(*measure.find_contours(self.plane_seg["image_mask"][i], threshold)[0])
-        return x, y
+    def roi_traces(self, color_by: str = None, threshold: float = 0.01, color_wheel: list = None):
+        color_wheel = color_wheel or self.color_wheel
+        if self.style == "labels":
+            return self.label_traces(color_by=color_by, threshold=threshold, color_wheel=color_wheel)
+        return self.outline_traces(color_by=color_by, threshold=threshold, color_wheel=color_wheel)
+
+    def get_fov_shape(self):
+        if "image_mask" in self.plane_seg:
+            return self.plane_seg["image_mask"].shape[1:3]
+        return self.get_masks().shape
+
+    def get_ref_image(self, ref_image=None):
+        """`ref_image`, or the summary image it names, computed from the first reference image series of the plane"""
+        if not isinstance(ref_image, str):
+            return ref_image
+        if ref_image not in self.ref_images:
+            reference_images = self.plane_seg.reference_images
+            if isinstance(reference_images, ImageSeries):
+                reference_images = [reference_images]
+            elif isinstance(reference_images, dict):
+                reference_images = list(reference_images.values())
+            if not reference_images:
+                raise ValueError(f"{self.plane_seg.name} has no reference image series to compute {ref_image!r} from")
+            image_series = reference_images[0]
+            image = load_or_compute_summary_images(image_series, cache_path=self.cache_path)[ref_image]
+            # heatmaps are indexed by row, i.e. along the second axis of the image masks
+            self.ref_images[ref_image] = image if uses_external_file(image_series) else image.T
+        return self.ref_images[ref_image]
+
+    @staticmethod
+    def image_traces(ref_image=None):
+        if ref_image is None:
+            return []
+        return [go.Heatmap(z=ref_image, hoverinfo="skip", showscale=False, colorscale="gray")]
+
+    def get_outlines(self, threshold: float):
+        """Outlines of all the ROIs, read from their sidecar file if they were already extracted"""
+        if threshold not in self.outlines:
+            self.progress_bar.reset(total=len(self.plane_seg))
+            self.progress_bar.set_description("Loading Image Masks")
+            self.outlines[threshold] = load_or_compute_outlines(
+                self.plane_seg, threshold=threshold, cache_path=self.cache_path, on_progress=self.progress_bar.update
+            )
+        return self.outlines[threshold]
+
+    def get_masks(self) -> SparseRoiMasks:
+        if self.masks is None:
+            self.masks = SparseRoiMasks.from_plane_segmentation(self.plane_seg)
+        return self.masks
+
+    def get_label_image(self, threshold: float):
+        """Index of the ROI of each pixel of the field of view, -1 for the background"""
+        if threshold not in self.label_images:
+            self.label_images[threshold] = self.get_masks().label_image(threshold)
+        return self.label_images[threshold]
+
+    def get_hover_text(self):
+        if self.hover_text is None:
+            plane_seg_hover_dict = {
+                key: self.plane_seg[key].data
+                for key in self.plane_seg.colnames
+                if key not in ["pixel_mask", "image_mask"]
+            }
+            plane_seg_hover_dict.update(id=self.plane_seg.id.data)
+            self.hover_text = np.array(df_to_hover_text(pd.DataFrame(plane_seg_hover_dict)), dtype=object)
+        return self.hover_text
+
+    def outline_traces(self, color_by: str = None, threshold: float = 0.01, color_wheel: list = color_wheel):
+        """One trace per category of `color_by`, or a single trace, holding the NaN-separated outlines of its ROIs"""
+        outlines = self.get_outlines(threshold)
+        hover_text = self.get_hover_text()
+        if color_by is None:
+            groups = [(None, np.arange(len(outlines)))]
+        else:
+            values = np.asarray(self.plane_seg[color_by][:])
+            groups = [(cat, np.flatnonzero(values == cat)) for cat in np.unique(values)]
+
+        traces = []
+        for index, (cat, roi_indices) in enumerate(groups):
+            x, y, vertex_rois = outlines.merge(roi_indices)
+            kwargs = dict(showlegend=False)
+            if cat is not None:
+                kwargs.update(
+                    showlegend=True,
+                    line_color=color_wheel[index % len(color_wheel)],
+                    name=str(cat),
+                    legendgroup=str(cat),
+                )
+            traces.append(
+                go.Scatter(
+                    x=x,
+                    y=y,
+                    fill="toself",
+                    mode="lines",
+                    text=hover_text[vertex_rois] if len(hover_text) else None,
+                    line=dict(width=0.5),
+                    **kwargs,
+                )
+            )
+        return traces
+
+    def label_traces(self, color_by: str = None, threshold: float = 0.01, color_wheel: list = color_wheel):
+        """A heatmap of the label image of the ROIs, colored by category of `color_by` or else by ROI, plus an empty
+        trace per category for the legend"""
+        labels = self.get_label_image(threshold)
+        if color_by is None:
+            codes = np.arange(len(self.plane_seg)) % len(color_wheel)
+            colors = list(color_wheel)
+            names = []
+        else:
+            cats, codes = np.unique(np.asarray(self.plane_seg[color_by][:]), return_inverse=True)
+            colors = [color_wheel[index % len(color_wheel)] for index in range(len(cats))]
+            names = [str(cat) for cat in cats]
+
+        roi_ids = np.asarray(self.plane_seg.id.data[:])
+        # x is the first axis of the masks, like for the outlines
+        background = labels.T < 0
+        heatmap = go.Heatmap(
+            z=np.where(background, np.nan, codes[labels.T]),
+            customdata=np.where(background, -1, roi_ids[labels.T]),
+            hovertemplate="id: %{customdata}<extra></extra>",
+            hoverongaps=False,
+            colorscale=categorical_colorscale(colors),
+            zmin=-0.5,
+            zmax=len(colors) - 0.5,
+            showscale=False,
+            name="rois",
+        )
+        legend = [
+            go.Scatter(x=[None], y=[None], mode="markers", marker_color=color, name=name, showlegend=True)
+            for color, name in zip(colors, names)
+        ]
+        return [heatmap] + legend
+
+    def observe_hover(self, fig):
+        """Show the details of the ROI under the mouse in `roi_info`, looked up through the label image. The callback
+        is registered once on the heatmap of the ROIs, i.e. again only if `set_traces` replaced it."""
+        if self.style != "labels" or not isinstance(fig, go.FigureWidget):
+            return
+        for trace in fig.data:
+            if trace.type == "heatmap" and trace.name == "rois" and trace is not self.hover_trace:
+                trace.on_hover(self.on_label_hover, append=True)
+                self.hover_trace = trace
+
+    def on_label_hover(self, trace, points, state):
+        if points.xs:
+            self.show_roi_info(points.xs[0], points.ys[0])
+
+    def show_roi_info(self, x, y):
+        labels = self.get_label_image(self.kwargs.get("threshold", 0.01))
+        x, y = int(round(x)), int(round(y))
+        if 0 <= x < labels.shape[0] and 0 <= y < labels.shape[1] and labels[x, y] >= 0:
+            self.roi_info.value = self.get_hover_text()[labels[x, y]]
+        else:
+            self.roi_info.value = ""
 
 
 def route_plane_segmentation(plane_seg: PlaneSegmentation, neurodata_vis_spec: dict):
@@ -308,7 +475,7 @@ def route_plane_segmentation(plane_seg: PlaneSegmentation, neurodata_vis_spec: d
         return show_plane_segmentation_3d_voxel(plane_seg)
     elif "image_mask" in plane_seg and len(plane_seg.image_mask.shape) == 4:
         raise NotImplementedError("3d image mask vis not implemented yet")
-    elif "image_mask" in plane_seg:
+    elif "image_mask" in plane_seg or "pixel_mask" in plane_seg:
         return PlaneSegmentation2DWidget(plane_seg)
 
 
@@ -1,21 +1,27 @@
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlparse
 
 import fsspec
 import h5py
 import ipywidgets as widgets
-from dandi.dandiapi import DandiAPIClient
-from fsspec.implementations.cached import CachingFileSystem
 from pynwb import NWBHDF5IO
-from tqdm.notebook import tqdm
 
-from .utils.dandi import (
-    get_dandiset_metadata,
-    get_file_url,
-    has_nwb,
-    list_dandiset_files,
+from .utils.dandi import DandisetIndex, get_file_url, list_dandiset_files
+from .utils.dependencies import safe_import
+from .utils.memmap import memmap_nwbfile
+from .utils.pool import NWBFilePool, get_default_file_pool
+from .utils.streaming import (
+    CachedRemoteFile,
+    get_default_fetcher,
+    get_range_cache,
+    register_remote_file,
+    use_metadata_snapshot,
 )
+from .utils.widgets import call_on_event_loop
 from .view import nwb2widget
 
+hdmf_zarr = safe_import("hdmf_zarr")
+
 
 class Panel(widgets.VBox):
     def __init__(
@@ -25,13 +31,20 @@ class Panel(widgets.VBox):
         enable_dandi_source: bool = True,
         enable_s3_source: bool = True,
         enable_local_source: bool = True,
+        memory_cache_size: int = 2**28,
+        disk_cache_size: int = 2**32,
+        memmap_local_files: bool = False,
+        file_pool: NWBFilePool = None,
         **kwargs,
     ):
         """
         NWB widgets Panel for visualization of NWB files.
 
         Args:
-            stream_mode : {'fsspec', 'ros3'}
+            stream_mode : {'fsspec', 'ros3', 'zarr'}
+                How remote HDF5 files are streamed, with 'zarr' streaming them like 'fsspec'. NWB-Zarr stores, i.e.
+                paths ending in ".zarr", are opened from any fsspec URL in every mode, and require hdmf-zarr. 'zarr'
+                also opens the URLs without a known extension as NWB-Zarr stores.
             cache_path : str, optional
                 The path to cached data if streaming with "fsspec". If left as None, a directory "nwb-cache" is
                 created under the current working directory. Defaults to None.
@@ -41,21 +54,41 @@ class Panel(widgets.VBox):
                 Enable S3 source option.
             enable_local_source : bool, default: True
                 Enable local source option.
+            memory_cache_size : int, default: 256 MiB
+                Byte budget of the in-memory tier of the "fsspec" cache.
+            disk_cache_size : int, default: 4 GiB
+                Byte budget of the on-disk tier of the "fsspec" cache. Least recently used blocks are deleted once
+                `cache_path` holds more. Set to 0 to only cache in memory.
+                The cache of a `cache_path` is shared by all the Panels using it, with the budgets of the first one.
+            memmap_local_files : bool, default: False
+                Read the contiguous, uncompressed datasets of local files through memory maps instead of h5py.
+            file_pool : NWBFilePool, optional
+                Pool of the opened files and of their widgets. Defaults to a pool shared by all Panels, so that
+                reloading a file, even from a new Panel, returns it and its widgets instantly. The file a Panel
+                displays is never closed by the pool.
         """
         super().__init__(children=[], **kwargs)
 
         self.stream_mode = stream_mode
+        self.memmap_local_files = memmap_local_files
 
         self.cache_path = cache_path
         if cache_path is None:
             self.cache_path = "nwb-cache"
 
-        # Create a virtual filesystem based on the http protocol and use caching to save accessed data to RAM.
+        # Create a virtual filesystem based on the http protocol, and cache the accessed blocks in RAM and on disk.
         if enable_dandi_source or enable_s3_source:
-            self.cfs = CachingFileSystem(
-                fs=fsspec.filesystem("http"),
-                cache_storage=self.cache_path,  # Local folder for the cache
+            self.fs = fsspec.filesystem("http")
+            self.range_cache = get_range_cache(
+                cache_path=self.cache_path,
+                memory_bytes=memory_cache_size,
+                disk_bytes=disk_cache_size,
             )
+            # fetches all the chunks of a window concurrently instead of one round-trip per chunk
+            self.fetcher = get_default_fetcher()
+            self.fetcher.use(self)
+        # opened files stay open, so that reloading one reuses its handle, already read metadata and widgets
+        self.file_pool = file_pool if file_pool is not None else get_default_file_pool()
 
         self.source_options_names = list()
         if enable_local_source:
@@ -66,7 +99,8 @@ class Panel(widgets.VBox):
         if enable_s3_source:
             self.source_options_names.append("S3")
 
-        self.all_dandisets_metadata = None
+        self.dandiset_index = None
+        self.dandiset_index_thread = None
 
         self.source_options_radio = widgets.RadioButtons(
             options=self.source_options_names,
@@ -113,19 +147,15 @@ class Panel(widgets.VBox):
 
     def create_components_dandi_source(self, args=None):
         """Create widgets components for DANDI option"""
-        if self.all_dandisets_metadata is None:
-            self.all_dandisets_metadata = self.get_all_dandisets_metadata()
-
-        dandiset_options = list()
-        for m in self.all_dandisets_metadata:
-            item_name = m.id.split(":")[1].split("/")[0] + " - " + m.name
-            dandiset_options.append(item_name)
+        if self.dandiset_index is None:
+            self.dandiset_index = DandisetIndex(path=Path(self.cache_path) / "dandisets.json")
 
         self.source_dandi_id = widgets.Dropdown(
-            options=dandiset_options,
+            options=self.dandiset_index.get_options(),
             description="Dandiset:",
             layout=widgets.Layout(width="400px", overflow=None),
         )
+        self.dandi_index_status = widgets.Label()
         self.source_dandi_file_dropdown = widgets.Dropdown(
             options=[],
             description="File:",
@@ -138,6 +168,7 @@ class Panel(widgets.VBox):
                 self.source_dandi_id,
                 self.source_dandi_file_dropdown,
                 self.source_dandi_file_button,
+                self.dandi_index_status,
             ],
             layout=widgets.Layout(padding="5px 0px 5px 0px"),
         )
@@ -155,6 +186,35 @@ class Panel(widgets.VBox):
         self.source_dandi_file_button.on_click(self.stream_dandiset_file)
         self.list_dandiset_files_dropdown()
 
+        # the dropdown is usable right away from the local index, and filled progressively as it is refreshed
+        if self.dandiset_index.is_stale():
+            self.dandi_index_status.value = "Updating the list of dandisets..."
+            # the background thread only updates the index, and the widgets are updated on the event loop
+            self.dandiset_index_thread = self.dandiset_index.refresh_in_background(
+                on_progress=call_on_event_loop(self.update_dandiset_options),
+                on_error=call_on_event_loop(self.on_dandiset_index_error),
+            )
+
+    def update_dandiset_options(self, dandiset_index=None):
+        """Refresh the dandiset dropdown from the index, keeping the current selection"""
+        value = self.source_dandi_id.value
+        options = self.dandiset_index.get_options()
+        self.source_dandi_id.unobserve(self.list_dandiset_files_dropdown, "value")
+        self.source_dandi_id.options = options
+        self.source_dandi_id.value = value if value in options else None
+        self.source_dandi_id.observe(self.list_dandiset_files_dropdown, "value")
+        if self.dandiset_index.is_stale():
+            self.dandi_index_status.value = f"Updating the list of dandisets... ({len(options)} with NWB files)"
+        else:
+            self.dandi_index_status.value = ""
+
+    def on_dandiset_index_error(self, error):
+        """Show why the list of dandisets could not be updated, and keep the dandisets of the local index"""
+        try:
+            self.update_dandiset_options()
+        finally:
+            self.dandi_index_status.value = f"Could not update the list of dandisets: {error!r}"
+
     def create_components_s3_source(self):
         """Create widgets components for S3 option"""
         self.source_s3_file_url = widgets.Text(
@@ -216,18 +276,22 @@ class Panel(widgets.VBox):
 
     def list_dandiset_files_dropdown(self, args=None):
         """Populate dropdown with all files and text area with summary"""
-        self.dandi_summary.value = "Loading dandiset info..."
         self.source_dandi_file_dropdown.options = []
+        if self.source_dandi_id.value is None:
+            self.dandi_summary.value = ""
+            return
+        self.dandi_summary.value = "Loading dandiset info..."
         dandiset_id = self.source_dandi_id.value.split("-")[0].strip()
         self.source_dandi_file_dropdown.options = list_dandiset_files(dandiset_id=dandiset_id)
 
-        metadata = get_dandiset_metadata(dandiset_id=dandiset_id)
-        self.dandi_summary.value = "<style>p{word-wrap: break-word}</style> <p>" + metadata.description + "</p>"
+        description = self.dandiset_index.get_description(dandiset_id)
+        self.dandi_summary.value = "<style>p{word-wrap: break-word}</style> <p>" + description + "</p>"
 
     def list_local_dir_files(self, args=None):
         """List NWB files in local dir"""
         if Path(self.local_dir_path.value).is_dir():
-            all_files = [f.name for f in Path(self.local_dir_path.value).glob("*.nwb")]
+            local_dir = Path(self.local_dir_path.value)
+            all_files = [f.name for pattern in ("*.nwb", "*.nwb.zarr") for f in local_dir.glob(pattern)]
             self.local_dir_files.options = all_files
         else:
             print("Invalid local dir path")
@@ -238,58 +302,114 @@ class Panel(widgets.VBox):
         dandiset_id = self.source_dandi_id.value.split("-")[0].strip()
         file_path = self.source_dandi_file_dropdown.value
         s3_url = get_file_url(dandiset_id=dandiset_id, file_path=file_path)
-        if self.stream_mode == "ros3":
-            io = NWBHDF5IO(s3_url, mode="r", load_namespaces=True, driver="ros3")
-
-        elif self.stream_mode == "fsspec":
-            f = self.cfs.open(s3_url, "rb")
-            file = h5py.File(f)
-            io = NWBHDF5IO(file=file, load_namespaces=True)
-
-        nwbfile = io.read()
-        self.widgets_panel.children = [nwb2widget(nwbfile)]
+        # the content URL of a Zarr asset has no extension
+        self.open_remote_file(s3_url, backend=self.get_backend(file_path))
+        self.show_file(s3_url)
 
     def stream_s3_file(self, args=None):
         """Stream NWB file from S3 url"""
         self.widgets_panel.children = [widgets.Label("loading...")]
         s3_url = self.source_s3_file_url.value
-        if self.stream_mode == "ros3":
+        self.open_remote_file(s3_url)
+        self.show_file(s3_url)
+
+    def get_backend(self, path: str) -> str:
+        """'zarr' for the paths or URLs of NWB-Zarr stores, 'hdf5' for the other NWB files, and the backend of the
+        stream mode for the paths without a known extension"""
+        suffix = PurePosixPath(urlparse(path).path.rstrip("/")).suffix.lower()
+        if suffix == ".zarr":
+            return "zarr"
+        if suffix in (".nwb", ".h5", ".hdf5"):
+            return "hdf5"
+        return "zarr" if self.stream_mode == "zarr" else "hdf5"
+
+    def open_remote_file(self, s3_url: str, backend: str = None):
+        """Open a remote NWB file, or return it from the file pool.
+
+        Parameters
+        ----------
+        s3_url: str
+        backend: {'hdf5', 'zarr'}, optional
+            Defaults to the backend of the extension of `s3_url`, see `get_backend`.
+        """
+        nwbfile = self.file_pool.get(s3_url)
+        if nwbfile is not None:
+            return nwbfile
+
+        if self.stream_mode not in ("fsspec", "ros3", "zarr"):
+            raise ValueError(f"stream_mode should be one of 'fsspec', 'ros3' or 'zarr', got {self.stream_mode!r}")
+        f = None
+        if (backend or self.get_backend(s3_url)) == "zarr":
+            io, nwbfile = self.open_zarr_file(s3_url)
+        elif self.stream_mode == "ros3":
             io = NWBHDF5IO(s3_url, mode="r", load_namespaces=True, driver="ros3")
-        elif self.stream_mode == "fsspec":
-            f = self.cfs.open(s3_url, "rb")
-            file = h5py.File(f)
-            io = NWBHDF5IO(file=file, load_namespaces=True)
+            nwbfile = io.read()
+        else:
+            f = CachedRemoteFile(s3_url, self.range_cache, fs=self.fs, fetcher=self.fetcher)
+            # the metadata of the file is read from a local snapshot after the first open
+            with use_metadata_snapshot(f, cache_path=self.cache_path):
+                file = h5py.File(f)
+                register_remote_file(file, f)
+                io = NWBHDF5IO(file=file, load_namespaces=True)
+                nwbfile = io.read()
 
-        nwbfile = io.read()
-        self.widgets_panel.children = [nwb2widget(nwbfile)]
+        self.file_pool.add(s3_url, io, nwbfile, file=f)
+        return nwbfile
 
     def load_local_dir_file(self, args=None):
         """Load local NWB file"""
         full_file_path = str(Path(self.local_dir_path.value) / self.local_dir_files.value)
-        io = NWBHDF5IO(full_file_path, mode="r", load_namespaces=True)
-        nwb = io.read()
-        self.widgets_panel.children = [nwb2widget(nwb)]
+        self.open_local_file(full_file_path)
+        self.show_file(str(Path(full_file_path).resolve()))
 
     def load_local_file(self, args=None):
         """Load local NWB file"""
         full_file_path = str(Path(self.local_file_path.value))
-        io = NWBHDF5IO(full_file_path, mode="r", load_namespaces=True)
-        nwb = io.read()
-        self.widgets_panel.children = [nwb2widget(nwb)]
-
-    def get_all_dandisets_metadata(self):
-        with DandiAPIClient() as client:
-            all_metadata = list()
-            dandisets_iter = tqdm(list(client.get_dandisets()), desc="Loading dandiset metadata")
-            self.source_changing_panel.children = [dandisets_iter.container]
-            for ii, dandiset in enumerate(dandisets_iter):
-                if 1 < ii < 560:
-                    try:
-                        metadata = dandiset.get_metadata()
-                        if has_nwb(metadata):
-                            all_metadata.append(metadata)
-                    except:
-                        pass
-                else:
-                    pass
-        return all_metadata
+        self.open_local_file(full_file_path)
+        self.show_file(str(Path(full_file_path).resolve()))
+
+    def open_local_file(self, path: str):
+        """Open a local NWB file, memory-mapping its contiguous datasets if `memmap_local_files` is set. Directories
+        are opened as NWB-Zarr stores. Files are pooled under their resolved path."""
+        key = str(Path(path).resolve())
+        nwb = self.file_pool.get(key)
+        if nwb is not None:
+            return nwb
+
+        if Path(path).is_dir():
+            io, nwb = self.open_zarr_file(path)
+        else:
+            io = NWBHDF5IO(path, mode="r", load_namespaces=True)
+            nwb = io.read()
+            if self.memmap_local_files:
+                memmap_nwbfile(nwb)
+        self.file_pool.add(key, io, nwb)
+        return nwb
+
+    def show_file(self, key: str):
+        """Display the widgets of a pooled file, built on its first display only. The file is kept open while this
+        Panel displays it, even if other Panels sharing the pool open more files."""
+        self.file_pool.use(key, self)
+        self.widgets_panel.children = [self.file_pool.get_widget(key, nwb2widget)]
+
+    def open_zarr_file(self, path: str):
+        """Open an NWB-Zarr store, either a local directory or any fsspec URL. Its consolidated metadata is read in a
+        single request when present, and zarr fetches the chunks of each slice concurrently.
+
+        Returns
+        -------
+        hdmf_zarr.NWBZarrIO, pynwb.NWBFile
+
+        """
+        if not hdmf_zarr:
+            raise ImportError("Opening NWB-Zarr files requires hdmf-zarr: pip install nwbwidgets[zarr]")
+        io = hdmf_zarr.NWBZarrIO(path=path, mode="r")
+        return io, io.read()
+
+    def close(self):
+        """Release the file displayed by this Panel, and the session of the fetcher once no other Panel uses it"""
+        if getattr(self, "file_pool", None) is not None:
+            self.file_pool.release(self)
+        if getattr(self, "fetcher", None) is not None:
+            self.fetcher.release(self)
+        super().close()
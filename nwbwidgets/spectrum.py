@@ -91,7 +91,8 @@ def plot_spectrum_figure(spectrum, channel_nos, frequency_nos):
 
 
 def check_spectrum(node):
-    assert isinstance(node, Spectrum), "datatype not of type Spectrum"
+    # the class generated from the namespace cached in a file is not the class of ndx_spectrum
+    assert getattr(node, "neurodata_type", None) == Spectrum.neurodata_type, "datatype not of type Spectrum"
     assert "frequencies" in node.fields, "frequencies not found in Spectrum"
     assert "power" in node.fields or "phase" in node.fields, "neither of power/phase found in Spectrum"
     if "power" in node.fields and "phase" in node.fields:
@@ -26,13 +26,25 @@ from .controllers import (
     StartAndDurationController,
 )
 from .controllers.misc import make_trial_event_controller
+from .utils.cache import get_block_cache
+from .utils.memmap import get_memmap
 from .utils.plotly import multi_trace
+from .utils.prefetch import TimeWindowPrefetcher
+from .utils.pyramid import get_pyramid
+from .utils.streaming import prefetch_chunks
 from .utils.timeseries import (
-    bisect_timeseries_by_times,
+    align_by_times_ragged,
+    align_by_times_with_rate,
+    convert_to_units,
+    flatten_window_indices,
+    get_timeseries_data,
+    get_timeseries_envelope_in_units,
     get_timeseries_in_units,
     get_timeseries_maxt,
     get_timeseries_mint,
     get_timeseries_tt,
+    read_rows,
+    read_windows,
     timeseries_time_to_ind,
 )
 from .utils.widgets import interactive_output, set_plotly_callbacks
@@ -133,6 +145,12 @@ def show_indexed_timeseries_mpl(
     return ax
 
 
+def _set_mean_hover(trace, mean):
+    """Show the mean of the samples summarized by each point of an envelope read from a pyramid in its hover text"""
+    trace.customdata = mean
+    trace.hovertemplate = None if mean is None else "(%{x}, %{y})<br>mean: %{customdata:.4g}<extra></extra>"
+
+
 def show_indexed_timeseries_plotly(
     timeseries: TimeSeries,
     istart: int = 0,
@@ -146,6 +164,7 @@ def show_indexed_timeseries_plotly(
     zero_start=False,
     scatter_kwargs: dict = None,
     figure_kwargs: dict = None,
+    n_bins: int = 1000,
 ):
     if istart != 0 or istop is not None:
         if time_window is not None:
@@ -160,10 +179,14 @@ def show_indexed_timeseries_plotly(
     else:
         t_istart = istart
         t_istop = istop
-    tt = get_timeseries_tt(timeseries, istart=t_istart, istop=t_istop)
-    data, unit = get_timeseries_in_units(timeseries, istart=t_istart, istop=t_istop)
+    # read from the pyramid of the TimeSeries if it has one, like the updates of the time window
+    tt, data, unit, mean = get_timeseries_envelope_in_units(
+        timeseries, istart=t_istart, istop=t_istop, n_bins=n_bins, return_mean=True
+    )
     if len(data.shape) == 1:
+        tt = tt[:, np.newaxis]
         data = data[:, np.newaxis]
+        mean = None if mean is None else mean[:, np.newaxis]
     if trace_range is not None:
         if not (0 <= trace_range[0] < data.shape[1] and 0 < trace_range[1] <= data.shape[1]):
             raise ValueError("enter correct trace range")
@@ -175,20 +198,21 @@ def show_indexed_timeseries_plotly(
     if offsets is None:
         offsets = np.zeros(trace_istop - trace_istart)
     if zero_start:
-        tt = tt - tt[0]
+        tt = tt - tt[0, 0]
+    x_range = [np.min(tt), np.max(tt)]
+    tt, data = tt[:, trace_istart:trace_istop], data[:, trace_istart:trace_istop]
+    mean = None if mean is None else mean[:, trace_istart:trace_istop]
     scatter_kwargs = dict() if scatter_kwargs is None else scatter_kwargs
     if fig is None:
         fig = go.FigureWidget(make_subplots(rows=1, cols=1))
     row = 1 if row is None else row
     col = 1 if col is None else col
-    for i, trace_id in enumerate(range(trace_istart, trace_istop)):
-        fig.add_trace(
-            go.Scattergl(x=tt, y=data[:, trace_id] + offsets[i], mode="lines", **scatter_kwargs),
-            row=row,
-            col=col,
-        )
+    for i in range(trace_istop - trace_istart):
+        trace = go.Scattergl(x=tt[:, i], y=data[:, i] + offsets[i], mode="lines", **scatter_kwargs)
+        _set_mean_hover(trace, None if mean is None else mean[:, i] + offsets[i])
+        fig.add_trace(trace, row=row, col=col)
     input_figure_kwargs = dict(
-        xaxis=dict(title_text="time (s)", range=[tt[0], tt[-1]]),
+        xaxis=dict(title_text="time (s)", range=x_range),
         yaxis=dict(title_text=unit if unit is not None else None),
         title=timeseries.name,
     )
@@ -233,13 +257,14 @@ def plot_traces(
         t_ind_start = timeseries_time_to_ind(timeseries, time_window[0])
         t_ind_stop = timeseries_time_to_ind(timeseries, time_window[1])
 
+    data = get_timeseries_data(timeseries)
     if trace_window is None:
-        trace_window = [0, timeseries.data.shape[1]]
+        trace_window = [0, data.shape[1]]
     tt = get_timeseries_tt(timeseries, t_ind_start, t_ind_stop)
-    if timeseries.data.shape[1] == len(tt):  # fix of orientation is incorrect
-        mini_data = timeseries.data[trace_window[0] : trace_window[1], t_ind_start:t_ind_stop].T
+    if data.shape[1] == len(tt):  # fix of orientation is incorrect
+        mini_data = data[trace_window[0] : trace_window[1], t_ind_start:t_ind_stop].T
     else:
-        mini_data = timeseries.data[t_ind_start:t_ind_stop, trace_window[0] : trace_window[1]]
+        mini_data = data[t_ind_start:t_ind_stop, trace_window[0] : trace_window[1]]
 
     gap = np.median(np.nanstd(mini_data, axis=0)) * 20
     offsets = np.arange(trace_window[1] - trace_window[0]) * gap
@@ -275,6 +300,9 @@ def show_timeseries(node, **kwargs):
 
 
 class AbstractTraceWidget(widgets.VBox):
+    # number of pixel columns the traces are decimated to
+    DEFAULT_N_BINS = 1000
+
     def __init__(
         self,
         timeseries: TimeSeries,
@@ -293,6 +321,7 @@ class AbstractTraceWidget(widgets.VBox):
             self.time_window_controller = StartAndDurationController(tmax, tmin)
         else:
             self.time_window_controller = foreign_time_window_controller
+        self.prefetcher = TimeWindowPrefetcher(self.time_window_controller, [timeseries])
 
         self.set_controls(**kwargs)
         self.set_out_fig()
@@ -335,9 +364,12 @@ class SingleTracePlotlyWidget(AbstractTraceWidget):
             time_window = self.controls["time_window"].value
             istart = timeseries_time_to_ind(timeseries, time_window[0])
             istop = timeseries_time_to_ind(timeseries, time_window[1])
-            yy, units = get_timeseries_in_units(timeseries, istart, istop)
-            self.out_fig.data[0].x = get_timeseries_tt(timeseries, istart, istop)
+            tt, yy, units, mean = get_timeseries_envelope_in_units(
+                timeseries, istart, istop, n_bins=self.DEFAULT_N_BINS, return_mean=True
+            )
+            self.out_fig.data[0].x = tt
             self.out_fig.data[0].y = list(yy)
+            _set_mean_hover(self.out_fig.data[0], mean)
 
             # Get data y-range, catching case with no data in current range (if so - no update)
             y_range = [min(yy), max(yy)] if yy.size != 0 else [None, None]
@@ -379,19 +411,22 @@ class SeparateTracesPlotlyWidget(AbstractTraceWidget):
             istart = timeseries_time_to_ind(timeseries, time_window[0])
             istop = timeseries_time_to_ind(timeseries, time_window[1])
 
-            tt = get_timeseries_tt(timeseries, istart, istop)
-            yy, units = get_timeseries_in_units(timeseries, istart, istop)
+            tt, yy, units, mean = get_timeseries_envelope_in_units(
+                timeseries, istart, istop, n_bins=self.DEFAULT_N_BINS, return_mean=True
+            )
 
             with self.out_fig.batch_update():
                 if len(yy.shape) == 1:
                     self.out_fig.data[0].x = tt
                     self.out_fig.data[0].y = yy
+                    _set_mean_hover(self.out_fig.data[0], mean)
                     self.out_fig.update_yaxes(range=[min(yy), max(yy)], row=1, col=1)
                     self.out_fig.update_xaxes(range=[min(tt), max(tt)], row=1, col=1)
                 else:
                     for i, dd in enumerate(yy.T):
-                        self.out_fig.data[i].x = tt
+                        self.out_fig.data[i].x = tt[:, i]
                         self.out_fig.data[i].y = dd
+                        _set_mean_hover(self.out_fig.data[i], None if mean is None else mean[:, i])
                         self.out_fig.update_yaxes(
                             range=[min(dd), max(dd)] if dd.size != 0 else [None, None],
                             row=i + 1,
@@ -422,40 +457,62 @@ def _prep_timeseries(time_series: TimeSeries, time_window=None, order=None):
         t_ind_start = timeseries_time_to_ind(time_series, time_window[0])
         t_ind_stop = timeseries_time_to_ind(time_series, time_window[1])
 
-    tt = get_timeseries_tt(time_series, t_ind_start, t_ind_stop)
     unique_sorted_order, inverse_sort = np.unique(order, return_inverse=True)
 
+    pyramid = get_pyramid(time_series)
+    level = None
+    if pyramid is not None and len(time_series.data.shape) > 1:
+        n_samples = (len(time_series.data) if t_ind_stop is None else t_ind_stop) - t_ind_start
+        level = pyramid.select_level(n_samples)
+
+    if level is not None:
+        tt, mini_data = pyramid.get_envelope(
+            t_ind_start,
+            len(time_series.data) if t_ind_stop is None else t_ind_stop,
+            level,
+            columns=unique_sorted_order,
+        )
+        mini_data = mini_data[:, inverse_sort]
+    else:
+        tt = get_timeseries_tt(time_series, t_ind_start, t_ind_stop)
+
     if len(time_series.data.shape) > 1:
-        mini_data = time_series.data[t_ind_start:t_ind_stop, unique_sorted_order][:, inverse_sort]
+        if level is None and get_block_cache(time_series) is not None:
+            mini_data = read_rows(time_series, t_ind_start, t_ind_stop)[:, unique_sorted_order][:, inverse_sort]
+        elif level is None and get_memmap(time_series) is not None:
+            mini_data = get_memmap(time_series)[t_ind_start:t_ind_stop][:, unique_sorted_order][:, inverse_sort]
+        elif level is None:
+            prefetch_chunks(time_series.data, (slice(t_ind_start, t_ind_stop), unique_sorted_order))
+            mini_data = time_series.data[t_ind_start:t_ind_stop, unique_sorted_order][:, inverse_sort]
         if np.all(np.isnan(mini_data)):
             return None, tt, None
         gap = np.median(np.nanstd(mini_data, axis=0)) * 20
         offsets = np.arange(len(order)) * gap
         mini_data = mini_data + offsets
     else:
-        mini_data = time_series.data[t_ind_start:t_ind_stop]
+        mini_data = read_rows(time_series, t_ind_start, t_ind_stop)
         offsets = [0]
 
     return mini_data, tt, offsets
 
 
-def plot_grouped_traces(
+def fetch_grouped_traces(
     time_series: TimeSeries,
     time_window=None,
     order=None,
-    ax=None,
-    figsize=(8, 7),
     group_inds=None,
-    labels=None,
-    colors=color_wheel,
-    show_legend=True,
     dynamic_table_region_name=None,
     window=None,
     **kwargs,
 ):
-    if ax is None:
-        fig, ax = plt.subplots(figsize=figsize)
+    """Read the data plotted by `plot_grouped_traces`. Does not touch matplotlib, so it can run in a worker thread.
 
+    Returns
+    -------
+    dict
+        {'traces': (order, mini_data, tt, offsets)}, to be passed on to `plot_grouped_traces`
+
+    """
     if order is None:
         if len(time_series.data.shape) > 1:
             order = np.arange(time_series.data.shape[1])
@@ -476,6 +533,39 @@ def plot_grouped_traces(
     else:
         mini_data = None
         tt = time_window
+        offsets = None
+
+    return dict(traces=(order, mini_data, tt, offsets))
+
+
+def plot_grouped_traces(
+    time_series: TimeSeries,
+    time_window=None,
+    order=None,
+    ax=None,
+    figsize=(8, 7),
+    group_inds=None,
+    labels=None,
+    colors=color_wheel,
+    show_legend=True,
+    dynamic_table_region_name=None,
+    window=None,
+    traces=None,
+    **kwargs,
+):
+    if ax is None:
+        fig, ax = plt.subplots(figsize=figsize)
+
+    if traces is None:
+        traces = fetch_grouped_traces(
+            time_series,
+            time_window=time_window,
+            order=order,
+            group_inds=group_inds,
+            dynamic_table_region_name=dynamic_table_region_name,
+            window=window,
+        )["traces"]
+    order, mini_data, tt, offsets = traces
 
     if mini_data is None:
         ax.plot(tt, np.ones_like(tt) * np.nan, color="k")
@@ -551,6 +641,7 @@ class BaseGroupedTraceWidget(widgets.HBox):
         foreign_time_window_controller: StartAndDurationController = None,
         foreign_group_and_sort_controller: GroupAndSortController = None,
         mpl_plotter=plot_grouped_traces,
+        fetch=fetch_grouped_traces,
         **kwargs,
     ):
         """
@@ -563,6 +654,9 @@ class BaseGroupedTraceWidget(widgets.HBox):
         foreign_group_and_sort_controller: GroupAndSortController, optional
         mpl_plotter: function
             Choose function to use when creating figures
+        fetch: function, optional
+            Reads the data of `mpl_plotter` in a worker thread, see `interactive_output`. Set to None if `mpl_plotter`
+            reads its own data.
         kwargs
         """
 
@@ -580,6 +674,7 @@ class BaseGroupedTraceWidget(widgets.HBox):
             self.tmin = get_timeseries_mint(time_series)
             self.tmax = get_timeseries_maxt(time_series)
             self.time_window_controller = StartAndDurationController(tmin=self.tmin, tmax=self.tmax)
+        self.prefetcher = TimeWindowPrefetcher(self.time_window_controller, [time_series])
 
         self.controls = dict(
             time_series=widgets.fixed(self.time_series),
@@ -613,7 +708,7 @@ class BaseGroupedTraceWidget(widgets.HBox):
             self.controls.update(gas=self.gas)
 
         # Sets up interactive output controller
-        out_fig = interactive_output(mpl_plotter, self.controls)
+        out_fig = interactive_output(mpl_plotter, self.controls, fetch=fetch)
 
         if foreign_time_window_controller:
             right_panel = out_fig
@@ -675,10 +770,6 @@ class AlignMultiTraceTimeSeriesByTrialsAbstract(widgets.VBox):
         sem=True,
     ):
         self.time_series = time_series
-        self.time_series_data = time_series.data[()]
-        self.time_series_timestamps = None
-        if time_series.rate is None:
-            self.time_series_timestamps = time_series.timestamps[()]
         super().__init__()
 
         if trials is None:
@@ -802,16 +893,9 @@ class AlignMultiTraceTimeSeriesByTrialsConstant(AlignMultiTraceTimeSeriesByTrial
     @functools.lru_cache()
     def align_data(self, start_label, before, after, index=None):
         starts = np.array(self.trials[start_label][:]) - before
-        out_data_aligned = []
-        out_ts_aligned = []
-        for start in starts:
-            idx_start = int((start - self.time_series.starting_time) * self.time_series.rate)
-            idx_stop = int(idx_start + (before + after) * self.time_series.rate)
-            out_ts_aligned.append(np.linspace(-before, after, num=idx_stop - idx_start))
-            if len(self.time_series_data.shape) > 1 and index is not None:
-                out_data_aligned.append(self.time_series_data[idx_start:idx_stop, index])
-            else:
-                out_data_aligned.append(self.time_series_data[idx_start:idx_stop])
+        out_data_aligned = align_by_times_with_rate(self.time_series, starts, before + after, traces=index)
+        n_time = int((before + after) * self.time_series.rate)
+        out_ts_aligned = np.broadcast_to(np.linspace(-before, after, num=n_time), (len(starts), n_time))
         return out_data_aligned, out_ts_aligned
 
     def update(
@@ -831,6 +915,8 @@ class AlignMultiTraceTimeSeriesByTrialsConstant(AlignMultiTraceTimeSeriesByTrial
         if group_inds is None:
             group_inds = np.zeros(len(self.trials), dtype=int)
         if align_to_zero:
+            # align_data is cached, so never modify its output in place
+            data = np.array(data, dtype=float)
             for trial_no in order:
                 data_zero_id = bisect(time_ts_aligned[trial_no], 0)
                 data[trial_no] -= data[trial_no][data_zero_id]
@@ -899,18 +985,10 @@ class AlignMultiTraceTimeSeriesByTrialsVariable(AlignMultiTraceTimeSeriesByTrial
     @functools.lru_cache()
     def align_data(self, start_label, before, after, index=None):
         starts = np.array(self.trials[start_label][:]) - before
-        out_data_aligned = []
-        out_ts_aligned = []
-        for start in starts:
-            idx_start = bisect(self.time_series_timestamps, start - before)
-            idx_stop = bisect(self.time_series_timestamps, start + after, lo=idx_start)
-            out_ts_aligned.append(
-                self.time_series_timestamps[idx_start:idx_stop] - self.time_series_timestamps[idx_start] - before
-            )
-            if len(self.time_series_data.shape) > 1 and index is not None:
-                out_data_aligned.append(self.time_series_data[idx_start:idx_stop, index])
-            else:
-                out_data_aligned.append(self.time_series_data[idx_start:idx_stop])
+        offsets, timestamps, values = align_by_times_ragged(self.time_series, starts, before + after, traces=index)
+        bounds = list(zip(offsets[:-1], offsets[1:]))
+        out_data_aligned = [values[i_start:i_stop] for i_start, i_stop in bounds]
+        out_ts_aligned = [timestamps[i_start:i_stop] - before for i_start, i_stop in bounds]
         return out_data_aligned, out_ts_aligned
 
     def update(
@@ -929,6 +1007,8 @@ class AlignMultiTraceTimeSeriesByTrialsVariable(AlignMultiTraceTimeSeriesByTrial
         if group_inds is None:
             group_inds = np.zeros(len(self.trials), dtype=int)
         if align_to_zero:
+            # align_data is cached, so never modify its output in place
+            data = [np.array(trial_data, dtype=float) for trial_data in data]
             for trial_no in order:
                 data_zero_id = bisect(time_ts_aligned[trial_no], 0)
                 data[trial_no] -= data[trial_no][data_zero_id]
@@ -966,23 +1046,19 @@ def trialize_time_series(
 
     trial_left_bound_index = np.searchsorted(timestamps, trial_left_bound)
     trial_right_bound_index = np.searchsorted(timestamps, trial_right_bound)
-    interval_bounds = zip(trial_left_bound_index, trial_right_bound_index)
-
-    data_list = []
-    timestamps_list = []
-    alignment_column_list = []
-    for trial_index, (idx_start, idx_stop) in enumerate(interval_bounds):
-        trial_data, unit = get_timeseries_in_units(
-            time_series, istart=idx_start, istop=idx_stop, data_column=data_column
-        )
-        data_list.append(trial_data)
-        timestamps_list.append(timestamps[idx_start:idx_stop])
-        alignment_column_list.append([trials_table_df[alignment_column][trial_index]] * (idx_stop - idx_start))
+
+    windows = read_windows(time_series.data, trial_left_bound_index, trial_right_bound_index, traces=data_column)
+    trial_data = np.concatenate(windows) if windows else np.asarray(time_series.data[:0])
+    trial_data, unit = convert_to_units(time_series, trial_data)
+
+    sample_indices, offsets = flatten_window_indices(trial_left_bound_index, trial_right_bound_index)
+    n_samples_per_trial = np.diff(offsets)
+    alignment_values = trials_table_df[alignment_column].to_numpy()[: len(n_samples_per_trial)]
 
     data_dict = {
-        "data": np.concatenate(data_list),
-        "timestamps": np.concatenate(timestamps_list),
-        f"{alignment_column}": np.concatenate(alignment_column_list),
+        "data": trial_data,
+        "timestamps": timestamps[sample_indices],
+        f"{alignment_column}": np.repeat(alignment_values, n_samples_per_trial),
     }
 
     data_df = pd.DataFrame(data_dict)
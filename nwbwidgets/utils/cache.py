@@ -0,0 +1,271 @@
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+import numpy as np
+from pynwb import TimeSeries
+
+from .streaming import prefetch_chunks
+
+_block_caches = weakref.WeakKeyDictionary()
+_default_block_cache = None
+_default_widget_cache = None
+# the default caches are first used from the kernel or from the render threads
+_defaults_lock = threading.Lock()
+
+
+class BlockCache:
+    """LRU cache of row blocks of array-like datasets, bounded by a byte budget.
+
+    Rows are grouped in blocks of roughly `block_bytes` bytes, rounded up to a whole number of chunks for chunked
+    h5py/zarr datasets, so that a block maps onto whole chunks of the file. Consecutive missing blocks are read with a
+    single slice. The cache can be filled from a background thread while the widgets read from it.
+
+    Blocks are keyed by the id of their dataset. Datasets are only weakly referenced, and their blocks are dropped once
+    they are garbage collected, e.g. when their file is closed. Datasets that do not support weak references are held
+    until `unregister` is called.
+    """
+
+    def __init__(self, max_bytes: int = 2**28, block_bytes: int = 2**22):
+        """
+
+        Parameters
+        ----------
+        max_bytes: int, optional
+            Least recently used blocks are evicted once the cache holds more than `max_bytes` bytes. Default: 256 MiB.
+        block_bytes: int, optional
+            Target size of a block. Default: 4 MiB.
+        """
+        self.max_bytes = max_bytes
+        self.block_bytes = block_bytes
+        self.nbytes = 0
+        self._blocks = OrderedDict()
+        # id of a dataset -> weakref.finalize of the dataset, or the dataset itself if it has no weak references
+        self._datasets = dict()
+        # ids of the garbage collected datasets whose blocks are still to be dropped
+        self._collected = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_row_nbytes(dataset) -> int:
+        return int(np.prod(dataset.shape[1:], dtype="int64")) * np.dtype(dataset.dtype).itemsize
+
+    def get_block_rows(self, dataset) -> int:
+        """Number of rows per block of `dataset`"""
+        row_nbytes = self.get_row_nbytes(dataset)
+        block_rows = max(1, self.block_bytes // max(row_nbytes, 1))
+        chunks = getattr(dataset, "chunks", None)
+        if chunks:
+            block_rows = int(np.ceil(block_rows / chunks[0])) * chunks[0]
+        return block_rows
+
+    def _get_block_range(self, dataset, istart, istop):
+        istart = 0 if istart is None else istart
+        istop = len(dataset) if istop is None else min(istop, len(dataset))
+        block_rows = self.get_block_rows(dataset)
+        return istart, istop, block_rows, istart // block_rows, int(np.ceil(istop / block_rows))
+
+    def _load_blocks(self, dataset, blocks, block_rows):
+        """Read the blocks that are not cached yet, merging consecutive ones into a single read"""
+        with self._lock:
+            missing = [block for block in blocks if (id(dataset), block) not in self._blocks]
+        if not missing:
+            return
+        runs = np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1)
+        for run in runs:
+            rows = slice(run[0] * block_rows, (run[-1] + 1) * block_rows)
+            prefetch_chunks(dataset, rows)
+            data = np.asarray(dataset[rows])
+            for i, block in enumerate(run):
+                self._put(dataset, block, data[i * block_rows : (i + 1) * block_rows])
+
+    def _track(self, dataset):
+        """Drop the blocks of `dataset` once it is garbage collected, so that its id can be reused safely. Called with
+        the lock held."""
+        if id(dataset) in self._datasets:
+            return
+        try:
+            # the finalizer may run at any time, even while the lock is held, so it only queues the id
+            self._datasets[id(dataset)] = weakref.finalize(dataset, self._collected.append, id(dataset))
+        except TypeError:
+            self._datasets[id(dataset)] = dataset
+
+    def _drop_collected(self):
+        """Drop the blocks of the datasets that were garbage collected. Called with the lock held."""
+        while self._collected:
+            self._drop(self._collected.popleft())
+
+    def _drop(self, dataset_id: int):
+        # called with the lock held
+        tracked = self._datasets.pop(dataset_id, None)
+        if isinstance(tracked, weakref.finalize):
+            tracked.detach()
+        for key in [key for key in self._blocks if key[0] == dataset_id]:
+            self.nbytes -= self._blocks.pop(key).nbytes
+
+    def unregister(self, dataset):
+        """Drop the blocks of `dataset` and the reference to it"""
+        with self._lock:
+            self._drop(id(dataset))
+
+    def _put(self, dataset, block, data):
+        key = (id(dataset), block)
+        with self._lock:
+            self._drop_collected()
+            if key in self._blocks:
+                return
+            self._track(dataset)
+            self._blocks[key] = data
+            self.nbytes += data.nbytes
+            while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+                _, evicted = self._blocks.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def read(self, dataset, istart=None, istop=None) -> np.ndarray:
+        """Equivalent to `dataset[istart:istop]`, served from the cache where possible. Windows larger than the budget
+        are read from the dataset directly, so that they do not evict the whole cache."""
+        istart, istop, block_rows, first, last = self._get_block_range(dataset, istart, istop)
+        if istop <= istart:
+            return np.asarray(dataset[istart:istop])
+        if (last - first) * block_rows * self.get_row_nbytes(dataset) > self.max_bytes:
+            prefetch_chunks(dataset, slice(istart, istop))
+            return np.asarray(dataset[istart:istop])
+        blocks = range(first, last)
+        self._load_blocks(dataset, blocks, block_rows)
+
+        pieces = []
+        with self._lock:
+            for block in blocks:
+                key = (id(dataset), block)
+                data = self._blocks.get(key)
+                if data is None:
+                    break
+                self._blocks.move_to_end(key)
+                pieces.append(data)
+        if len(pieces) < len(blocks):
+            # blocks of the window were evicted by concurrent reads
+            return np.asarray(dataset[istart:istop])
+        data = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        return data[istart - first * block_rows : istop - first * block_rows]
+
+    def prefetch(self, dataset, istart=None, istop=None):
+        """Load the blocks covering `dataset[istart:istop]` without returning them. Windows larger than a quarter of
+        the budget are skipped, so that reading ahead never evicts the window that is being displayed."""
+        istart, istop, block_rows, first, last = self._get_block_range(dataset, istart, istop)
+        if istop <= istart or (last - first) * block_rows * self.get_row_nbytes(dataset) > self.max_bytes // 4:
+            return
+        self._load_blocks(dataset, range(first, last), block_rows)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            for tracked in self._datasets.values():
+                if isinstance(tracked, weakref.finalize):
+                    tracked.detach()
+            self._datasets.clear()
+            self._collected.clear()
+            self.nbytes = 0
+
+
+def get_default_block_cache() -> BlockCache:
+    """BlockCache shared by all the widgets that do not provide their own"""
+    global _default_block_cache
+    with _defaults_lock:
+        if _default_block_cache is None:
+            _default_block_cache = BlockCache()
+        return _default_block_cache
+
+
+def register_block_cache(timeseries: TimeSeries, cache: BlockCache):
+    """Make `get_timeseries_in_units` and the grouped trace widgets read the data of `timeseries` through `cache`"""
+    _block_caches[timeseries] = cache
+
+
+def get_block_cache(timeseries: TimeSeries):
+    return _block_caches.get(timeseries)
+
+
+class WidgetCache:
+    """LRU cache of the live widgets built for NWB objects, bounded by a number of widgets.
+
+    Entries are keyed on the object_id of the object, or on its id if it has none, and on the visualization that built
+    the widget. They only hold weak references to the object and the widget, and are checked against the object on
+    every lookup: a widget is reused as long as it is alive and not closed, and never for another object, e.g. one of
+    the same file opened again or one that got the id of a collected object.
+    """
+
+    def __init__(self, max_widgets: int = 256):
+        """
+
+        Parameters
+        ----------
+        max_widgets: int, optional
+            Least recently used entries are dropped once the cache holds more than `max_widgets` widgets.
+        """
+        self.max_widgets = max_widgets
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _get_node_key(node):
+        object_id = getattr(node, "object_id", None)
+        return object_id if isinstance(object_id, str) else id(node)
+
+    @staticmethod
+    def _is_alive(entry) -> bool:
+        node_ref, widget_ref = entry
+        widget = widget_ref()
+        return node_ref() is not None and widget is not None and widget.comm is not None
+
+    def get(self, node, key):
+        """Live widget built for `node` with the visualization identified by the hashable `key`, or None"""
+        cache_key = (self._get_node_key(node), key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[0]() is not node or not self._is_alive(entry):
+                # the entry is of another object with the same key, or the widget was closed
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry[1]()
+
+    def put(self, node, key, widget) -> bool:
+        """Cache `widget`. Returns False if `node` does not support weak references."""
+        try:
+            node_ref = weakref.ref(node)
+        except TypeError:
+            return False
+        cache_key = (self._get_node_key(node), key)
+        with self._lock:
+            self._entries[cache_key] = (node_ref, weakref.ref(widget))
+            self._entries.move_to_end(cache_key)
+            if len(self._entries) > self.max_widgets:
+                # drop the entries of collected objects and closed widgets first, then the least recently used ones
+                for dead_key in [k for k, entry in self._entries.items() if not self._is_alive(entry)]:
+                    del self._entries[dead_key]
+            while len(self._entries) > self.max_widgets:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, node=None):
+        """Forget the widgets of `node`, or all the widgets if `node` is None, so that they are built again"""
+        with self._lock:
+            if node is None:
+                self._entries.clear()
+                return
+            for cache_key in [cache_key for cache_key, (node_ref, _) in self._entries.items() if node_ref() is node]:
+                del self._entries[cache_key]
+
+
+def get_widget_cache() -> WidgetCache:
+    """WidgetCache used by `nwb2widget`"""
+    global _default_widget_cache
+    with _defaults_lock:
+        if _default_widget_cache is None:
+            _default_widget_cache = WidgetCache()
+        return _default_widget_cache
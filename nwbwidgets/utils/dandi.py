@@ -1,6 +1,14 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
 from dandi.dandiapi import DandiAPIClient
 from dandischema.models import Dandiset
 
+NWB_RRID = "RRID:SCR_015242"
+
 
 def get_dandiset_metadata(dandiset_id: str):
     with DandiAPIClient() as client:
@@ -9,9 +17,10 @@ def get_dandiset_metadata(dandiset_id: str):
 
 
 def list_dandiset_files(dandiset_id: str):
+    """Paths of the NWB files of a dandiset, HDF5 files and NWB-Zarr stores"""
     with DandiAPIClient() as client:
         dandiset = client.get_dandiset(dandiset_id=dandiset_id, version_id="draft")
-        return [i.dict().get("path") for i in dandiset.get_assets() if i.dict().get("path").endswith(".nwb")]
+        return [i.path for i in dandiset.get_assets() if i.path.endswith((".nwb", ".nwb.zarr"))]
 
 
 def get_file_url(dandiset_id: str, file_path: str):
@@ -24,5 +33,143 @@ def has_nwb(metadata: Dandiset):
     if hasattr(metadata, "assetsSummary"):
         assets_summary = metadata.assetsSummary
         if hasattr(assets_summary, "dataStandard"):
-            return any(x.identifier == "RRID:SCR_015242" for x in assets_summary.dataStandard)
+            return any(x.identifier == NWB_RRID for x in assets_summary.dataStandard)
     return False
+
+
+def has_nwb_raw(metadata: dict):
+    """Same as `has_nwb`, for the raw metadata dict, which is much cheaper to get than the validated model"""
+    data_standards = (metadata.get("assetsSummary") or {}).get("dataStandard") or []
+    return any(x.get("identifier") == NWB_RRID for x in data_standards)
+
+
+class DandisetIndex:
+    """Local JSON index of the name, description and NWB content of every dandiset.
+
+    The index is read from disk on creation, so that it can be queried offline. `refresh` lists the dandisets page by
+    page and fetches the metadata of the new or modified ones with a bounded thread pool, reporting progress as
+    results come in. The index is considered stale `ttl` seconds after its last refresh.
+    """
+
+    def __init__(
+        self,
+        path: str = "nwb-cache/dandisets.json",
+        ttl: float = 24 * 3600,
+        max_workers: int = 8,
+        client_factory=DandiAPIClient,
+    ):
+        """
+
+        Parameters
+        ----------
+        path: str, optional
+            Location of the JSON index. Defaults to "dandisets.json" under "nwb-cache", like the Panel.
+        ttl: float, optional
+            Time, in seconds, after which the index should be refreshed. Default: one day.
+        max_workers: int, optional
+            Number of dandisets whose metadata is fetched concurrently.
+        client_factory: callable, optional
+            Returns a context manager that yields a DandiAPIClient.
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.client_factory = client_factory
+        self.entries = dict()
+        self.updated = None
+        self._lock = threading.Lock()
+        if self.path.exists():
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            index = json.load(f)
+        self.entries = index["entries"]
+        self.updated = index["updated"]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with self._lock:
+            index = dict(entries=self.entries, updated=self.updated)
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        tmp_path.replace(self.path)
+
+    def is_stale(self) -> bool:
+        return self.updated is None or time.time() - self.updated > self.ttl
+
+    def get_options(self) -> list:
+        """'<identifier> - <name>' of the dandisets that contain NWB files, sorted by identifier"""
+        with self._lock:
+            entries = sorted(self.entries.items())
+        return [f"{identifier} - {entry['name']}" for identifier, entry in entries if entry["has_nwb"]]
+
+    def get_description(self, dandiset_id: str) -> str:
+        return self.entries[dandiset_id]["description"]
+
+    @staticmethod
+    def _fetch_entry(dandiset, modified: str):
+        try:
+            metadata = dandiset.get_raw_metadata()
+        except Exception:
+            # dandisets with invalid metadata are left out of the index
+            return None
+        return dict(
+            name=metadata.get("name", ""),
+            description=metadata.get("description", ""),
+            has_nwb=has_nwb_raw(metadata),
+            modified=modified,
+        )
+
+    def refresh(self, on_progress=None, page_size: int = 25):
+        """Fetch the metadata of the dandisets that are new or were modified since the last refresh, and drop the
+        ones that no longer exist.
+
+        Parameters
+        ----------
+        on_progress: callable, optional
+            Called with the index every `page_size` fetched dandisets, and once at the end
+        page_size: int, optional
+        """
+        listed = set()
+        with self.client_factory() as client, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = dict()
+            for dandiset in client.get_dandisets():
+                listed.add(dandiset.identifier)
+                modified = str(dandiset.modified)
+                entry = self.entries.get(dandiset.identifier)
+                if entry is None or entry["modified"] != modified:
+                    futures[executor.submit(self._fetch_entry, dandiset, modified)] = dandiset.identifier
+
+            for i, future in enumerate(as_completed(futures)):
+                entry = future.result()
+                if entry is not None:
+                    with self._lock:
+                        self.entries[futures[future]] = entry
+                if on_progress is not None and (i + 1) % page_size == 0:
+                    on_progress(self)
+
+        with self._lock:
+            self.entries = {identifier: entry for identifier, entry in self.entries.items() if identifier in listed}
+            self.updated = time.time()
+        self.save()
+        if on_progress is not None:
+            on_progress(self)
+
+    def refresh_in_background(self, on_progress=None, page_size: int = 25, on_error=None) -> threading.Thread:
+        """Run `refresh` in a daemon thread. If it fails, e.g. offline, the index keeps its entries and stays stale,
+        and `on_error` is called with the exception, if given. Both are called from the thread, so callbacks that update
+        widgets must be wrapped with `nwbwidgets.utils.widgets.call_on_event_loop`."""
+
+        def refresh():
+            try:
+                self.refresh(on_progress, page_size)
+            except Exception as error:
+                if on_error is None:
+                    raise
+                on_error(error)
+
+        thread = threading.Thread(target=refresh, name="nwbwidgets-dandi-index", daemon=True)
+        thread.start()
+        return thread
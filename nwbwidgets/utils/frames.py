@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from pynwb.image import ImageSeries
+from tifffile import TiffFile
+
+from .prefetch import get_prefetch_executor
+
+
+def uses_external_file(image_series: ImageSeries) -> bool:
+    """Whether the frames of `image_series` are stored in external files rather than in the NWB file"""
+    return image_series.external_file is not None and (image_series.data is None or len(image_series.data) == 0)
+
+
+class FrameReader:
+    """Reads the frames of an image stack through an LRU cache, and reads the next frames ahead in a background thread.
+
+    External TIFF stacks are read through a single `TiffFile` handle, kept open, instead of being reopened and parsed
+    for every frame.
+    """
+
+    def __init__(
+        self,
+        read_frame,
+        n_frames: int,
+        max_frames: int = 64,
+        read_ahead: int = 8,
+        executor=None,
+        file=None,
+        read_block=None,
+        chunks=None,
+    ):
+        """
+
+        Parameters
+        ----------
+        read_frame: callable
+            Reads the frame at an index
+        n_frames: int
+        max_frames: int, optional
+            Number of frames kept in the cache
+        read_ahead: int, optional
+            Number of frames read ahead of the current one
+        executor: concurrent.futures.Executor, optional
+            Defaults to the single background thread shared by the prefetchers.
+        file: optional
+            Closed by `close`
+        read_block: callable, optional
+            Reads the frames from a start index to a stop index at once. Defaults to reading them one by one.
+        chunks: tuple of int, optional
+            Chunk shape of the frames in the file, if they are chunked
+        """
+        self.read_frame = read_frame
+        self.n_frames = n_frames
+        self.max_frames = max_frames
+        self.read_ahead = read_ahead
+        self.executor = get_prefetch_executor() if executor is None else executor
+        self.file = file
+        self.read_block = read_block
+        self.chunks = chunks
+        self.stats = dict(hits=0, misses=0)
+        self._frames = OrderedDict()
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    @classmethod
+    def from_array(cls, data, **kwargs):
+        """Reader of the frames of an array-like of shape (n_frames, ...), e.g. an h5py.Dataset"""
+        return cls(
+            lambda index: np.asarray(data[index]),
+            len(data),
+            read_block=lambda start, stop: np.asarray(data[start:stop]),
+            chunks=getattr(data, "chunks", None),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_tiff(cls, path, **kwargs):
+        """Reader of the pages of a TIFF file"""
+        tif = TiffFile(path)
+        return cls(
+            lambda index: tif.pages[index].asarray(),
+            len(tif.pages),
+            file=tif,
+            # a single page is read without its leading axis
+            read_block=lambda start, stop: tif.asarray(key=range(start, stop)).reshape(
+                (stop - start,) + tif.pages[0].shape
+            ),
+            **kwargs,
+        )
+
+    @classmethod
+    def from_image_series(cls, image_series: ImageSeries, **kwargs):
+        """Reader of the frames of `image_series`, stored in the NWB file or in its first external file"""
+        if uses_external_file(image_series):
+            return cls.from_tiff(image_series.external_file[0], **kwargs)
+        return cls.from_array(image_series.data, **kwargs)
+
+    def _read(self, index: int):
+        with self._read_lock:
+            frame = self.read_frame(index)
+        with self._lock:
+            self._frames[index] = frame
+            self._frames.move_to_end(index)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+            self._pending.pop(index, None)
+        return frame
+
+    def get_frame(self, index: int) -> np.ndarray:
+        """Frame at `index`, from the cache, from a pending read-ahead, or read now"""
+        index = int(index)
+        with self._lock:
+            if index in self._frames:
+                self._frames.move_to_end(index)
+                self.stats["hits"] += 1
+                return self._frames[index]
+            self.stats["misses"] += 1
+            future = self._pending.get(index)
+        if future is not None and not future.cancelled():
+            return future.result()
+        return self._read(index)
+
+    def read_frames(self, start: int, stop: int) -> np.ndarray:
+        """Frames from `start` to `stop`, read at once and without going through the cache, e.g. to reduce a whole
+        stack block by block"""
+        with self._read_lock:
+            if self.read_block is not None:
+                return np.asarray(self.read_block(start, stop))
+            return np.stack([self.read_frame(index) for index in range(start, stop)])
+
+    def prefetch(self, index: int, step: int = 1):
+        """Read the `read_ahead` frames following `index` by steps of `step` in the background. Pending reads of other
+        frames are cancelled."""
+        index = int(index)
+        wanted = [index + i * step for i in range(1, self.read_ahead + 1)]
+        wanted = [i for i in wanted if 0 <= i < self.n_frames]
+        with self._lock:
+            for pending_index in list(self._pending):
+                if pending_index not in wanted and self._pending[pending_index].cancel():
+                    del self._pending[pending_index]
+            for next_index in wanted:
+                if next_index not in self._frames and next_index not in self._pending:
+                    self._pending[next_index] = self.executor.submit(self._read, next_index)
+
+    def close(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._frames.clear()
+        if self.file is not None:
+            with self._read_lock:
+                self.file.close()
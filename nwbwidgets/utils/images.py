@@ -0,0 +1,103 @@
+import base64
+import io
+
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image
+
+
+def get_colormap_lut(cmap: str = "gray", n_colors: int = 256) -> np.ndarray:
+    """Lookup table of a matplotlib colormap
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8, of shape (n_colors,) for "gray", so that frames are encoded with a single channel, and of shape
+        (n_colors, 3) otherwise
+
+    """
+    if cmap == "gray":
+        return np.linspace(0, 255, n_colors).round().astype(np.uint8)
+    colors = colormaps[cmap](np.linspace(0, 1, n_colors))[:, :3]
+    return (colors * 255).round().astype(np.uint8)
+
+
+def get_contrast_limits(frame, percentiles=None):
+    """Range of values of `frame` mapped to the colormap: its min and max, or the given percentiles of its values"""
+    frame = np.asarray(frame)
+    if percentiles is None:
+        return float(np.nanmin(frame)), float(np.nanmax(frame))
+    vmin, vmax = np.nanpercentile(frame, percentiles)
+    return float(vmin), float(vmax)
+
+
+def apply_lut(frame, lut: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    """Map the values of a 2D `frame` between `vmin` and `vmax` to the colors of `lut`.
+
+    Frames of 8 or 16-bit unsigned integers are mapped through a table of every value of their dtype, i.e. a single
+    indexing operation. Other frames are scaled in float32.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8, of shape frame.shape + lut.shape[1:]
+
+    """
+    frame = np.asarray(frame)
+    n_colors = len(lut)
+    scale = n_colors / max(vmax - vmin, np.finfo(np.float32).eps)
+    if frame.dtype.kind == "u" and frame.dtype.itemsize <= 2:
+        values = np.arange(np.iinfo(frame.dtype).max + 1, dtype=np.float32)
+        table = lut[np.clip((values - vmin) * scale, 0, n_colors - 1).astype(np.intp)]
+        return table[frame]
+    indices = np.subtract(frame, vmin, dtype=np.float32)
+    indices *= scale
+    np.clip(indices, 0, n_colors - 1, out=indices)
+    # NaNs are shown with the first color
+    np.nan_to_num(indices, copy=False, nan=0)
+    return lut[indices.astype(np.intp)]
+
+
+def to_uint8_image(frame, lut: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    """uint8 image of a 2D frame through `lut`, or of an RGB(A) frame of shape (height, width, 3 or 4) scaled
+    between `vmin` and `vmax`"""
+    frame = np.asarray(frame)
+    if frame.ndim == 2:
+        return apply_lut(frame, lut, vmin, vmax)
+    if frame.dtype == np.uint8 and (vmin, vmax) == (0, 255):
+        return frame
+    return apply_lut(frame, np.arange(256, dtype=np.uint8), vmin, vmax)
+
+
+def encode_image(image: np.ndarray, format: str = "png", quality: int = 90) -> bytes:
+    """Compress a uint8 image of shape (height, width) or (height, width, channels)
+
+    Parameters
+    ----------
+    image: numpy.ndarray
+    format: {'png', 'jpeg'}, optional
+        'png' is lossless. 'jpeg' is smaller and faster to encode for large frames, but lossy and without alpha.
+    quality: int, optional
+        JPEG quality, from 1 to 95
+
+    Returns
+    -------
+    bytes
+
+    """
+    buffer = io.BytesIO()
+    if format == "png":
+        # the lowest compression level encodes several times faster for a slightly larger output
+        Image.fromarray(image).save(buffer, format="png", compress_level=1)
+    elif format == "jpeg":
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = image[:, :, :3]
+        Image.fromarray(image).save(buffer, format="jpeg", quality=quality)
+    else:
+        raise ValueError(f"format must be 'png' or 'jpeg', not {format!r}")
+    return buffer.getvalue()
+
+
+def to_data_uri(data: bytes, format: str = "png") -> str:
+    """data URI of an encoded image, e.g. for the source of a plotly layout image"""
+    return f"data:image/{format};base64," + base64.b64encode(data).decode("ascii")
@@ -0,0 +1,57 @@
+import os
+import weakref
+
+import h5py
+import numpy as np
+from pynwb import NWBFile, TimeSeries
+
+_memmaps = weakref.WeakKeyDictionary()
+
+
+def memmap_dataset(dataset):
+    """Expose a contiguous, uncompressed h5py dataset of a local file as a read-only `np.memmap`.
+
+    Slicing the memmap reads the OS page cache directly, without copies nor HDF5 library overhead.
+
+    Parameters
+    ----------
+    dataset: h5py.Dataset
+
+    Returns
+    -------
+    numpy.memmap or None
+        None if the dataset is chunked, compressed, empty, of a non-numeric type, or not stored in a regular file.
+
+    """
+    if not isinstance(dataset, h5py.Dataset):
+        return None
+    if dataset.chunks is not None or dataset.compression is not None or dataset.dtype.kind not in "biuf":
+        return None
+    if dataset.file.driver not in ("sec2", "stdio") or not os.path.isfile(dataset.file.filename):
+        return None
+    if dataset.external is not None:
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        # not allocated yet, or compact storage
+        return None
+    return np.memmap(dataset.file.filename, mode="r", dtype=dataset.dtype, offset=offset, shape=dataset.shape)
+
+
+def register_memmap(timeseries: TimeSeries) -> bool:
+    """Make `get_timeseries_in_units`, the trace widgets and `plot_traces` slice the data of `timeseries` through a
+    memory map. Returns False if its data cannot be memory-mapped, see `memmap_dataset`."""
+    memmap = memmap_dataset(timeseries.data)
+    if memmap is None:
+        return False
+    _memmaps[timeseries] = memmap
+    return True
+
+
+def get_memmap(timeseries: TimeSeries):
+    return _memmaps.get(timeseries)
+
+
+def memmap_nwbfile(nwbfile: NWBFile) -> int:
+    """Register a memory map for every TimeSeries of `nwbfile` whose data allows it, and return how many were"""
+    return sum(register_memmap(obj) for obj in nwbfile.objects.values() if isinstance(obj, TimeSeries))
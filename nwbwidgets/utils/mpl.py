@@ -1,5 +1,10 @@
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib import gridspec
+from matplotlib.colors import to_rgb
+
+from .plotly import event_intensity
+from .units import bin_events
 
 
 def create_big_ax(fig):
@@ -45,3 +50,27 @@ def grid_sps(shape, subplot_spec=None, fig=None):
     big_ax.patch.set_facecolor("none")
 
     return fig, big_ax, gs
+
+
+def rasterize_events(data, window, row_colors, n_bins: int = 1000):
+    """Render an event raster as an RGBA image with one pixel row per row of `data`
+
+    Parameters
+    ----------
+    data: list of array-like
+    window: [float, float]
+    row_colors: list
+        one matplotlib color per row
+    n_bins: int, optional
+
+    Returns
+    -------
+    numpy.ndarray
+        shape=(n_rows, n_bins, 4), dtype=uint8
+    """
+    counts = bin_events(data, window, n_bins)
+    rgba = np.zeros(counts.shape + (4,), dtype="uint8")
+    if len(row_colors):
+        rgba[..., :3] = (np.array([to_rgb(color) for color in row_colors]) * 255).astype("uint8")[:, np.newaxis]
+    rgba[..., 3] = (event_intensity(counts) * 255).astype("uint8")
+    return rgba
@@ -1,5 +1,15 @@
 import numpy as np
 import plotly.graph_objects as go
+from matplotlib.colors import to_rgb
+
+
+def event_intensity(counts):
+    """Opacity of each bin of an event raster: 0 without events, then from 0.3 up to 1 at the 99th percentile of the
+    counts, so that dense bursts stay distinguishable from isolated events."""
+    if not counts.any():
+        return np.zeros(counts.shape)
+    saturation = max(np.percentile(counts[counts > 0], 99), 1)
+    return np.where(counts > 0, 0.3 + 0.7 * np.minimum(counts / saturation, 1), 0)
 
 
 def multi_trace(x, y, color, label=None, fig=None, insert_nans=False):
@@ -54,6 +64,55 @@ def multi_trace(x, y, color, label=None, fig=None, insert_nans=False):
         return fig
 
 
+def event_group_trace(
+    times_list,
+    offset=0,
+    color="Black",
+    label=None,
+    marker=None,
+    line_width=None,
+):
+    """Create a single trace holding the events of several rows, e.g. the spike trains of the units of a group
+
+    Parameters
+    ----------
+    times_list: list of array-like
+    offset: float, optional
+        y value of the first row
+    label: str, optional
+
+    optional, passed to go.Scatter.marker:
+    marker: str
+    line_width: str
+    color: str
+        default: Black
+
+
+    Returns
+    -------
+    go.Scattergl
+
+    """
+    lengths = np.array([len(times) for times in times_list], dtype=int)
+    x = np.concatenate([np.asarray(times, dtype=float) for times in times_list]) if lengths.sum() else np.zeros(0)
+    y = np.repeat(np.arange(len(times_list), dtype=float) + offset, lengths)
+    # every property is set explicitly so that set_traces can overwrite the trace of a previous render
+    return go.Scattergl(
+        x=x,
+        y=y,
+        marker=dict(
+            color=color,
+            line_width=0 if line_width is None else line_width,
+            symbol="circle" if marker is None else marker,
+            line_color=color,
+        ),
+        legendgroup=str(label),
+        name="" if label is None else label,
+        showlegend=label is not None,
+        mode="markers",
+    )
+
+
 def event_group(
     times_list,
     offset=0,
@@ -86,22 +145,119 @@ def event_group(
     if fig is None:
         fig = go.FigureWidget()
 
-    if label is not None:
-        showlegend = True
-    else:
-        showlegend = False
+    fig.add_trace(event_group_trace(times_list, offset, color, label, marker, line_width))
 
-    for i, times in enumerate(times_list):
-        if len(times):
-            fig.add_scattergl(
-                x=times,
-                y=np.ones_like(times) * (i + offset),
-                marker=dict(color=color, line_width=line_width, symbol=marker, line_color=color),
-                legendgroup=str(label),
-                name=label,
-                showlegend=showlegend,
-                mode="markers",
-            )
-            showlegend = False
+    return fig
+
+
+def set_traces(fig, traces):
+    """Show `traces` in `fig`. If `fig` already holds traces of the same types, their properties are assigned in place
+    so that the browser only receives the new data instead of rebuilding every trace.
+
+    Parameters
+    ----------
+    fig: go.FigureWidget
+    traces: list of plotly.basedatatypes.BaseTraceType
+
+    Returns
+    -------
+    go.FigureWidget
+
+    """
+    with fig.batch_update():
+        if [trace.type for trace in fig.data] == [trace.type for trace in traces]:
+            for trace, new_trace in zip(fig.data, traces):
+                props = new_trace.to_plotly_json()
+                props.pop("type", None)
+                props.pop("uid", None)
+                trace.update(props)
+        else:
+            fig.data = []
+            fig.add_traces(traces)
+    return fig
+
+
+def categorical_colorscale(colors):
+    """Colorscale mapping the integers 0 to len(colors) - 1 to `colors`, for a heatmap with zmin=-0.5 and
+    zmax=len(colors) - 0.5"""
+    n_colors = len(colors)
+    colorscale = []
+    for i, color in enumerate(colors):
+        colorscale += [[i / n_colors, color], [(i + 1) / n_colors, color]]
+    return colorscale
+
+
+def event_raster_traces(counts, window, row_groups=None, colors=("Black",), offset=0, labels=None):
+    """Traces of a binned event raster: a single heatmap, plus one empty scatter per label for the legend
+
+    Parameters
+    ----------
+    counts: numpy.ndarray
+        shape=(n_rows, n_bins), see nwbwidgets.utils.units.bin_events
+    window: [float, float]
+    row_groups: array-like, optional
+        index into `colors` of each row. By default all rows use the first color.
+    colors: list of str, optional
+    offset: float, optional
+        y value of the first row
+    labels: list of str, optional
+        legend entry of each color
+
+    Returns
+    -------
+    list of plotly.basedatatypes.BaseTraceType
+
+    """
+    if row_groups is None:
+        row_groups = np.zeros(len(counts), dtype=int)
+    n_colors = len(colors)
+
+    # the integer part of z selects the color of the row and the fractional part its opacity
+    intensity = event_intensity(counts)
+    z = np.where(counts > 0, np.asarray(row_groups)[:, np.newaxis] + 0.999 * intensity, np.nan)
+    # plotly.js only accepts colorscales running from exactly 0 to exactly 1, so each color ramps over its whole unit
+    # interval and the stops of consecutive colors meet at the same position, like in categorical_colorscale
+    colorscale = []
+    for i, color in enumerate(colors):
+        r, g, b = (int(255 * x) for x in to_rgb(color))
+        colorscale.append([i / n_colors, f"rgba({r},{g},{b},0)"])
+        colorscale.append([(i + 1) / n_colors, f"rgba({r},{g},{b},1)"])
+
+    dx = (window[1] - window[0]) / counts.shape[1]
+    traces = [
+        go.Heatmap(
+            z=z.astype("float32"),
+            x0=window[0] + dx / 2,
+            dx=dx,
+            y0=offset,
+            dy=1,
+            zmin=0,
+            zmax=n_colors,
+            colorscale=colorscale,
+            showscale=False,
+            hoverinfo="x+y",
+        )
+    ]
+
+    # heatmaps do not show up in the legend
+    if labels is not None:
+        for label, color in zip(labels, colors):
+            traces.append(go.Scattergl(x=[None], y=[None], mode="markers", marker_color=color, name=label))
+
+    return traces
+
+
+def event_raster(counts, window, row_groups=None, colors=("Black",), offset=0, fig=None, labels=None):
+    """Add a binned event raster as a single heatmap trace, see event_raster_traces
+
+    Returns
+    -------
+    go.FigureWidget
+
+    """
+    if fig is None:
+        fig = go.FigureWidget()
+
+    fig.add_traces(event_raster_traces(counts, window, row_groups, colors, offset, labels))
 
     return fig
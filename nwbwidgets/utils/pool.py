@@ -0,0 +1,134 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+_default_file_pool = None
+
+
+class NWBFilePool:
+    """Bounded LRU pool of open NWB files, keyed by path or URL.
+
+    Each entry holds the IO object, the NWBFile read from it, and the widget tree built for it once it has been
+    displayed, so that reopening a pooled file is instant. Evicted files are closed, along with their widget.
+
+    A pool can be shared by several Panels: each one marks the file it displays with `use`, and files in use are never
+    evicted, so that a Panel opening new files does not close the file another Panel is showing. The pool holds more
+    than `max_files` files while they are all in use.
+    """
+
+    def __init__(self, max_files: int = 4):
+        """
+
+        Parameters
+        ----------
+        max_files: int, optional
+            Number of files kept open
+        """
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._users = dict()  # id of a user -> key of the file it uses
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        """NWBFile opened for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry["nwbfile"]
+
+    def add(self, key: str, io, nwbfile, file=None):
+        """Pool an opened file, closing the least recently used ones beyond `max_files`
+
+        Parameters
+        ----------
+        key: str
+            Path or URL of the file
+        io: hdmf.backends.io.HDMFIO
+        nwbfile: pynwb.NWBFile
+        file: file-like, optional
+            File object `io` reads from, closed after `io` on eviction
+        """
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                evicted.append(self._entries.pop(key))
+            self._entries[key] = dict(io=io, nwbfile=nwbfile, file=file, widget=None)
+            # the new file is about to be used
+            evicted += self._pop_evicted(keep=key)
+        for entry in evicted:
+            self._close_entry(entry)
+
+    def _pop_evicted(self, keep: str = None) -> list:
+        """Remove the least recently used files that are not in use beyond `max_files`, except `keep`. Called with the
+        lock held."""
+        in_use = set(self._users.values()) | {keep}
+        evictable = [key for key in self._entries if key not in in_use]
+        n_evicted = max(len(self._entries) - self.max_files, 0)
+        return [self._entries.pop(key) for key in evictable[:n_evicted]]
+
+    def use(self, key: str, user):
+        """Mark the file `key` as displayed by `user`, e.g. a Panel, in place of the file it displayed before.
+
+        The file is kept open until `user` uses another file, is released, or is garbage collected.
+        """
+        user_id = id(user)
+        with self._lock:
+            if user_id not in self._users:
+                weakref.finalize(user, self._release, user_id)
+            self._users[user_id] = key
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            evicted = self._pop_evicted()
+        for entry in evicted:
+            self._close_entry(entry)
+
+    def release(self, user):
+        """Mark the file displayed by `user` as no longer in use"""
+        self._release(id(user))
+
+    def _release(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+            evicted = self._pop_evicted()
+        for entry in evicted:
+            self._close_entry(entry)
+
+    def get_widget(self, key: str, widget_factory):
+        """Widget tree of a pooled file, built with `widget_factory(nwbfile)` the first time"""
+        entry = self._entries[key]
+        if entry["widget"] is None:
+            entry["widget"] = widget_factory(entry["nwbfile"])
+        return entry["widget"]
+
+    @staticmethod
+    def _close_entry(entry):
+        if entry["widget"] is not None:
+            entry["widget"].close()
+        entry["io"].close()
+        if entry["file"] is not None:
+            entry["file"].close()
+
+    def close(self):
+        """Close all the pooled files"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._users.clear()
+        for entry in entries:
+            self._close_entry(entry)
+
+
+def get_default_file_pool() -> NWBFilePool:
+    """NWBFilePool shared by all the Panels that do not provide their own, so that files stay open across Panels"""
+    global _default_file_pool
+    if _default_file_pool is None:
+        _default_file_pool = NWBFilePool()
+    return _default_file_pool
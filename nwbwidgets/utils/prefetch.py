@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pynwb import TimeSeries
+
+from .cache import BlockCache, get_default_block_cache, register_block_cache
+from .memmap import get_memmap
+from .timeseries import timeseries_time_to_ind
+
+_prefetch_executor = None
+
+
+def get_prefetch_executor():
+    """Single background thread shared by all prefetchers, so that reading ahead never competes with itself"""
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nwbwidgets-prefetch")
+    return _prefetch_executor
+
+
+def is_in_memory(timeseries: TimeSeries) -> bool:
+    """Whether reading the data of `timeseries` is already free: in-memory or memory-mapped data"""
+    return isinstance(timeseries.data, (np.ndarray, list, tuple)) or get_memmap(timeseries) is not None
+
+
+class TimeWindowPrefetcher:
+    """Read the windows a user is likely to look at next into a BlockCache.
+
+    Attached to a time window controller, it predicts the next page, the previous page and the current window zoomed
+    out by a factor of 2 whenever the window changes, and reads them in a background thread. The TimeSeries are
+    registered with the cache, so `get_timeseries_in_units` and the grouped trace widgets are served from it. Pending
+    reads of windows that are no longer next are cancelled. In-memory and memory-mapped TimeSeries are ignored.
+    """
+
+    def __init__(self, time_window_controller, time_series_list, cache: BlockCache = None, executor=None):
+        """
+
+        Parameters
+        ----------
+        time_window_controller: StartAndDurationController
+        time_series_list: list of pynwb.TimeSeries
+        cache: BlockCache, optional
+            Defaults to the cache shared by all widgets.
+        executor: concurrent.futures.Executor, optional
+            Defaults to a single background thread shared by all prefetchers.
+        """
+        self.cache = get_default_block_cache() if cache is None else cache
+        self.executor = get_prefetch_executor() if executor is None else executor
+        self.time_series_list = [ts for ts in time_series_list if not is_in_memory(ts)]
+        self._futures = []
+
+        for time_series in self.time_series_list:
+            register_block_cache(time_series, self.cache)
+
+        if self.time_series_list:
+            time_window_controller.observe(self.on_window_change, "value")
+            self.prefetch(time_window_controller.value)
+
+    @staticmethod
+    def predict_windows(time_window):
+        """Windows to read ahead of `time_window`, most likely first"""
+        t0, t1 = time_window
+        duration = t1 - t0
+        return [(t1, t1 + duration), (t0 - duration, t0), (t0 - duration / 2, t1 + duration / 2)]
+
+    def on_window_change(self, change):
+        self.prefetch(change["new"])
+
+    def prefetch(self, time_window):
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+        for window in self.predict_windows(time_window):
+            for time_series in self.time_series_list:
+                self._futures.append(self.executor.submit(self.prefetch_window, time_series, window))
+
+    def prefetch_window(self, time_series: TimeSeries, time_window):
+        istart = max(timeseries_time_to_ind(time_series, time_window[0]), 0)
+        istop = max(timeseries_time_to_ind(time_series, time_window[1]), 0)
+        self.cache.prefetch(time_series.data, istart, istop)
@@ -0,0 +1,224 @@
+import weakref
+
+import numpy as np
+from pynwb import TimeSeries
+
+from .sidecar import get_sidecar_path
+
+_pyramids = weakref.WeakKeyDictionary()
+
+
+class TimeSeriesPyramid:
+    """Min/max/mean summaries of a TimeSeries at power-of-two decimation levels.
+
+    Level `i` summarizes consecutive bins of `base_factor * 2 ** i` samples. Zoomed-out views read the coarsest level
+    that still has one bin per pixel column, so their cost scales with the number of pixels instead of the number of
+    samples in the window.
+    """
+
+    STATISTICS = ("min", "max", "mean")
+
+    def __init__(self, levels, tt, n_samples: int, base_factor: int):
+        """
+
+        Parameters
+        ----------
+        levels: list of dict
+            One dict per level with keys 'min', 'max' and 'mean', each of shape (n_bins, ...)
+        tt: list of numpy.ndarray
+            Time of the first sample of each bin, one array per level
+        n_samples: int
+            Number of samples of the summarized TimeSeries
+        base_factor: int
+            Number of samples per bin at level 0
+        """
+        self.levels = levels
+        self.tt = tt
+        self.n_samples = n_samples
+        self.base_factor = base_factor
+
+    def factor(self, level: int) -> int:
+        return self.base_factor * 2**level
+
+    @classmethod
+    def build(cls, timeseries: TimeSeries, base_factor: int = 64, block_size: int = 2**20, min_bins: int = 256):
+        """Build the pyramid in a single streaming pass over the data.
+
+        Parameters
+        ----------
+        timeseries: pynwb.TimeSeries
+        base_factor: int, optional
+            Number of samples per bin at the finest level. Must be a power of two.
+        block_size: int, optional
+            Number of samples read from the dataset at once. Rounded to a multiple of `base_factor`.
+        min_bins: int, optional
+            Levels are added until the coarsest one has fewer than `min_bins` bins.
+
+        Returns
+        -------
+        TimeSeriesPyramid
+
+        """
+        data = timeseries.data
+        n_samples = len(data)
+        block_size = max(base_factor, block_size - block_size % base_factor)
+
+        mins, maxs, sums, counts = [], [], [], []
+        for istart in range(0, n_samples, block_size):
+            block = np.asarray(data[istart : istart + block_size])
+            bin_starts = np.arange(0, len(block), base_factor)
+            mins.append(np.minimum.reduceat(block, bin_starts, axis=0))
+            maxs.append(np.maximum.reduceat(block, bin_starts, axis=0))
+            sums.append(np.add.reduceat(block.astype("float64"), bin_starts, axis=0))
+            counts.append(np.diff(np.append(bin_starts, len(block))))
+
+        level = dict(
+            min=np.concatenate(mins),
+            max=np.concatenate(maxs),
+            sum=np.concatenate(sums),
+            count=np.concatenate(counts),
+        )
+        levels = []
+        while True:
+            levels.append(level)
+            n_bins = len(level["min"])
+            if n_bins < min_bins:
+                break
+            pairs = np.arange(0, n_bins, 2)
+            level = dict(
+                min=np.minimum.reduceat(level["min"], pairs, axis=0),
+                max=np.maximum.reduceat(level["max"], pairs, axis=0),
+                sum=np.add.reduceat(level["sum"], pairs, axis=0),
+                count=np.add.reduceat(level["count"], pairs),
+            )
+
+        out_levels = []
+        tt = []
+        for i, level in enumerate(levels):
+            count = level["count"].reshape((-1,) + (1,) * (level["sum"].ndim - 1))
+            out_levels.append(dict(min=level["min"], max=level["max"], mean=(level["sum"] / count).astype("float32")))
+            factor = base_factor * 2**i
+            if timeseries.timestamps is not None:
+                tt.append(np.asarray(timeseries.timestamps[::factor]))
+            else:
+                starting_time = timeseries.starting_time if np.isfinite(timeseries.starting_time) else 0
+                tt.append(np.arange(0, n_samples, factor) / timeseries.rate + starting_time)
+
+        return cls(out_levels, tt, n_samples, base_factor)
+
+    def save(self, path):
+        arrays = dict(n_samples=self.n_samples, base_factor=self.base_factor, n_levels=len(self.levels))
+        for i, level in enumerate(self.levels):
+            arrays.update({f"level{i}_{stat}": level[stat] for stat in self.STATISTICS})
+            arrays[f"level{i}_tt"] = self.tt[i]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            n_levels = int(f["n_levels"])
+            levels = [{stat: f[f"level{i}_{stat}"] for stat in cls.STATISTICS} for i in range(n_levels)]
+            tt = [f[f"level{i}_tt"] for i in range(n_levels)]
+            return cls(levels, tt, int(f["n_samples"]), int(f["base_factor"]))
+
+    def select_level(self, n_samples: int, n_bins: int = 1000):
+        """Coarsest level that still has at least `n_bins` bins over a window of `n_samples` samples, or None if the
+        window should be read at full resolution."""
+        ratio = n_samples / (n_bins * self.base_factor)
+        if ratio < 1:
+            return None
+        return min(int(np.log2(ratio)), len(self.levels) - 1)
+
+    def _get_bins(self, istart: int, istop: int, level: int, columns=None, n_bins: int = None):
+        factor = self.factor(level)
+        bins = slice(istart // factor, int(np.ceil(istop / factor)))
+        tt = self.tt[level][bins]
+        stats = {stat: self.levels[level][stat][bins] for stat in self.STATISTICS}
+        if columns is not None:
+            stats = {stat: values[:, columns] for stat, values in stats.items()}
+        if n_bins is not None and len(tt) > n_bins:
+            # merge consecutive bins, so that the mean of each merged bin is still exact
+            groups = np.arange(0, len(tt), int(np.ceil(len(tt) / n_bins)))
+            sizes = np.diff(np.append(groups, len(tt))).reshape((-1,) + (1,) * (stats["mean"].ndim - 1))
+            tt = tt[groups]
+            stats = dict(
+                min=np.minimum.reduceat(stats["min"], groups, axis=0),
+                max=np.maximum.reduceat(stats["max"], groups, axis=0),
+                mean=(np.add.reduceat(stats["mean"].astype("float64"), groups, axis=0) / sizes).astype("float32"),
+            )
+        return tt, stats
+
+    def get_envelope(self, istart: int, istop: int, level: int, columns=None, n_bins: int = None):
+        """Min/max envelope of a window read from a given level.
+
+        Parameters
+        ----------
+        istart: int
+        istop: int
+        level: int
+        columns: array-like, optional
+            Sub-select the second dimension of the data
+        n_bins: int, optional
+            Merge consecutive bins of the level so that the window has at most `n_bins` bins
+
+        Returns
+        -------
+        tt: numpy.ndarray
+            shape=(2 * n_bins,). Start time of each bin, repeated for its min and its max.
+        data: numpy.ndarray
+            shape=(2 * n_bins, ...). min and max of each bin, interleaved.
+
+        """
+        tt, stats = self._get_bins(istart, istop, level, columns, n_bins)
+        mins, maxs = stats["min"], stats["max"]
+        data = np.stack([mins, maxs], axis=1).reshape((2 * len(mins),) + mins.shape[1:])
+        return np.repeat(tt, 2), data
+
+    def get_mean(self, istart: int, istop: int, level: int, columns=None, n_bins: int = None):
+        """Mean of each bin of the envelope returned by `get_envelope` with the same arguments.
+
+        Returns
+        -------
+        numpy.ndarray
+            shape=(2 * n_bins, ...). Mean of each bin, repeated for its min and its max.
+
+        """
+        _, stats = self._get_bins(istart, istop, level, columns, n_bins)
+        return np.repeat(stats["mean"], 2, axis=0)
+
+
+def register_pyramid(timeseries: TimeSeries, pyramid: TimeSeriesPyramid):
+    """Make `get_timeseries_envelope_in_units` and the grouped trace widgets read `timeseries` from `pyramid`"""
+    _pyramids[timeseries] = pyramid
+
+
+def get_pyramid(timeseries: TimeSeries):
+    return _pyramids.get(timeseries)
+
+
+def load_or_build_pyramid(timeseries: TimeSeries, cache_path: str = "nwb-cache", **kwargs) -> TimeSeriesPyramid:
+    """Load the pyramid of `timeseries` from its sidecar file, building and saving it first if needed, and register
+    it so that the trace widgets use it.
+
+    Parameters
+    ----------
+    timeseries: pynwb.TimeSeries
+    cache_path: str, optional
+        Directory of the sidecar files. Defaults to "nwb-cache", like the Panel.
+    kwargs:
+        passed to TimeSeriesPyramid.build
+
+    Returns
+    -------
+    TimeSeriesPyramid
+
+    """
+    path = get_sidecar_path(timeseries, ".pyramid.npz", cache_path=cache_path)
+    if path.exists():
+        pyramid = TimeSeriesPyramid.load(path)
+    else:
+        pyramid = TimeSeriesPyramid.build(timeseries, **kwargs)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pyramid.save(path)
+    register_pyramid(timeseries, pyramid)
+    return pyramid
@@ -0,0 +1,329 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pynwb.ophys import PlaneSegmentation
+from skimage import measure
+
+from .sidecar import get_sidecar_path
+
+
+def compute_outline(image_mask, threshold: float = 0.01):
+    """Outline of an ROI: the first contour of its image mask at `threshold`.
+
+    Returns
+    -------
+    x, y: numpy.ndarray
+        Vertices of the outline, along the first and second axis of the mask. Empty if the mask has no contour.
+
+    """
+    contours = measure.find_contours(np.asarray(image_mask), threshold)
+    if not contours:
+        return np.empty(0), np.empty(0)
+    return contours[0][:, 0], contours[0][:, 1]
+
+
+def iter_mask_blocks(image_masks, block_bytes: int = 2**26):
+    """Read image masks in blocks of about `block_bytes` bytes, made of whole chunks if the dataset is chunked
+
+    Yields
+    ------
+    numpy.ndarray
+        of shape (n_block_rois, width, height)
+
+    """
+    if not hasattr(image_masks, "shape"):
+        image_masks = np.asarray(image_masks)
+    mask_bytes = max(int(np.prod(image_masks.shape[1:])) * image_masks.dtype.itemsize, 1)
+    block_rois = max(block_bytes // mask_bytes, 1)
+    chunks = getattr(image_masks, "chunks", None)
+    if chunks:
+        block_rois = max(block_rois // chunks[0], 1) * chunks[0]
+    for start in range(0, len(image_masks), block_rois):
+        yield np.asarray(image_masks[start : start + block_rois])
+
+
+def _compute_block_outlines(image_masks, threshold):
+    return [compute_outline(image_mask, threshold) for image_mask in image_masks]
+
+
+class RoiOutlines:
+    """Outlines of the ROIs of a PlaneSegmentation, stored as flat vertex arrays.
+
+    The vertices of ROI `i` are `x[offsets[i]:offsets[i + 1]]` and `y[offsets[i]:offsets[i + 1]]`, so that the outlines
+    of any group of ROIs can be merged into a single NaN-separated trace without a loop in Python.
+    """
+
+    def __init__(self, x, y, offsets):
+        """
+
+        Parameters
+        ----------
+        x, y: numpy.ndarray
+            Vertices of all the outlines, concatenated
+        offsets: numpy.ndarray
+            Start of the vertices of each ROI, plus the total number of vertices, of shape (n_rois + 1,)
+        """
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get_outline(self, index: int):
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return self.x[start:stop], self.y[start:stop]
+
+    def merge(self, indices=None):
+        """Outlines of the ROIs `indices`, all of them by default, separated by NaNs so that they form a single trace.
+
+        Returns
+        -------
+        x, y: numpy.ndarray
+        roi_indices: numpy.ndarray
+            Index of the ROI of each vertex, -1 for the separators
+
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.asarray(indices, dtype=int)
+        lengths = self.offsets[indices + 1] - self.offsets[indices]
+        # each outline is followed by one NaN separator
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        source = np.repeat(self.offsets[indices], lengths) + within
+        destination = np.repeat(np.cumsum(lengths + 1) - (lengths + 1), lengths) + within
+
+        x = np.full(lengths.sum() + len(indices), np.nan)
+        y = np.full(lengths.sum() + len(indices), np.nan)
+        roi_indices = np.full(lengths.sum() + len(indices), -1)
+        x[destination] = self.x[source]
+        y[destination] = self.y[source]
+        roi_indices[destination] = np.repeat(indices, lengths)
+        return x, y, roi_indices
+
+    @classmethod
+    def compute(
+        cls,
+        image_masks,
+        threshold: float = 0.01,
+        block_bytes: int = 2**26,
+        max_workers: int = None,
+        min_parallel_rois: int = 10000,
+        on_progress=None,
+    ):
+        """Extract the outlines of all the ROIs.
+
+        Image masks are read in blocks of whole chunks, and the contours of each block are extracted in a process pool
+        while the next blocks are read.
+
+        Parameters
+        ----------
+        image_masks: array-like
+            of shape (n_rois, width, height), e.g. the data of the image_mask column of a PlaneSegmentation
+        threshold: float, optional
+        block_bytes: int, optional
+            Approximate number of bytes of image masks read at once
+        max_workers: int, optional
+            Number of processes. Defaults to the number of CPUs. Set to 1 to extract the contours in this process.
+        min_parallel_rois: int, optional
+            Contours of fewer ROIs are extracted in this process. The image masks are sent to the workers, which costs
+            about as much as extracting their contours, so the pool only pays off for very large segmentations.
+        on_progress: callable, optional
+            Called with the number of ROIs of each block once its outlines are extracted
+
+        Returns
+        -------
+        RoiOutlines
+
+        """
+        n_rois = len(image_masks)
+        blocks = iter_mask_blocks(image_masks, block_bytes)
+
+        max_workers = max_workers or os.cpu_count() or 1
+
+        outlines = []
+        if n_rois < min_parallel_rois or max_workers == 1:
+            for block in blocks:
+                outlines += _compute_block_outlines(block, threshold)
+                if on_progress is not None:
+                    on_progress(len(block))
+        else:
+            # spawned workers do not inherit the threads of the kernel, unlike forked ones
+            context = multiprocessing.get_context("spawn")
+
+            def collect(future):
+                block_outlines = future.result()
+                if on_progress is not None:
+                    on_progress(len(block_outlines))
+                return block_outlines
+
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+                # bound the number of blocks held in memory
+                max_pending = 2 * max_workers
+                pending = deque()
+                for block in blocks:
+                    pending.append(executor.submit(_compute_block_outlines, block, threshold))
+                    while len(pending) >= max_pending:
+                        outlines += collect(pending.popleft())
+                while pending:
+                    outlines += collect(pending.popleft())
+
+        lengths = [len(x) for x, _ in outlines]
+        offsets = np.r_[0, np.cumsum(lengths)].astype(int)
+        x = np.concatenate([x for x, _ in outlines]) if outlines else np.empty(0)
+        y = np.concatenate([y for _, y in outlines]) if outlines else np.empty(0)
+        return cls(x, y, offsets)
+
+    def save(self, path):
+        np.savez(path, x=self.x, y=self.y, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz["x"], npz["y"], npz["offsets"])
+
+
+def load_or_compute_outlines(
+    plane_seg: PlaneSegmentation, threshold: float = 0.01, cache_path: str = "nwb-cache", **kwargs
+) -> RoiOutlines:
+    """Load the ROI outlines of `plane_seg` from their sidecar file, extracting and saving them first if needed.
+
+    The sidecar file is keyed by the object_id of the image_mask column. Outlines of a PlaneSegmentation that was not
+    read from a file are not saved.
+
+    Parameters
+    ----------
+    plane_seg: pynwb.ophys.PlaneSegmentation
+    threshold: float, optional
+    cache_path: str, optional
+        Directory of the sidecar files. Defaults to "nwb-cache", like the Panel. Set to None to never save outlines.
+    kwargs:
+        passed to RoiOutlines.compute
+
+    Returns
+    -------
+    RoiOutlines
+
+    """
+    image_mask = plane_seg["image_mask"]
+    if cache_path is None or image_mask.container_source is None:
+        return RoiOutlines.compute(image_mask.data, threshold=threshold, **kwargs)
+
+    path = get_sidecar_path(image_mask, f".outlines-{threshold:g}.npz", cache_path=cache_path)
+    if path.exists():
+        return RoiOutlines.load(path)
+    outlines = RoiOutlines.compute(image_mask.data, threshold=threshold, **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    outlines.save(path)
+    return outlines
+
+
+class SparseRoiMasks:
+    """Masks of ROIs in compressed sparse row form, so that memory scales with the number of ROI pixels instead of the
+    number of ROIs times the size of the field of view.
+
+    The pixels of ROI `i` have the flat indices `indices[indptr[i]:indptr[i + 1]]` in an image of shape `shape`, and
+    the weights `weights[indptr[i]:indptr[i + 1]]`.
+    """
+
+    def __init__(self, indptr, indices, weights, shape):
+        """
+
+        Parameters
+        ----------
+        indptr: numpy.ndarray
+            of shape (n_rois + 1,)
+        indices: numpy.ndarray
+            Flat indices of the pixels of all the ROIs, concatenated
+        weights: numpy.ndarray
+            Weights of the pixels of all the ROIs, concatenated
+        shape: tuple of int
+            Shape of the field of view
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.shape = tuple(shape)
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    @classmethod
+    def from_image_masks(cls, image_masks, block_bytes: int = 2**26):
+        """Build the sparse masks from dense image masks of shape (n_rois, width, height), read block by block"""
+        indptr = [np.zeros(1, dtype=int)]
+        indices = []
+        weights = []
+        for block in iter_mask_blocks(image_masks, block_bytes):
+            flat = block.reshape(len(block), -1)
+            rois, pixels = np.nonzero(flat)
+            indptr.append(indptr[-1][-1] + np.cumsum(np.bincount(rois, minlength=len(block))))
+            indices.append(pixels)
+            weights.append(flat[rois, pixels])
+        shape = np.shape(image_masks[0]) if len(image_masks) else (0, 0)
+        return cls(
+            np.concatenate(indptr),
+            np.concatenate(indices) if indices else np.empty(0, dtype=int),
+            np.concatenate(weights) if weights else np.empty(0),
+            shape,
+        )
+
+    @classmethod
+    def from_pixel_masks(cls, pixel_mask, pixel_mask_index, shape=None):
+        """Build the sparse masks from the pixel_mask column of a PlaneSegmentation
+
+        Parameters
+        ----------
+        pixel_mask: array-like
+            (x, y, weight) of the pixels of all the ROIs, as rows or as a structured array
+        pixel_mask_index: array-like
+            End of the pixels of each ROI in `pixel_mask`
+        shape: tuple of int, optional
+            Shape of the field of view. Defaults to the smallest one holding all the pixels.
+        """
+        pixels = np.asarray(pixel_mask[:])
+        if pixels.dtype.names is not None:
+            x, y, weights = (pixels[name] for name in pixels.dtype.names[:3])
+        else:
+            pixels = pixels.reshape(-1, 3)
+            x, y, weights = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+        x = x.astype(int)
+        y = y.astype(int)
+        if shape is None:
+            shape = (x.max() + 1, y.max() + 1) if len(x) else (0, 0)
+        indptr = np.r_[0, np.asarray(pixel_mask_index[:], dtype=int)]
+        return cls(indptr, np.ravel_multi_index((x, y), shape), weights.astype(float), shape)
+
+    @classmethod
+    def from_plane_segmentation(cls, plane_seg: PlaneSegmentation, **kwargs):
+        """Build the sparse masks from the image_mask column of `plane_seg`, or from its pixel_mask column"""
+        if "image_mask" in plane_seg:
+            return cls.from_image_masks(plane_seg["image_mask"].data, **kwargs)
+        pixel_mask_index = plane_seg["pixel_mask"]
+        return cls.from_pixel_masks(pixel_mask_index.target.data, pixel_mask_index.data, **kwargs)
+
+    def get_roi_indices(self) -> np.ndarray:
+        """Index of the ROI of each pixel"""
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def label_image(self, threshold: float = 0.0) -> np.ndarray:
+        """Integer image of the index of the ROI of each pixel, -1 for the background. Where ROIs overlap, the pixel
+        goes to the ROI with the largest weight, and to the last of them for equal weights.
+        """
+        keep = self.weights > threshold
+        # by decreasing weight, then by decreasing ROI index, since the indices are sorted by ROI
+        order = np.argsort(self.weights[keep], kind="stable")[::-1]
+        indices = self.indices[keep][order]
+        roi_indices = self.get_roi_indices()[keep][order]
+        # the first occurrence of each pixel is its ROI
+        pixels, first = np.unique(indices, return_index=True)
+        labels = np.full(int(np.prod(self.shape)), -1, dtype=int)
+        labels[pixels] = roi_indices[first]
+        return labels.reshape(self.shape)
@@ -0,0 +1,28 @@
+import hashlib
+from pathlib import Path
+
+from hdmf.container import AbstractContainer
+
+
+def get_sidecar_path(node: AbstractContainer, suffix: str, cache_path: str = "nwb-cache") -> Path:
+    """Path of a sidecar file holding precomputed data for an NWB object.
+
+    Sidecar files live next to the streaming cache and are keyed by the path of the source file plus the object_id of
+    the node, so that they are reused across sessions but never shared between two different files.
+
+    Parameters
+    ----------
+    node: hdmf.container.AbstractContainer
+    suffix: str
+        e.g. '.pyramid.npz'
+    cache_path: str, optional
+        Directory where the sidecar files are stored. Defaults to "nwb-cache", like the Panel.
+
+    Returns
+    -------
+    pathlib.Path
+
+    """
+    source = str(node.container_source) if node.container_source is not None else "in-memory"
+    source_hash = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return Path(cache_path) / f"{node.object_id}-{source_hash}{suffix}"
@@ -0,0 +1,681 @@
+import asyncio
+import hashlib
+import io
+import itertools
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+_remote_files = weakref.WeakValueDictionary()
+_range_caches = dict()  # resolved cache_path -> RangeCache
+_range_caches_lock = threading.Lock()
+_default_fetcher = None
+
+
+class RangeCache:
+    """Two-tier LRU cache of fixed-size byte blocks of remote files, keyed by URL and block index.
+
+    Recently used blocks are kept in RAM; every block is also written to a bounded directory on disk, so that reopening
+    an asset in a later session does not download it again. Both tiers evict their least recently used blocks once
+    they exceed their byte budget. Pinned blocks count against the RAM budget, and the metadata snapshots saved in the
+    "snapshots" directory against the disk budget. Consecutive missing blocks are fetched with a single range request.
+
+    Blocks are keyed by the URL given to `read`; CachedRemoteFile appends the version of the remote file to it, so
+    that the blocks of a file that changed are not served.
+    """
+
+    def __init__(
+        self,
+        cache_path: str = "nwb-cache",
+        memory_bytes: int = 2**28,
+        disk_bytes: int = 2**32,
+        block_size: int = 2**20,
+    ):
+        """
+
+        Parameters
+        ----------
+        cache_path: str, optional
+            Blocks are stored in the "blocks" subdirectory and metadata snapshots in the "snapshots" subdirectory.
+            Defaults to "nwb-cache", like the Panel.
+        memory_bytes: int, optional
+            Budget of the RAM tier. Default: 256 MiB.
+        disk_bytes: int, optional
+            Budget of the disk tier, blocks and snapshots included. Set to 0 to disable it, in which case no snapshot
+            is saved either. Default: 4 GiB.
+        block_size: int, optional
+            Default: 1 MiB.
+        """
+        self.blocks_path = Path(cache_path) / "blocks"
+        self.snapshots_path = Path(cache_path) / "snapshots"
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.block_size = block_size
+
+        self.memory = OrderedDict()
+        self.memory_nbytes = 0
+        self.disk = OrderedDict()  # path -> size
+        self.disk_nbytes = 0
+        self.pinned = dict()
+        self.pinned_nbytes = 0
+        self._pin_counts = dict()  # url -> number of pin calls not undone by unpin
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._recordings = dict()
+        self._lock = threading.Lock()
+
+        if self.disk_bytes:
+            self.blocks_path.mkdir(parents=True, exist_ok=True)
+            # resume the LRU order of a previous session from the modification times
+            paths = list(self.blocks_path.glob("*.bin")) + list(self.snapshots_path.glob("*.npz"))
+            for path in sorted(paths, key=lambda p: p.stat().st_mtime):
+                self.disk[path] = path.stat().st_size
+                self.disk_nbytes += self.disk[path]
+            self._evict_disk()
+
+    @property
+    def stats(self) -> dict:
+        return dict(
+            memory_hits=self.memory_hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            memory_nbytes=self.memory_nbytes,
+            disk_nbytes=self.disk_nbytes,
+            pinned_nbytes=self.pinned_nbytes,
+        )
+
+    def _get_block_path(self, url: str, block: int) -> Path:
+        url_hash = hashlib.sha1(url.encode()).hexdigest()[:16]
+        return self.blocks_path / f"{url_hash}-{self.block_size}-{block}.bin"
+
+    def _get(self, url: str, block: int):
+        key = (url, block)
+        path = self._get_block_path(url, block)
+        with self._lock:
+            if key in self.pinned:
+                self.memory_hits += 1
+                return self.pinned[key]
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+            on_disk = path in self.disk
+            if on_disk:
+                self.disk.move_to_end(path)
+        if not on_disk:
+            return None
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another thread in the meantime
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._put_memory(key, data)
+        return data
+
+    def _put_memory(self, key, data: bytes):
+        with self._lock:
+            if key in self.memory:
+                return
+            self.memory[key] = data
+            self.memory_nbytes += len(data)
+            self._evict_memory()
+
+    def _evict_memory(self):
+        # called with the lock held
+        while self.memory_nbytes + self.pinned_nbytes > self.memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_nbytes -= len(evicted)
+
+    def _put_disk(self, path: Path, data: bytes):
+        if not self.disk_bytes:
+            return
+        path.write_bytes(data)
+        self.add_disk_file(path)
+
+    def add_disk_file(self, path: Path):
+        """Count a file written under the cache directory, e.g. a metadata snapshot, against the disk budget, as the
+        most recently used entry"""
+        path = Path(path)
+        size = path.stat().st_size
+        with self._lock:
+            self.disk_nbytes += size - self.disk.pop(path, 0)
+            self.disk[path] = size
+        self._evict_disk()
+
+    def touch_disk_file(self, path: Path):
+        """Mark a file of the disk tier as used"""
+        path = Path(path)
+        with self._lock:
+            if path in self.disk:
+                self.disk.move_to_end(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        evicted = []
+        with self._lock:
+            while self.disk_nbytes > self.disk_bytes and len(self.disk) > 0:
+                path, size = self.disk.popitem(last=False)
+                self.disk_nbytes -= size
+                evicted.append(path)
+        for path in evicted:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def read(self, url: str, start: int, stop: int, fetch) -> bytes:
+        """Read bytes [start, stop) of `url`.
+
+        Parameters
+        ----------
+        url: str
+        start: int
+        stop: int
+        fetch: callable
+            fetch(start, stop) -> bytes, reads a byte range from the remote file. Called with block-aligned ranges
+            and must clip `stop` to the size of the file.
+
+        Returns
+        -------
+        bytes
+
+        """
+        if stop <= start:
+            return b""
+        first = start // self.block_size
+        blocks = list(range(first, int(np.ceil(stop / self.block_size))))
+        found = {block: self._get(url, block) for block in blocks}
+
+        missing = [block for block in blocks if found[block] is None]
+        if missing:
+            runs = self._get_missing_runs(missing)
+            datas = [fetch(start, stop) for start, stop in runs]
+            found.update(self._store_runs(url, runs, datas))
+
+        recording = self._recordings.get(url)
+        if recording is not None:
+            recording.update(found)
+
+        data = b"".join(found[block] for block in blocks)
+        offset = first * self.block_size
+        return data[start - offset : stop - offset]
+
+    def prefetch(self, url: str, ranges, fetch_many):
+        """Load the blocks covering several byte ranges of `url`, fetching all the missing ones in one call.
+
+        Parameters
+        ----------
+        url: str
+        ranges: list of (int, int)
+            (start, stop) byte ranges
+        fetch_many: callable
+            fetch_many(ranges) -> list of bytes, reads several block-aligned byte ranges from the remote file and must
+            clip them to the size of the file.
+        """
+        blocks = set()
+        for start, stop in ranges:
+            blocks.update(range(start // self.block_size, int(np.ceil(stop / self.block_size))))
+        missing = [block for block in sorted(blocks) if self._get(url, block) is None]
+        if missing:
+            runs = self._get_missing_runs(missing)
+            self._store_runs(url, runs, fetch_many(runs))
+
+    def _get_missing_runs(self, missing):
+        """Merge missing blocks into (start, stop) byte ranges of consecutive blocks"""
+        with self._lock:
+            self.misses += len(missing)
+        runs = np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1)
+        return [(int(run[0]) * self.block_size, (int(run[-1]) + 1) * self.block_size) for run in runs]
+
+    def _store_runs(self, url: str, runs, datas) -> dict:
+        stored = dict()
+        for (start, stop), data in zip(runs, datas):
+            for i, block in enumerate(range(start // self.block_size, stop // self.block_size)):
+                block_data = data[i * self.block_size : (i + 1) * self.block_size]
+                stored[block] = block_data
+                self._put_memory((url, block), block_data)
+                self._put_disk(self._get_block_path(url, block), block_data)
+        return stored
+
+    @contextmanager
+    def record(self, url: str):
+        """Context manager yielding a dict that collects {block index: bytes} of all the blocks of `url` read
+        within it"""
+        recording = dict()
+        self._recordings[url] = recording
+        try:
+            yield recording
+        finally:
+            del self._recordings[url]
+
+    def pin(self, url: str, blocks: dict):
+        """Keep blocks of `url` in memory outside of the LRU, so that they are not evicted nor fetched again until
+        `unpin` is called as many times as `pin`. Pinned blocks count against the RAM budget, so the LRU shrinks to
+        make room for them."""
+        with self._lock:
+            self._pin_counts[url] = self._pin_counts.get(url, 0) + 1
+            for block, data in blocks.items():
+                key = (url, int(block))
+                if key not in self.pinned:
+                    self.pinned[key] = data
+                    self.pinned_nbytes += len(data)
+            self._evict_memory()
+
+    def unpin(self, url: str):
+        """Release the blocks pinned by one call to `pin` for `url`, e.g. when the file is closed"""
+        with self._lock:
+            count = self._pin_counts.get(url, 0) - 1
+            if count > 0:
+                self._pin_counts[url] = count
+                return
+            self._pin_counts.pop(url, None)
+            for key in [key for key in self.pinned if key[0] == url]:
+                self.pinned_nbytes -= len(self.pinned.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self.pinned.clear()
+            self.pinned_nbytes = 0
+            self._pin_counts.clear()
+            self.memory.clear()
+            self.memory_nbytes = 0
+            paths = list(self.disk)
+            self.disk.clear()
+            self.disk_nbytes = 0
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class CachedRemoteFile(io.RawIOBase):
+    """Read-only file-like object over a remote file whose reads go through a RangeCache. Can be passed to h5py.File
+
+    The blocks of the file are cached under its URL and its version, i.e. the ETag or Last-Modified header of the
+    server (the modification time for local filesystems), so that a file that changed is downloaded again.
+    """
+
+    def __init__(self, url: str, cache: RangeCache, fs=None, fetcher=None):
+        """
+
+        Parameters
+        ----------
+        url: str
+        cache: RangeCache
+        fs: fsspec.AbstractFileSystem, optional
+            Filesystem used to read the byte ranges. Defaults to fsspec's http filesystem.
+        fetcher: ParallelRangeFetcher, optional
+            If given, `prefetch` requests its ranges concurrently.
+        """
+        super().__init__()
+        self.url = url
+        self.cache = cache
+        if fs is None:
+            import fsspec
+
+            fs = fsspec.filesystem("http")
+        self.fs = fs
+        self.fetcher = fetcher
+        info = self.fs.info(url)
+        self.size = info["size"]
+        version = info.get("ETag") or info.get("Last-Modified") or info.get("mtime")
+        self.version = None if version is None else str(version)
+        # key of the blocks of this version of the file in the cache
+        self.key = url if self.version is None else f"{url}#{self.version}"
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError("invalid whence ({}, should be 0, 1 or 2)".format(whence))
+        return self._position
+
+    def _fetch(self, start, stop):
+        return self.fs.cat_file(self.url, start=start, end=min(stop, self.size))
+
+    def _fetch_many(self, ranges):
+        ranges = [(start, min(stop, self.size)) for start, stop in ranges]
+        if self.fetcher is None:
+            return [self._fetch(start, stop) for start, stop in ranges]
+        return self.fetcher.fetch(self.url, ranges)
+
+    def prefetch(self, ranges):
+        """Load several byte ranges into the cache at once, see RangeCache.prefetch"""
+        self.cache.prefetch(self.key, ranges, self._fetch_many)
+
+    def readinto(self, buffer):
+        stop = min(self._position + len(buffer), self.size)
+        data = self.cache.read(self.key, self._position, stop, self._fetch)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            # release the metadata snapshot pinned by use_metadata_snapshot, if any
+            self.cache.unpin(self.key)
+        super().close()
+
+
+class MetadataSnapshot:
+    """Bytes of the blocks of a remote file that are read while opening it.
+
+    Opening an NWB file walks its whole HDF5 object tree: superblock, object headers, attributes, link tables and
+    B-tree nodes, scattered over many small reads. A snapshot taken on first open is saved under the cache directory
+    and pinned in the RangeCache on the next opens, so that `NWBHDF5IO.read()` runs without going over the network and
+    only data reads remain.
+    """
+
+    def __init__(self, size: int, block_size: int, blocks: dict, version: str = None):
+        """
+
+        Parameters
+        ----------
+        size: int
+            Size of the remote file, used to detect that it changed
+        block_size: int
+            Block size of the RangeCache the snapshot was taken with
+        blocks: dict
+            {block index: bytes}
+        version: str, optional
+            ETag or Last-Modified header of the remote file, used to detect that it changed
+        """
+        self.size = size
+        self.block_size = block_size
+        self.blocks = blocks
+        self.version = version
+
+    def matches(self, remote_file: "CachedRemoteFile") -> bool:
+        """Whether the snapshot was taken from the current version of `remote_file`, with the same block size"""
+        return (
+            self.size == remote_file.size
+            and self.version == remote_file.version
+            and self.block_size == remote_file.cache.block_size
+        )
+
+    def save(self, path):
+        indices = np.array(sorted(self.blocks), dtype="int64")
+        contents = [self.blocks[block] for block in indices]
+        np.savez(
+            path,
+            size=self.size,
+            block_size=self.block_size,
+            version="" if self.version is None else self.version,
+            indices=indices,
+            lengths=np.array([len(content) for content in contents], dtype="int64"),
+            contents=np.frombuffer(b"".join(contents), dtype="uint8"),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            contents = f["contents"].tobytes()
+            offsets = np.concatenate([[0], np.cumsum(f["lengths"])])
+            blocks = {int(block): contents[offsets[i] : offsets[i + 1]] for i, block in enumerate(f["indices"])}
+            # snapshots saved without a version never match a versioned file, and are taken again
+            version = str(f["version"]) if "version" in f else None
+            return cls(int(f["size"]), int(f["block_size"]), blocks, version=version or None)
+
+
+def get_snapshot_path(url: str, cache_path: str = "nwb-cache") -> Path:
+    url_hash = hashlib.sha1(url.encode()).hexdigest()[:16]
+    return Path(cache_path) / "snapshots" / f"{url_hash}.metadata.npz"
+
+
+@contextmanager
+def use_metadata_snapshot(remote_file: "CachedRemoteFile", cache_path: str = "nwb-cache"):
+    """Serve the metadata reads of opening `remote_file` from its snapshot, or take the snapshot if there is none.
+
+    Wrap the opening of the file (e.g. `NWBHDF5IO.read()`) in this context manager. The snapshot is pinned in the cache
+    until `remote_file` is closed. A snapshot of another version of the file is taken again. Snapshots count against
+    the disk budget of the cache, and are not saved when its disk tier is disabled.
+
+    Parameters
+    ----------
+    remote_file: CachedRemoteFile
+    cache_path: str, optional
+        Snapshots are stored in the "snapshots" subdirectory. Defaults to "nwb-cache", like the Panel.
+    """
+    cache = remote_file.cache
+    path = get_snapshot_path(remote_file.url, cache_path=cache_path)
+    if path.exists():
+        snapshot = MetadataSnapshot.load(path)
+        if snapshot.matches(remote_file):
+            cache.touch_disk_file(path)
+            cache.pin(remote_file.key, snapshot.blocks)
+            yield snapshot
+            return
+
+    with cache.record(remote_file.key) as blocks:
+        yield None
+    if not cache.disk_bytes:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    MetadataSnapshot(remote_file.size, cache.block_size, blocks, version=remote_file.version).save(path)
+    cache.add_disk_file(path)
+
+
+class ParallelRangeFetcher:
+    """Fetch many byte ranges of a URL concurrently over a pooled aiohttp session.
+
+    The session lives on an event loop running in a background thread, so that `fetch` can be called from synchronous
+    code (e.g. an h5py read) while the kernel's own event loop is running. Both are started by the first fetch, and
+    stopped by `close`, or once the last of its users, e.g. Panels, is released, see `use`.
+    """
+
+    def __init__(self, max_connections: int = 8):
+        self.max_connections = max_connections
+        self._loop = None
+        self._sessions = dict()  # event loop -> its session, only used on that loop
+        self._users = set()  # ids of the users
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _run_loop(loop):
+        loop.run_forever()
+        loop.close()
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._run_loop, args=(self._loop,), name="nwbwidgets-fetch", daemon=True
+                ).start()
+            return self._loop
+
+    async def _fetch_range(self, url: str, start: int, stop: int) -> bytes:
+        async with self._sessions[asyncio.get_running_loop()].get(
+            url, headers=dict(Range=f"bytes={start}-{stop - 1}")
+        ) as response:
+            response.raise_for_status()
+            data = await response.read()
+        if response.status == 200:
+            # the server ignored the Range header and sent the whole file
+            data = data[start:stop]
+        return data
+
+    async def _fetch_all(self, url: str, ranges):
+        loop = asyncio.get_running_loop()
+        if loop not in self._sessions:
+            import aiohttp
+
+            self._sessions[loop] = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+        return await asyncio.gather(*[self._fetch_range(url, start, stop) for start, stop in ranges])
+
+    def fetch(self, url: str, ranges) -> list:
+        """Fetch several (start, stop) byte ranges of `url` concurrently, and return their contents in order"""
+        if not ranges:
+            return []
+        return asyncio.run_coroutine_threadsafe(self._fetch_all(url, ranges), self._get_loop()).result()
+
+    def use(self, user):
+        """Mark the fetcher as used by `user`, e.g. a Panel, until `user` is released or garbage collected"""
+        user_id = id(user)
+        with self._lock:
+            if user_id not in self._users:
+                weakref.finalize(user, self._release, user_id)
+            self._users.add(user_id)
+
+    def release(self, user):
+        """Mark the fetcher as no longer used by `user`, and close its session once it has no user left"""
+        self._release(id(user))
+
+    def _release(self, user_id: int):
+        with self._lock:
+            if user_id not in self._users:
+                return
+            self._users.discard(user_id)
+            if self._users:
+                return
+        self.close()
+
+    async def _shutdown(self):
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+        asyncio.get_running_loop().stop()
+
+    def close(self):
+        """Close the session and stop its event loop, without waiting, e.g. when closed from a finalizer. A later fetch
+        starts new ones."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop)
+
+
+def get_range_cache(
+    cache_path: str = "nwb-cache",
+    memory_bytes: int = 2**28,
+    disk_bytes: int = 2**32,
+    block_size: int = 2**20,
+) -> RangeCache:
+    """RangeCache of `cache_path`, shared by all its users, so that the disk budget holds for the whole directory.
+
+    The cache is created with the given budgets by the first call for `cache_path`; later calls return it unchanged.
+    See RangeCache for the parameters.
+    """
+    key = Path(cache_path).resolve()
+    with _range_caches_lock:
+        if key not in _range_caches:
+            _range_caches[key] = RangeCache(
+                cache_path=cache_path, memory_bytes=memory_bytes, disk_bytes=disk_bytes, block_size=block_size
+            )
+        return _range_caches[key]
+
+
+def get_default_fetcher() -> ParallelRangeFetcher:
+    """ParallelRangeFetcher shared by all the Panels, so that they share its connections and event loop thread"""
+    global _default_fetcher
+    with _range_caches_lock:
+        if _default_fetcher is None:
+            _default_fetcher = ParallelRangeFetcher()
+        return _default_fetcher
+
+
+def register_remote_file(file: h5py.File, remote_file: CachedRemoteFile):
+    """Make `prefetch_chunks` fetch the chunks of the datasets of `file` through `remote_file`"""
+    _remote_files[file.filename] = remote_file
+
+
+def _get_chunk_indices(selection, length: int, chunk_length: int) -> np.ndarray:
+    if isinstance(selection, slice):
+        start, stop, _ = selection.indices(length)
+        return np.arange(start // chunk_length, int(np.ceil(stop / chunk_length)))
+    selection = np.asarray(selection)
+    if selection.dtype == bool:
+        selection = np.flatnonzero(selection)
+    return np.unique(np.atleast_1d(selection) % length // chunk_length)
+
+
+def get_chunk_byte_ranges(dataset: h5py.Dataset, selection) -> list:
+    """Byte ranges of the chunks of an h5py dataset that a selection touches, in file order.
+
+    Parameters
+    ----------
+    dataset: h5py.Dataset
+    selection: slice, int, array-like or tuple of those
+        One entry per dimension, as would be passed to `dataset[selection]`. Missing dimensions are read whole.
+
+    Returns
+    -------
+    list of (int, int)
+        (start, stop) byte offsets in the file. Unallocated chunks are skipped.
+
+    """
+    if not isinstance(selection, tuple):
+        selection = (selection,)
+    selection = selection + (slice(None),) * (dataset.ndim - len(selection))
+
+    if dataset.chunks is None:
+        offset = dataset.id.get_offset()
+        if offset is None or dataset.ndim == 0:
+            return []
+        rows = _get_chunk_indices(selection[0], dataset.shape[0], 1)
+        if len(rows) == 0:
+            return []
+        row_nbytes = int(np.prod(dataset.shape[1:], dtype="int64")) * dataset.dtype.itemsize
+        return [(offset + int(rows[0]) * row_nbytes, offset + (int(rows[-1]) + 1) * row_nbytes)]
+
+    chunk_indices = [
+        _get_chunk_indices(sel, length, chunk_length)
+        for sel, length, chunk_length in zip(selection, dataset.shape, dataset.chunks)
+    ]
+    ranges = []
+    for coord in itertools.product(*chunk_indices):
+        info = dataset.id.get_chunk_info_by_coord(tuple(int(i) * c for i, c in zip(coord, dataset.chunks)))
+        if info.byte_offset is not None:
+            ranges.append((info.byte_offset, info.byte_offset + info.size))
+    return sorted(ranges)
+
+
+def coalesce_ranges(ranges, max_gap: int = 0) -> list:
+    """Merge sorted (start, stop) byte ranges that are less than `max_gap` bytes apart"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1] + max_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def prefetch_chunks(dataset, selection):
+    """If `dataset` belongs to a file streamed through a registered CachedRemoteFile, fetch all the chunks that
+    `dataset[selection]` will read concurrently, instead of letting h5py request them one at a time. Does nothing for
+    other datasets."""
+    if not isinstance(dataset, h5py.Dataset):
+        return
+    remote_file = _remote_files.get(dataset.file.filename)
+    if remote_file is None:
+        return
+    remote_file.prefetch(coalesce_ranges(get_chunk_byte_ranges(dataset, selection)))
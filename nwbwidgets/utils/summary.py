@@ -0,0 +1,245 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pynwb.image import ImageSeries
+
+from .frames import FrameReader
+from .sidecar import get_sidecar_path
+
+SUMMARY_IMAGES = ("mean", "max", "std", "correlation")
+
+# (down, right) offsets of the neighbors of a pixel that are visited once per pair: right, below and the two diagonals
+_NEIGHBOR_SHIFTS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def _neighbor_slices(shift, shape):
+    """Slices of the pixels and of their neighbor at `shift`, over the pixels that have this neighbor"""
+    dy, dx = shift
+    height, width = shape
+    pixels = (slice(0, height - dy), slice(max(0, -dx), width - max(0, dx)))
+    neighbors = (slice(dy, height), slice(max(0, dx), width + min(0, dx)))
+    return pixels, neighbors
+
+
+class FrameStatistics:
+    """Running sums of a stack of 2D frames, from which the mean, max, std and local correlation images are derived.
+
+    Frames are accumulated block by block, in any order, and the statistics of separate blocks can be merged, so that a
+    whole movie is reduced in a single pass, in parallel, and without holding more than a few blocks in memory. Values
+    are accumulated relative to a fixed `offset` frame, which keeps the variances accurate in float64.
+    """
+
+    def __init__(self, offset: np.ndarray):
+        """
+
+        Parameters
+        ----------
+        offset: numpy.ndarray
+            Frame subtracted from all the frames before they are accumulated, typically the first one
+        """
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.n_frames = 0
+        self.sum = np.zeros(self.offset.shape)
+        self.sum_squares = np.zeros(self.offset.shape)
+        self.max = np.full(self.offset.shape, -np.inf)
+        self.neighbor_products = [
+            np.zeros(self.offset[pixels].shape)
+            for pixels, _ in (_neighbor_slices(shift, self.offset.shape) for shift in _NEIGHBOR_SHIFTS)
+        ]
+
+    def update(self, frames):
+        """Accumulate a block of frames of shape (n_frames, height, width)"""
+        frames = np.asarray(frames)
+        np.maximum(self.max, frames.max(axis=0), out=self.max)
+        centered = frames - self.offset
+        self.n_frames += len(frames)
+        self.sum += centered.sum(axis=0)
+        self.sum_squares += np.einsum("nij,nij->ij", centered, centered)
+        for products, shift in zip(self.neighbor_products, _NEIGHBOR_SHIFTS):
+            pixels, neighbors = _neighbor_slices(shift, self.offset.shape)
+            products += np.einsum(
+                "nij,nij->ij", centered[(slice(None),) + pixels], centered[(slice(None),) + neighbors]
+            )
+        return self
+
+    def merge(self, other: "FrameStatistics"):
+        """Add the statistics of another block, accumulated with the same offset"""
+        self.n_frames += other.n_frames
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        np.maximum(self.max, other.max, out=self.max)
+        for products, other_products in zip(self.neighbor_products, other.neighbor_products):
+            products += other_products
+        return self
+
+    def get_images(self) -> dict:
+        """Summary images of the accumulated frames
+
+        Returns
+        -------
+        dict
+            'mean', 'max', 'std' and 'correlation' images. The correlation image is the mean correlation of the trace
+            of each pixel with the traces of its 8 neighbors.
+
+        """
+        n_frames = max(self.n_frames, 1)
+        centered_mean = self.sum / n_frames
+        std = np.sqrt(np.maximum(self.sum_squares / n_frames - centered_mean**2, 0))
+
+        correlation = np.zeros(self.offset.shape)
+        n_neighbors = np.zeros(self.offset.shape)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for products, shift in zip(self.neighbor_products, _NEIGHBOR_SHIFTS):
+                pixels, neighbors = _neighbor_slices(shift, self.offset.shape)
+                covariance = products / n_frames - centered_mean[pixels] * centered_mean[neighbors]
+                pair_correlation = np.nan_to_num(covariance / (std[pixels] * std[neighbors]))
+                # each pair of neighbors counts for both pixels
+                correlation[pixels] += pair_correlation
+                correlation[neighbors] += pair_correlation
+                n_neighbors[pixels] += 1
+                n_neighbors[neighbors] += 1
+        correlation /= np.maximum(n_neighbors, 1)
+
+        return dict(
+            mean=self.offset + centered_mean,
+            max=self.max,
+            std=std,
+            correlation=correlation,
+        )
+
+
+def _block_statistics(frames, offset):
+    return FrameStatistics(offset).update(np.asarray(frames, dtype=np.float64))
+
+
+def compute_summary_images(
+    reader: FrameReader,
+    start: int = 0,
+    stop: int = None,
+    block_bytes: int = 2**26,
+    max_workers: int = None,
+    max_pending_bytes: int = 2**28,
+    on_progress=None,
+) -> dict:
+    """Mean, max, std and correlation images of the frames from `start` to `stop`, computed in a single streaming pass.
+
+    Frames are read in blocks of whole chunks by this thread, while the statistics of the blocks already read are
+    accumulated by a thread pool, where numpy releases the GIL.
+
+    Parameters
+    ----------
+    reader: FrameReader
+        of 2D frames
+    start, stop: int, optional
+        Range of frames. Defaults to all the frames.
+    block_bytes: int, optional
+        Approximate number of bytes of float64 frames accumulated at once
+    max_workers: int, optional
+        Number of threads. Defaults to the number of CPUs, up to 4.
+    max_pending_bytes: int, optional
+        Approximate number of bytes of float64 frames read but not accumulated yet. Reading waits for the blocks
+        already read once they exceed it, and at least one block is always read. Default: 256 MiB.
+    on_progress: callable, optional
+        Called with the number of frames of each block once it is accumulated
+
+    Returns
+    -------
+    dict
+        see FrameStatistics.get_images
+
+    """
+    stop = len(reader) if stop is None else min(stop, len(reader))
+    if not 0 <= start < stop:
+        raise ValueError(f"invalid range of frames: {start} to {stop}")
+    offset = reader.read_frames(start, start + 1)[0]
+    if offset.ndim != 2:
+        raise ValueError(f"summary images are computed from 2D frames, got frames of shape {offset.shape}")
+
+    block_frames = max(block_bytes // (offset.size * 8), 1)
+    if reader.chunks:
+        block_frames = max(block_frames // reader.chunks[0], 1) * reader.chunks[0]
+    # blocks start on chunk boundaries, so that no chunk is read twice
+    boundaries = list(range(start - start % block_frames + block_frames, stop, block_frames))
+    blocks = zip([start] + boundaries, boundaries + [stop])
+
+    statistics = FrameStatistics(offset)
+
+    def collect(future):
+        block_statistics = future.result()
+        statistics.merge(block_statistics)
+        if on_progress is not None:
+            on_progress(block_statistics.n_frames)
+
+    max_workers = max_workers or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nwbwidgets-summary") as executor:
+        # bound the memory of the blocks read and not accumulated yet, counted as float64 like block_bytes
+        pending = deque()
+        pending_bytes = 0
+        for block_start, block_stop in blocks:
+            block_nbytes = (block_stop - block_start) * offset.size * 8
+            while pending and (len(pending) >= max_workers or pending_bytes + block_nbytes > max_pending_bytes):
+                collect(pending[0][0])
+                pending_bytes -= pending.popleft()[1]
+            frames = reader.read_frames(block_start, block_stop)
+            pending.append((executor.submit(_block_statistics, frames, offset), block_nbytes))
+            pending_bytes += block_nbytes
+        while pending:
+            collect(pending.popleft()[0])
+    return statistics.get_images()
+
+
+def get_summary_images_path(image_series: ImageSeries, start: int, stop: int, cache_path: str = "nwb-cache"):
+    """Path of the sidecar file of the summary images of `image_series` from frame `start` to `stop`, or None if they
+    are not saved: for an ImageSeries that was not read from a file, or without `cache_path`"""
+    if cache_path is None or image_series.container_source is None:
+        return None
+    return get_sidecar_path(image_series, f".summary-{start}-{stop}.npz", cache_path=cache_path)
+
+
+def load_or_compute_summary_images(
+    image_series: ImageSeries,
+    start: int = 0,
+    stop: int = None,
+    reader: FrameReader = None,
+    cache_path: str = "nwb-cache",
+    **kwargs,
+) -> dict:
+    """Load the summary images of `image_series` from their sidecar file, computing and saving them first if needed.
+
+    Parameters
+    ----------
+    image_series: pynwb.image.ImageSeries
+    start, stop: int, optional
+        Range of frames. Defaults to all the frames.
+    reader: FrameReader, optional
+        Reader of the frames of `image_series`, e.g. the one of its widget. Opened and closed here by default.
+    cache_path: str, optional
+        Directory of the sidecar files. Set to None to never save summary images.
+    kwargs:
+        passed to compute_summary_images
+
+    Returns
+    -------
+    dict
+        see FrameStatistics.get_images
+
+    """
+    own_reader = reader is None
+    if own_reader:
+        reader = FrameReader.from_image_series(image_series)
+    try:
+        stop = len(reader) if stop is None else min(stop, len(reader))
+        path = get_summary_images_path(image_series, start, stop, cache_path)
+        if path is not None and path.exists():
+            with np.load(path) as npz:
+                return {name: npz[name] for name in SUMMARY_IMAGES}
+        images = compute_summary_images(reader, start, stop, **kwargs)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(path, **images)
+        return images
+    finally:
+        if own_reader:
+            reader.close()
@@ -3,6 +3,11 @@ from bisect import bisect, bisect_left
 import numpy as np
 from pynwb import TimeSeries
 
+from .cache import get_block_cache
+from .memmap import get_memmap
+from .pyramid import get_pyramid
+from .streaming import prefetch_chunks
+
 
 def get_timeseries_tt(node: TimeSeries, istart=0, istop=None) -> np.ndarray:
     """
@@ -97,26 +102,176 @@ def get_timeseries_in_units(node: TimeSeries, istart=None, istop=None, data_colu
     time_series = node
 
     if (data_column is not None) and time_series.data.ndim > 1:
-        data = time_series.data[istart:istop, data_column].flatten()
+        if get_block_cache(time_series) is not None or get_memmap(time_series) is not None:
+            data = read_rows(time_series, istart, istop)[:, data_column].flatten()
+        else:
+            prefetch_chunks(time_series.data, (slice(istart, istop), data_column))
+            data = time_series.data[istart:istop, data_column].flatten()
     else:
-        data = time_series.data[istart:istop]
+        data = read_rows(time_series, istart, istop)
+
+    return convert_to_units(time_series, data)
+
+
+def read_rows(node: TimeSeries, istart=None, istop=None):
+    """
+    Read `node.data[istart:istop]`, through the memory map or the BlockCache registered for the TimeSeries if there
+    is one
+
+    Parameters
+    ----------
+    node: pynwb.TimeSeries
+    istart: int
+    istop: int
+
+    Returns
+    -------
+    array-like
 
-    if time_series.conversion and np.isfinite(time_series.conversion):
-        offset_scalar = time_series.offset
-        conversion_factor_scalar = time_series.conversion
-        channel_conversion_vector = (
-            time_series.channel_conversion if hasattr(time_series, "channel_conversion") else np.ones_like(data)
-        )
+    """
+    memmap = get_memmap(node)
+    if memmap is not None:
+        return memmap[istart:istop]
+    cache = get_block_cache(node)
+    if cache is None:
+        prefetch_chunks(node.data, slice(istart, istop))
+        return node.data[istart:istop]
+    return cache.read(node.data, istart, istop)
+
+
+def get_timeseries_data(node: TimeSeries):
+    """The data of a TimeSeries, or its memory map if one was registered with `register_memmap`"""
+    memmap = get_memmap(node)
+    return node.data if memmap is None else memmap
+
+
+def convert_to_units(node: TimeSeries, data):
+    """
+    Apply the conversion, offset and channel_conversion of a TimeSeries to raw data read from it
+
+    Parameters
+    ----------
+    node: pynwb.TimeSeries
+    data: array-like
+
+    Returns
+    -------
+    numpy.ndarray, str
 
-        data = data * channel_conversion_vector * conversion_factor_scalar + offset_scalar
+    """
+    if node.conversion and np.isfinite(node.conversion):
+        channel_conversion = getattr(node, "channel_conversion", None)
+        if channel_conversion is None:
+            channel_conversion = np.ones_like(data)
 
-        unit = time_series.unit
+        data = data * channel_conversion * node.conversion + node.offset
+        unit = node.unit
     else:
         unit = None
 
     return data, unit
 
 
+def decimate_min_max(tt, data, n_bins: int = 1000):
+    """
+    Reduce a window of samples to a min/max envelope with at most `2 * n_bins` points per trace. Each bin keeps its
+    minimum and its maximum sample in the order they occur, so that a single outlier (e.g. a spike) is never dropped.
+    If the window already fits within the budget, the raw samples are returned untouched.
+
+    Parameters
+    ----------
+    tt: array-like
+        timestamps, shape=(n_samples,)
+    data: array-like
+        shape=(n_samples,) or (n_samples, n_traces)
+    n_bins: int, optional
+        Number of bins, typically the number of pixel columns of the figure
+
+    Returns
+    -------
+    tt: numpy.ndarray
+        shape=(n_points,) for 1D data, (n_points, n_traces) for 2D data
+    data: numpy.ndarray
+        shape=(n_points,) or (n_points, n_traces)
+
+    """
+    tt = np.asarray(tt)
+    data = np.asarray(data)
+    n_samples = len(data)
+    squeeze = data.ndim == 1
+    if n_samples <= 2 * n_bins:
+        if squeeze:
+            return tt[:n_samples], data
+        return np.broadcast_to(tt[:n_samples, np.newaxis], data.shape), data
+
+    if squeeze:
+        data = data[:, np.newaxis]
+
+    bin_size = int(np.ceil(n_samples / n_bins))
+    n_bins = int(np.ceil(n_samples / bin_size))
+    # repeating the last sample does not change the extrema of the last bin
+    padded = np.pad(data, [(0, n_bins * bin_size - n_samples), (0, 0)], mode="edge")
+    padded = padded.reshape(n_bins, bin_size, data.shape[1])
+
+    bin_starts = (np.arange(n_bins) * bin_size)[:, np.newaxis]
+    imin = np.argmin(padded, axis=1) + bin_starts
+    imax = np.argmax(padded, axis=1) + bin_starts
+    inds = np.stack([np.minimum(imin, imax), np.maximum(imin, imax)], axis=1).reshape(2 * n_bins, data.shape[1])
+    inds = np.minimum(inds, n_samples - 1)
+
+    tt_out = tt[inds]
+    data_out = np.take_along_axis(data, inds, axis=0)
+    if squeeze:
+        return tt_out[:, 0], data_out[:, 0]
+    return tt_out, data_out
+
+
+def get_timeseries_envelope_in_units(
+    node: TimeSeries, istart=None, istop=None, n_bins: int = 1000, return_mean: bool = False
+):
+    """
+    Read a window of a TimeSeries in the designated units, decimated to a min/max envelope of at most `2 * n_bins`
+    points. Windows that are short enough are returned at full resolution. If a TimeSeriesPyramid is registered for
+    the TimeSeries, zoomed-out windows are read from its coarsest sufficient level instead of the dataset.
+
+    Parameters
+    ----------
+    node: pynwb.TimeSeries
+    istart: int
+    istop: int
+    n_bins: int, optional
+    return_mean: bool, optional
+        Also return the mean of the samples summarized by each point of the envelope, when it is read from a pyramid,
+        or None otherwise.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, str
+        timestamps, data, unit, and the mean if `return_mean`
+
+    """
+    istart = 0 if istart is None else istart
+    pyramid = get_pyramid(node)
+    level = None
+    if pyramid is not None:
+        istop = len(node.data) if istop is None else istop
+        level = pyramid.select_level(istop - istart, n_bins=n_bins)
+    mean = None
+    if level is not None:
+        # merged down to `n_bins` bins by the pyramid, so that the mean of each bin stays aligned with its envelope
+        tt, data = pyramid.get_envelope(istart, istop, level, n_bins=n_bins)
+        data, unit = convert_to_units(node, data)
+        if return_mean:
+            mean, _ = convert_to_units(node, pyramid.get_mean(istart, istop, level, n_bins=n_bins))
+    else:
+        tt = get_timeseries_tt(node, istart=istart, istop=istop)
+        data, unit = get_timeseries_in_units(node, istart=istart, istop=istop)
+    tt, data = decimate_min_max(tt, data, n_bins=n_bins)
+    if return_mean:
+        return tt, data, unit, mean
+    return tt, data, unit
+
+
 def timeseries_time_to_ind(node: TimeSeries, time, ind_min=None, ind_max=None) -> int:
     """
     Get the index of a certain time for any TimeSeries. For TimeSeries that use timestamps, bisect is used. You can
@@ -150,6 +305,104 @@ def timeseries_time_to_ind(node: TimeSeries, time, ind_min=None, ind_max=None) -
         return id_found if id_found < len(node.data) else len(node.data) - 1
 
 
+def get_window_indices(timeseries: TimeSeries, starts, duration: float, timestamps=None):
+    """
+    Vectorized sample indices of many time windows of a TimeSeries
+
+    Parameters
+    ----------
+    timeseries: TimeSeries
+    starts: array-like
+        start of each window in seconds
+    duration: float
+        duration of the windows in seconds
+    timestamps: numpy.ndarray, optional
+        timestamps of `timeseries`, if they have already been read
+
+    Returns
+    -------
+    idx_start, idx_stop: numpy.ndarray
+        shape=(n_windows,). For TimeSeries with a rate, all windows have the same length and may extend past the
+        bounds of the data.
+    """
+    starts = np.asarray(starts, dtype=float)
+    if timeseries.rate is not None:
+        starting_time = timeseries.starting_time if np.isfinite(timeseries.starting_time) else 0
+        idx_start = ((starts - starting_time) * timeseries.rate).astype(int)
+        idx_stop = idx_start + int(duration * timeseries.rate)
+    else:
+        if timestamps is None:
+            timestamps = np.asarray(timeseries.timestamps[:])
+        idx_start = np.searchsorted(timestamps, starts, side="right")
+        idx_stop = np.searchsorted(timestamps, starts + duration, side="right")
+    return idx_start, idx_stop
+
+
+def read_windows(dataset, idx_start, idx_stop, traces=None):
+    """
+    Read many windows of a dataset with as few reads as possible. Windows are sorted and merged whenever they overlap
+    or are separated by less than one HDF5 chunk, since h5py would read and decompress the chunks in between anyway.
+
+    Parameters
+    ----------
+    dataset: array-like
+        h5py.Dataset, zarr.Array or numpy.ndarray
+    idx_start, idx_stop: array-like
+        bounds of each window. They are clipped to the bounds of the dataset.
+    traces: int or list of int, optional
+        index into the second dim of data
+
+    Returns
+    -------
+    list of numpy.ndarray
+        one array per window, in the order of `idx_start`
+    """
+    n_samples = len(dataset)
+    idx_start = np.clip(np.asarray(idx_start, dtype=int), 0, n_samples)
+    idx_stop = np.clip(np.asarray(idx_stop, dtype=int), idx_start, n_samples)
+    if not len(idx_start):
+        return []
+
+    chunks = getattr(dataset, "chunks", None)
+    gap = chunks[0] if chunks else 0
+
+    order = np.argsort(idx_start, kind="stable")
+    sorted_start = idx_start[order]
+    sorted_stop = np.maximum.accumulate(idx_stop[order])
+    is_new_block = np.ones(len(order), dtype=bool)
+    is_new_block[1:] = sorted_start[1:] > sorted_stop[:-1] + gap
+    block_firsts = np.flatnonzero(is_new_block)
+    block_lasts = np.append(block_firsts[1:], len(order)) - 1
+
+    out = [None] * len(order)
+    for first, last in zip(block_firsts, block_lasts):
+        block_start, block_stop = sorted_start[first], sorted_stop[last]
+        if len(dataset.shape) > 1 and traces is not None:
+            block = dataset[block_start:block_stop, traces]
+        else:
+            block = dataset[block_start:block_stop]
+        block = np.asarray(block)
+        for i in order[first : last + 1]:
+            out[i] = block[idx_start[i] - block_start : idx_stop[i] - block_start]
+    return out
+
+
+def flatten_window_indices(idx_start, idx_stop):
+    """
+    Indices of all the samples of a set of windows, concatenated
+
+    Returns
+    -------
+    indices: numpy.ndarray
+        shape=(n_samples,)
+    offsets: numpy.ndarray
+        shape=(n_windows + 1,). Samples of window `i` are `indices[offsets[i]:offsets[i + 1]]`
+    """
+    counts = idx_stop - idx_start
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return np.repeat(idx_start - offsets[:-1], counts) + np.arange(offsets[-1]), offsets
+
+
 def bisect_timeseries_by_times(timeseries: TimeSeries, starts, duration: float, traces=None):
     """
     Parameters
@@ -166,19 +419,46 @@ def bisect_timeseries_by_times(timeseries: TimeSeries, starts, duration: float,
     out: list
         list with bisected arrays from data
     """
-    out = []
-    for start in starts:
-        if timeseries.rate is not None:
-            idx_start = int((start - timeseries.starting_time) * timeseries.rate)
-            idx_stop = int(idx_start + duration * timeseries.rate)
-        else:
-            idx_start = bisect(timeseries.timestamps, start)
-            idx_stop = bisect(timeseries.timestamps, start + duration, lo=idx_start)
-        if len(timeseries.data.shape) > 1 and traces is not None:
-            out.append(timeseries.data[idx_start:idx_stop, traces])
-        else:
-            out.append(timeseries.data[idx_start:idx_stop])
-    return out
+    idx_start, idx_stop = get_window_indices(timeseries, starts, duration)
+    return read_windows(get_timeseries_data(timeseries), idx_start, idx_stop, traces)
+
+
+def align_by_times_ragged(timeseries: TimeSeries, starts, duration: float, traces=None):
+    """
+    Align a TimeSeries with timestamps to many windows, stored as a ragged array
+
+    Parameters
+    ----------
+    timeseries: TimeSeries
+        timeseries with variable timestamps
+    starts: array-like
+        starts in seconds
+    duration: float
+        duration in seconds
+    traces: int, optional
+        index into the second dim of data
+
+    Returns
+    -------
+    offsets: numpy.ndarray
+        shape=(n_trials + 1,). Samples of trial `i` are `offsets[i]:offsets[i + 1]`
+    timestamps: numpy.ndarray
+        shape=(n_samples,). time of each sample relative to the start of its window
+    values: numpy.ndarray
+        shape=(n_samples, ...)
+    """
+    starts = np.asarray(starts, dtype=float)
+    all_timestamps = np.asarray(timeseries.timestamps[:])
+    idx_start, idx_stop = get_window_indices(timeseries, starts, duration, timestamps=all_timestamps)
+    flat_inds, offsets = flatten_window_indices(idx_start, idx_stop)
+    timestamps = all_timestamps[flat_inds] - np.repeat(starts, np.diff(offsets))
+
+    windows = read_windows(get_timeseries_data(timeseries), idx_start, idx_stop, traces)
+    if windows:
+        values = np.concatenate(windows)
+    else:
+        values = np.asarray(timeseries.data[:0])
+    return offsets, timestamps, values
 
 
 def align_by_times_with_timestamps(timeseries: TimeSeries, starts, duration: float, traces=None):
@@ -197,7 +477,8 @@ def align_by_times_with_timestamps(timeseries: TimeSeries, starts, duration: flo
         list: length=(n_trials); list[0]: array, shape=(n_time, ...)
     """
     assert timeseries.timestamps is not None, "supply timeseries with timestamps"
-    return bisect_timeseries_by_times(timeseries, starts, duration, traces)
+    offsets, _, values = align_by_times_ragged(timeseries, starts, duration, traces)
+    return [values[i_start:i_stop] for i_start, i_stop in zip(offsets[:-1], offsets[1:])]
 
 
 def align_by_times_with_rate(timeseries: TimeSeries, starts, duration: float, traces=None):
@@ -212,11 +493,24 @@ def align_by_times_with_rate(timeseries: TimeSeries, starts, duration: float, tr
         duration in seconds
     Returns
     -------
-    out: list
-        list: length=(n_trials); list[0]: array, shape=(n_time, ...)
+    out: numpy.ndarray
+        shape=(n_trials, n_time, ...). Windows that extend past the data are padded with NaN.
     """
     assert timeseries.rate is not None, "supply timeseries with start_time and rate"
-    return np.array(bisect_timeseries_by_times(timeseries, starts, duration, traces))
+    idx_start, idx_stop = get_window_indices(timeseries, starts, duration)
+    windows = read_windows(get_timeseries_data(timeseries), idx_start, idx_stop, traces)
+    if not windows:
+        return np.array([])
+
+    n_time = int(duration * timeseries.rate)
+    if all(len(window) == n_time for window in windows):
+        return np.stack(windows)
+
+    out = np.full((len(windows), n_time) + windows[0].shape[1:], np.nan)
+    lead = np.clip(-idx_start, 0, None)
+    for i, window in enumerate(windows):
+        out[i, lead[i] : lead[i] + len(window)] = window
+    return out
 
 
 def align_timestamps_by_trials(timeseries: TimeSeries, starts, before: float, after: float):
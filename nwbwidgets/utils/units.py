@@ -1,11 +1,225 @@
-from bisect import bisect_left, bisect_right
+import threading
+import weakref
+from collections import OrderedDict
 
 import numpy as np
 from pynwb.misc import Units
 
+from .sidecar import get_sidecar_path
+
+# DynamicTable defines __eq__ and is therefore unhashable, so entries are keyed by id and dropped with the table
+_spike_train_indices = dict()
+_spike_train_indices_lock = threading.Lock()
+
+
+class SpikeTrainIndex:
+    """Spike times of every unit of a Units table, read once into contiguous arrays.
+
+    `spike_times` is a ragged column: a flat array of spike times and an index holding the end of each unit. Reading
+    them through h5py costs one small read per bisection step and per unit, which adds up quickly when the file is
+    streamed. This class reads both arrays once and answers window queries for many units and windows at a time, with
+    a single `np.searchsorted` over all the units and windows.
+    """
+
+    def __init__(self, units: Units, cache_path=None):
+        """
+
+        Parameters
+        ----------
+        units: pynwb.misc.Units
+        cache_path: str, optional
+            If provided, the spike times are written to a sidecar .npy file in this directory the first time they are
+            read and memory-mapped from it afterwards.
+        """
+        st = units["spike_times"]
+        self.unit_stops = np.asarray(st.data[:], dtype="int64")
+        self.unit_starts = np.concatenate([[0], self.unit_stops[:-1]]).astype("int64")
+
+        if cache_path is None:
+            self.spike_times = np.asarray(st.target.data[:], dtype="float64")
+        else:
+            path = get_sidecar_path(units, ".spike_times.npy", cache_path=cache_path)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                np.save(path, np.asarray(st.target.data[:], dtype="float64"))
+            self.spike_times = np.load(path, mmap_mode="r")
+
+        # trial x unit spike counts, see get_trial_spike_counts. Filled from the render threads, under the lock.
+        self.trial_counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._search_keys = None
+
+    def __len__(self):
+        return len(self.unit_stops)
+
+    def _get_search_keys(self):
+        """Spike times sorted across units, and the integer search key of each spike.
+
+        The key of a spike is `unit * n_spikes + rank`, where `rank` is its position among the spike times of all the
+        units. Keys are sorted in the unit-ordered layout of `spike_times`, so that a single `np.searchsorted` finds
+        positions within any unit, exactly, without shifting the spike times of each unit by a float offset.
+        """
+        with self._lock:
+            if self._search_keys is None:
+                n_spikes = len(self.spike_times)
+                order = np.argsort(self.spike_times, kind="stable")
+                ranks = np.empty(n_spikes, dtype="int64")
+                ranks[order] = np.arange(n_spikes)
+                units = np.repeat(np.arange(len(self), dtype="int64"), self.unit_stops - self.unit_starts)
+                self._search_keys = np.asarray(self.spike_times)[order], units * n_spikes + ranks
+            return self._search_keys
+
+    def _search(self, unit_inds, values, side: str = "left"):
+        """Indices into `spike_times` where `values[i]` would be inserted among the spikes of unit `unit_inds[i]`.
+
+        All the units are searched at once, see `_get_search_keys`.
+
+        Parameters
+        ----------
+        unit_inds: numpy.ndarray
+            shape=(n_units,)
+        values: numpy.ndarray
+            shape=(n_values,), the same for all the units, or shape=(n_units, n_values)
+        side: {'left', 'right'}
+
+        Returns
+        -------
+        numpy.ndarray
+            shape=(n_units, n_values)
+        """
+        sorted_times, keys = self._get_search_keys()
+        # spikes of the unit before `values` are exactly those whose rank is below this one
+        ranks = np.searchsorted(sorted_times, values, side=side)
+        return np.searchsorted(keys, np.asarray(unit_inds, dtype="int64")[:, None] * len(keys) + ranks)
+
+    def get_window_bounds(self, unit_inds, time_window):
+        """Indices into `spike_times` of the spikes of each unit in `unit_inds` that fall in [t0, t1]
+
+        Parameters
+        ----------
+        unit_inds: array-like
+        time_window: [float, float]
+
+        Returns
+        -------
+        numpy.ndarray, numpy.ndarray
+            start and stop of each unit
+        """
+        ind_start = self._search(unit_inds, np.array([time_window[0]], dtype="float64"), side="left")
+        ind_stop = self._search(unit_inds, np.array([time_window[1]], dtype="float64"), side="right")
+        return ind_start[:, 0], np.maximum(ind_stop[:, 0], ind_start[:, 0])
+
+    def get_spike_times(self, unit_inds, time_window):
+        """Spike times of each unit in `unit_inds` within [t0, t1]
+
+        Returns
+        -------
+        list of numpy.ndarray
+        """
+        ind_start, ind_stop = self.get_window_bounds(unit_inds, time_window)
+        return [np.asarray(self.spike_times[i_start:i_stop]) for i_start, i_stop in zip(ind_start, ind_stop)]
+
+    def align(self, unit_inds, starts, stops):
+        """Spikes of many units in many windows, e.g. trials, in a single pass
+
+        Parameters
+        ----------
+        unit_inds: array-like
+            shape=(n_units,)
+        starts: array-like
+            shape=(n_trials,)
+        stops: array-like
+            shape=(n_trials,). Windows are [start, stop).
+
+        Returns
+        -------
+        offsets: numpy.ndarray
+            shape=(n_units * n_trials + 1,). Spikes of unit `unit_inds[i]` in trial `j` are
+            `offsets[i * n_trials + j]:offsets[i * n_trials + j + 1]`
+        relative_times: numpy.ndarray
+            spike times relative to the start of their window
+        unit_idx: numpy.ndarray
+            position in `unit_inds` of the unit of each spike
+        trial_idx: numpy.ndarray
+            trial of each spike
+        """
+        n_units, n_trials = len(unit_inds), len(starts)
+        starts = np.asarray(starts, dtype="float64")
+        ind_start, ind_stop = self._get_windows_bounds(unit_inds, starts, stops)
+
+        counts = ind_stop - ind_start
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        spike_inds = np.repeat(ind_start - offsets[:-1], counts) + np.arange(offsets[-1])
+        pair_idx = np.repeat(np.arange(n_units * n_trials), counts)
+        unit_idx = pair_idx // n_trials
+        trial_idx = pair_idx % n_trials
+        relative_times = self.spike_times[spike_inds] - starts[trial_idx]
+        return offsets, relative_times, unit_idx, trial_idx
+
+    def count(self, unit_inds, starts, stops):
+        """Number of spikes of many units in many windows, without reading the spikes themselves
+
+        Parameters
+        ----------
+        unit_inds: array-like
+            shape=(n_units,)
+        starts: array-like
+            shape=(n_trials,)
+        stops: array-like
+            shape=(n_trials,). Windows are [start, stop).
+
+        Returns
+        -------
+        numpy.ndarray
+            shape=(n_units, n_trials)
+        """
+        ind_start, ind_stop = self._get_windows_bounds(unit_inds, starts, stops)
+        return (ind_stop - ind_start).reshape(len(unit_inds), len(starts))
+
+    def _get_windows_bounds(self, unit_inds, starts, stops):
+        """Flattened (unit-major) indices into `spike_times` of the [start, stop) windows of every unit"""
+        ind_start = self._search(unit_inds, np.asarray(starts, dtype="float64").ravel(), side="left")
+        ind_stop = self._search(unit_inds, np.asarray(stops, dtype="float64").ravel(), side="left")
+        return ind_start.ravel(), np.maximum(ind_stop, ind_start).ravel()
+
+    def get_unit(self, index):
+        return np.asarray(self.spike_times[self.unit_starts[index] : self.unit_stops[index]])
+
+    def get_min_spike_time(self):
+        non_empty = self.unit_starts < self.unit_stops
+        return np.min(self.spike_times[self.unit_starts[non_empty]])
+
+    def get_max_spike_time(self):
+        non_empty = self.unit_starts < self.unit_stops
+        return np.max(self.spike_times[self.unit_stops[non_empty] - 1])
+
+
+def get_spike_train_index(units: Units, cache_path=None) -> SpikeTrainIndex:
+    """SpikeTrainIndex of a Units table, created on first use and then shared by every widget showing it. Units added
+    to the table after the index was created are not visible to it.
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    cache_path: str, optional
+        passed to SpikeTrainIndex when the index is created
+
+    Returns
+    -------
+    SpikeTrainIndex
+    """
+    # held while the index is created, so that widgets fetching from several threads share a single index
+    with _spike_train_indices_lock:
+        spike_train_index = _spike_train_indices.get(id(units))
+        if spike_train_index is None:
+            spike_train_index = SpikeTrainIndex(units, cache_path=cache_path)
+            _spike_train_indices[id(units)] = spike_train_index
+            weakref.finalize(units, _spike_train_indices.pop, id(units), None)
+    return spike_train_index
+
 
 def get_spike_times(units: Units, index, in_interval):
-    """Use bisect methods to efficiently retrieve spikes from a given unit in a given interval
+    """Efficiently retrieve spikes from a given unit in a given interval
 
     Parameters
     ----------
@@ -17,15 +231,7 @@ def get_spike_times(units: Units, index, in_interval):
     -------
 
     """
-    st = units["spike_times"]
-    unit_start = 0 if index == 0 else st.data[index - 1]
-    unit_stop = st.data[index]
-    start_time, stop_time = in_interval
-
-    ind_start = bisect_left(st.target, start_time, unit_start, unit_stop)
-    ind_stop = bisect_right(st.target, stop_time, ind_start, unit_stop)
-
-    return np.asarray(st.target[ind_start:ind_stop])
+    return get_spike_train_index(units).get_spike_times([index], in_interval)[0]
 
 
 def get_min_spike_time(units: Units):
@@ -39,10 +245,7 @@ def get_min_spike_time(units: Units):
     -------
 
     """
-    st = units["spike_times"]
-    inds = [0] + list(st.data[:-1])
-    first_spikes = [st.target.data[i] for i in inds]
-    return np.min(first_spikes)
+    return get_spike_train_index(units).get_min_spike_time()
 
 
 def get_max_spike_time(units: Units):
@@ -56,10 +259,7 @@ def get_max_spike_time(units: Units):
     -------
 
     """
-    st = units["spike_times"]
-    inds = [x - 1 for x in st.data[:]]
-    last_spikes = [st.target.data[i] for i in inds]
-    return np.max(last_spikes)
+    return get_spike_train_index(units).get_max_spike_time()
 
 
 def align_by_times(units: Units, index, starts, stops):
@@ -72,14 +272,192 @@ def align_by_times(units: Units, index, starts, stops):
     Returns:
         np.array
     """
+    offsets, relative_times, _, _ = get_spike_train_index(units).align([index], starts, stops)
+    for istart, istop in zip(offsets[:-1], offsets[1:]):
+        yield relative_times[istart:istop]
+
+
+def align_units_by_time_intervals(
+    units: Units,
+    unit_inds,
+    intervals,
+    start_label="start_time",
+    stop_label="stop_time",
+    start=0.0,
+    end=0.0,
+    rows_select=(),
+):
+    """Align the spikes of many units to many trials in a single pass
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    unit_inds: array-like
+    intervals: pynwb.epoch.TimeIntervals
+    start_label: str, optional
+    stop_label: str, optional
+        default: same as start_label
+    start: float
+        Start time for calculation before or after (negative or positive) the reference point (aligned to).
+    end: float
+        End time for calculation before or after (negative or positive) the reference point (aligned to).
+    rows_select: array_like, optional
+        sub-selects specific rows
+
+    Returns
+    -------
+    offsets: numpy.ndarray
+        shape=(n_units * n_trials + 1,). Spikes of unit `unit_inds[i]` in trial `j` are
+        `offsets[i * n_trials + j]:offsets[i * n_trials + j + 1]`
+    relative_times: numpy.ndarray
+        spike times relative to the reference point
+    unit_idx: numpy.ndarray
+        position in `unit_inds` of the unit of each spike
+    trial_idx: numpy.ndarray
+        position in the selected trials of the trial of each spike
+    """
+    if stop_label is None:
+        stop_label = start_label
+    starts = np.atleast_1d(np.array(intervals[start_label][:])[rows_select]) + start
+    stops = np.atleast_1d(np.array(intervals[stop_label][:])[rows_select]) + end
+    offsets, relative_times, unit_idx, trial_idx = get_spike_train_index(units).align(unit_inds, starts, stops)
+    return offsets, relative_times + start, unit_idx, trial_idx
 
-    st = units["spike_times"]
-    unit_spike_data = st[index]
 
-    istarts = np.searchsorted(unit_spike_data, starts)
-    istops = np.searchsorted(unit_spike_data, stops)
-    for start, istart, istop in zip(starts, istarts, istops):
-        yield unit_spike_data[istart:istop] - start
+def get_trial_spike_counts(
+    units: Units,
+    intervals,
+    align_by="start_time",
+    start=0.0,
+    end=1.0,
+    max_entries: int = 16,
+):
+    """Spike count of every unit in every trial, computed once per (intervals, align_by, start, end) and cached
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    intervals: pynwb.epoch.TimeIntervals
+    align_by: str, optional
+    start: float
+        Start time for calculation before or after (negative or positive) the reference point (aligned to).
+    end: float
+        End time for calculation before or after (negative or positive) the reference point (aligned to).
+    max_entries: int, optional
+        Number of count matrices kept per Units table
+
+    Returns
+    -------
+    numpy.ndarray
+        shape=(n_trials, n_units)
+    """
+    spike_train_index = get_spike_train_index(units)
+    cache = spike_train_index.trial_counts
+    key = (intervals.object_id, align_by, float(start), float(end))
+    with spike_train_index._lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+    align_times = np.asarray(intervals[align_by][:], dtype="float64")
+    counts = spike_train_index.count(np.arange(len(units)), align_times + start, align_times + end).T
+    with spike_train_index._lock:
+        counts = cache.setdefault(key, counts)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+    return counts
+
+
+def bin_aligned_spikes(relative_times, row_idx, n_rows: int, start: float, end: float, nbins: int):
+    """Histogram of aligned spikes for each row (e.g. unit, trial or group) with a single np.bincount
+
+    Parameters
+    ----------
+    relative_times: array-like
+    row_idx: array-like
+        row of each spike
+    n_rows: int
+    start: float
+    end: float
+    nbins: int
+
+    Returns
+    -------
+    numpy.ndarray
+        shape=(n_rows, nbins), spike counts
+    """
+    relative_times = np.asarray(relative_times)
+    in_range = (relative_times >= start) & (relative_times <= end)
+    bins = ((relative_times[in_range] - start) / (end - start) * nbins).astype(int)
+    # like np.histogram, the last bin includes its right edge
+    bins = np.minimum(bins, nbins - 1)
+    flat = np.asarray(row_idx)[in_range] * nbins + bins
+    return np.bincount(flat, minlength=n_rows * nbins).reshape(n_rows, nbins)
+
+
+def bin_events(data, window, n_bins: int = 1000):
+    """Count the events of each row in `n_bins` equal time bins with a single np.bincount
+
+    Parameters
+    ----------
+    data: list of array-like
+        event times of each row, e.g. the spike times of each unit
+    window: [float, float]
+    n_bins: int, optional
+        typically the width of the figure in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        shape=(n_rows, n_bins)
+    """
+    lengths = np.array([len(x) for x in data], dtype=int)
+    times = np.concatenate(data) if lengths.sum() else np.zeros(0)
+    row_idx = np.repeat(np.arange(len(data)), lengths)
+    return bin_aligned_spikes(times, row_idx, len(data), window[0], window[1], n_bins)
+
+
+def compute_population_psth(
+    units: Units,
+    intervals,
+    unit_inds=None,
+    start_label="start_time",
+    start=-0.5,
+    end=1.0,
+    nbins: int = 30,
+    rows_select=(),
+):
+    """Trial-averaged firing rate of many units
+
+    Parameters
+    ----------
+    units: pynwb.misc.Units
+    intervals: pynwb.epoch.TimeIntervals
+    unit_inds: array-like, optional
+        default: all units
+    start_label: str, optional
+    start: float
+    end: float
+    nbins: int
+    rows_select: array_like, optional
+        sub-selects specific trials
+
+    Returns
+    -------
+    bin_edges: numpy.ndarray
+        shape=(nbins + 1,)
+    rates: numpy.ndarray
+        shape=(n_units, nbins), in Hz
+    """
+    if unit_inds is None:
+        unit_inds = np.arange(len(units))
+    offsets, relative_times, unit_idx, trial_idx = align_units_by_time_intervals(
+        units, unit_inds, intervals, start_label, start_label, start, end, rows_select
+    )
+    n_trials = (len(offsets) - 1) // max(len(unit_inds), 1)
+    counts = bin_aligned_spikes(relative_times, unit_idx, len(unit_inds), start, end, nbins)
+    bin_edges = np.linspace(start, end, nbins + 1)
+    return bin_edges, counts / max(n_trials, 1) / np.diff(bin_edges[:2])
 
 
 def align_by_trials(
@@ -147,11 +525,9 @@ def align_by_time_intervals(
         progress_bar.value = 0
         progress_bar.description = "reading spike data"
 
-    out = []
-    for i, x in enumerate(align_by_times(units, index, starts, stops)):
-        out.append(x + start)
-        if progress_bar is not None:
-            progress_bar.value = i / len(units)
+    out = [x + start for x in align_by_times(units, index, np.atleast_1d(starts), np.atleast_1d(stops))]
+    if progress_bar is not None:
+        progress_bar.value = 1
 
     return out
 
@@ -1,4 +1,6 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
@@ -32,12 +34,17 @@ def unpack_controls(controls, process_controls=lambda x: x):
     return kwargs
 
 
-def interactive_output(f, controls, process_controls=lambda x: x, fixed=None):
+def interactive_output(f, controls, process_controls=lambda x: x, fixed=None, fetch=None, wait=0.1):
     """Connect widget controls to a function.
 
     This function does not generate a user interface for the widgets (unlike `interact`).
     This enables customisation of the widget user interface layout.
     The user interface layout must be defined and displayed manually.
+
+    Control changes are handed to a `RenderScheduler`, so that bursts of changes (e.g. dragging a slider) are coalesced
+    into a single render. If `fetch` is given, it is called with the same arguments as `f` in a worker thread and the
+    dict it returns is passed to `f` as additional keyword arguments, so that reading the data does not block the
+    kernel.
     """
 
     if fixed is None:
@@ -45,15 +52,25 @@ def interactive_output(f, controls, process_controls=lambda x: x, fixed=None):
 
     out = Output()
 
-    def observer(change):
+    def paint(**kwargs):
         with out:
             clear_output(wait=True)
-            plot = f(**fixed, **unpack_controls(controls, process_controls))
+            plot = f(**kwargs)
             plt.show()
 
+    def show_error(exc):
+        with out:
+            clear_output(wait=True)
+            raise exc
+
+    scheduler = RenderScheduler(paint, fetch=fetch, wait=wait, on_error=show_error)
+
+    def observer(change):
+        scheduler.request(**fixed, **unpack_controls(controls, process_controls))
+
     for k, w in controls.items():
         w.observe(observer, "value")
-    observer(None)
+    scheduler.render_now(**fixed, **unpack_controls(controls, process_controls))
     return out
 
 
@@ -103,3 +120,115 @@ def debounce(wait):
         return debounced
 
     return decorator
+
+
+_render_executor = None
+
+
+def get_render_executor():
+    """Thread pool shared by all RenderSchedulers"""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="nwbwidgets-render")
+    return _render_executor
+
+
+def _has_running_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def call_on_event_loop(callback):
+    """Wrap `callback` so that it runs on the event loop of the kernel, whichever thread calls it.
+
+    Widgets are not thread-safe, so callbacks of background threads that update widgets must be wrapped on the event
+    loop (e.g. in the constructor of the widget). Without a running event loop (e.g. outside of a kernel), `callback`
+    is returned unchanged.
+    """
+    if not _has_running_loop():
+        return callback
+    loop = asyncio.get_running_loop()
+
+    def call(*args, **kwargs):
+        loop.call_soon_threadsafe(partial(callback, *args, **kwargs))
+
+    return call
+
+
+class RenderScheduler:
+    """Coalesce render requests and only paint the latest one.
+
+    Requests arriving less than `wait` seconds apart are merged into a single render. `fetch` runs in a thread pool,
+    off the event loop, and its result is only painted if no newer request arrived in the meantime. Superseded
+    fetches that have not started yet are cancelled; the results of those already running are discarded. Without a
+    running event loop (e.g. outside of a kernel), requests are rendered synchronously.
+
+    Parameters
+    ----------
+    paint: callable
+        Called on the event loop with the keyword arguments of the request, updated with the dict returned by `fetch`.
+    fetch: callable, optional
+        Called in a worker thread with the keyword arguments of the request. Must return a dict. It may run
+        concurrently with other fetches and with the kernel, so it must not touch widgets, and only share state
+        through thread-safe caches, such as BlockCache, WidgetCache and SpikeTrainIndex, which hold a lock.
+    wait: float, optional
+        Quiet period, in seconds, before a render starts.
+    executor: concurrent.futures.Executor, optional
+        Defaults to the thread pool shared by all schedulers.
+    on_error: callable, optional
+        Called on the event loop with the exception raised by `fetch`. By default, the exception is re-raised.
+    """
+
+    def __init__(self, paint, fetch=None, wait=0.1, executor=None, on_error=None):
+        self.paint = paint
+        self.fetch = fetch
+        self.wait = wait
+        self.executor = executor
+        self.on_error = on_error
+        self._generation = 0
+        self._timer = None
+        self._future = None
+
+    def request(self, **kwargs):
+        """Schedule a render, superseding any pending or in-flight one"""
+        self._generation += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not _has_running_loop():
+            self.render_now(**kwargs)
+            return
+        self._timer = Timer(self.wait, partial(self._start, self._generation, kwargs))
+
+    def render_now(self, **kwargs):
+        """Fetch and paint synchronously"""
+        fetched = self.fetch(**kwargs) if self.fetch is not None else {}
+        self.paint(**kwargs, **fetched)
+
+    def _start(self, generation, kwargs):
+        self._timer = None
+        if generation != self._generation:
+            return
+        if self.fetch is None:
+            self.paint(**kwargs)
+            return
+        if self._future is not None:
+            self._future.cancel()
+        executor = self.executor if self.executor is not None else get_render_executor()
+        self._future = asyncio.get_running_loop().run_in_executor(executor, partial(self.fetch, **kwargs))
+        self._future.add_done_callback(partial(self._finish, generation, kwargs))
+
+    def _finish(self, generation, kwargs, future):
+        if future.cancelled() or generation != self._generation:
+            return
+        self._future = None
+        exc = future.exception()
+        if exc is not None:
+            if self.on_error is None:
+                raise exc
+            self.on_error(exc)
+            return
+        self.paint(**kwargs, **future.result())
@@ -34,7 +34,8 @@ setup(
     extras_require={
         "human_electrodes": ["nilearn", "trimesh"],
         "mouse_electrodes": ["ccfwidget", "aiohttp"],
-        "full": ["ccfwidget", "aiohttp", "nilearn", "trimesh"],
+        "zarr": ["hdmf-zarr"],
+        "full": ["ccfwidget", "aiohttp", "nilearn", "trimesh", "hdmf-zarr"],
     },
     license="BSD",
     keywords=["jupyter", "hdf5", "notebook", "nwb"],
@@ -1,3 +1,4 @@
+import json
 import unittest
 from datetime import datetime
 
@@ -13,10 +14,13 @@ from pynwb.core import DynamicTable, NWBData
 from pynwb.file import Subject
 
 from nwbwidgets.base import (
+    VisSpec,
     dataset_to_sheet,
     df2accordion,
     fig2widget,
+    lazy_accordion,
     lazy_show_over_data,
+    load_vis,
     nwb2widget,
     processing_module,
     show_fields,
@@ -43,6 +47,64 @@ def test_show_neurodata_base():
     assert isinstance(show_neurodata_base(nwbfile, default_neurodata_vis_spec), widgets.Widget)
 
 
+def test_show_neurodata_base_is_lazy():
+    nwbfile = NWBFile("description", "id", datetime(2017, 4, 3, 11, tzinfo=tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(10.0), rate=1.0, unit="m"))
+    accordion = show_neurodata_base(nwbfile, default_neurodata_vis_spec).children[-1]
+    assert all(isinstance(child, widgets.HTML) for child in accordion.children)
+    index = accordion.titles.index("acquisition")
+    accordion.selected_index = index
+    assert not isinstance(accordion.children[index], widgets.HTML)
+
+
+def test_lazy_accordion():
+    rendered = []
+
+    def func(value):
+        rendered.append(value)
+        return widgets.Label(value)
+
+    accordion = lazy_accordion(dict(a="a", b="b", c="c"), func)
+    assert rendered == []
+    accordion.selected_index = 1
+    assert accordion.children[1].value == "b"
+    accordion.selected_index = None
+    accordion.selected_index = 2
+    assert accordion.children[2].value == "c"
+    accordion.selected_index = 1
+    assert sorted(rendered) == ["b", "c"]
+
+
+def test_nwb2widget_lazy_vis_spec():
+    time_series = TimeSeries(name="test", data=np.arange(10.0), rate=1.0, unit="m")
+    neurodata_vis_spec = {TimeSeries: "nwbwidgets.base:show_text_fields"}
+    widget = nwb2widget(time_series, neurodata_vis_spec)
+    assert isinstance(widget, widgets.VBox)
+    assert load_vis("nwbwidgets.base:show_text_fields") is show_text_fields
+    assert load_vis(show_text_fields) is show_text_fields
+
+
+def test_vis_spec():
+    vis_spec = VisSpec(
+        {
+            TimeSeries: "nwbwidgets.base:show_text_fields",
+            "json:JSONDecoder": show_fields,
+            "nwbwidgets_missing_extension:Type": show_fields,
+            "tabs": VisSpec({"json": show_fields}),
+        }
+    )
+    # visualizations can be called directly
+    assert vis_spec[TimeSeries] is show_text_fields
+    assert vis_spec.get(TimeSeries) is show_text_fields
+    assert vis_spec.get(int) is None
+    # types are resolved once their module is imported
+    assert json.JSONDecoder in vis_spec
+    assert "nwbwidgets_missing_extension:Type" in vis_spec.copy()
+    assert vis_spec["tabs"]["json"] is show_fields
+    time_series = TimeSeries(name="test", data=np.arange(10.0), rate=1.0, unit="m")
+    assert isinstance(default_neurodata_vis_spec[TimeSeries](time_series), widgets.Widget)
+
+
 def test_show_text_fields():
     data = np.random.rand(160, 3)
     ts = TimeSeries(name="test_timeseries", data=data, unit="m", starting_time=0.0, rate=1.0)
@@ -1,6 +1,7 @@
 from datetime import datetime
 
 import ipywidgets as widgets
+import pytest
 from dateutil.tz import tzlocal
 from pynwb import NWBFile
 
@@ -31,6 +32,11 @@ def test_panel():
     panel.source_options_radio.value = "Local file"
     panel.source_options_radio.value = "S3"
     panel.source_options_radio.value = "DANDI"
+    # wait for the list of dandisets to be loaded in the background
+    if panel.dandiset_index_thread is not None:
+        panel.dandiset_index_thread.join()
+    if not panel.source_dandi_id.options:
+        pytest.skip(f"DANDI is not reachable: {panel.dandi_index_status.value}")
 
     # Choose DANDI set
     panel.source_dandi_id.value = panel.source_dandi_id.options[10]
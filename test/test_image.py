@@ -5,6 +5,8 @@ from pynwb.base import TimeSeries
 from pynwb.image import GrayscaleImage, ImageSeries, IndexSeries, RGBImage
 
 from nwbwidgets.image import (
+    ImageFrameWidget,
+    ImageSeriesWidget,
     show_grayscale_image,
     show_image_series,
     show_index_series,
@@ -51,3 +53,30 @@ def test_show_image_series():
     image_series = ImageSeries(name="Image Series", data=data, rate=1.0, unit="n.a.")
 
     assert isinstance(show_image_series(image_series, default_neurodata_vis_spec), widgets.Widget)
+
+
+def test_image_frame_widget():
+    frame = np.random.rand(30, 40)
+    widget = ImageFrameWidget()
+    widget.show_frame(frame, title="frame")
+    image = widget.out_fig.layout.images[0]
+    assert (image.sizex, image.sizey) == (40, 30)
+    assert image.source.startswith("data:image/png;base64,")
+    assert widget.out_fig.layout.title.text == "frame"
+
+    source = image.source
+    widget.set_display(cmap="viridis", contrast=(0.2, 0.8))
+    assert widget.out_fig.layout.images[0].source != source
+
+    widget = ImageFrameWidget(format="jpeg", use_figure=False)
+    widget.show_frame(frame)
+    assert widget.image.value[:2] == b"\xff\xd8"
+
+
+def test_image_series_widget():
+    data = np.random.rand(8, 10, 12)
+    image_series = ImageSeries(name="Image Series", data=data, rate=1.0, unit="n.a.")
+    widget = ImageSeriesWidget(image_series)
+    assert widget.out_fig.layout.images[0].sizex == 10
+    widget.time_window_controller.value = (3.0, 4.0)
+    np.testing.assert_array_equal(widget.image_view.frame, data[3].T)
@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+
+def import_in_subprocess(statement: str):
+    """Run `statement` in a fresh interpreter, and return the modules it imported and the time it took"""
+    code = (
+        "import json, sys, time; start = time.perf_counter(); "
+        + statement
+        + "; print(json.dumps([time.perf_counter() - start, sorted(sys.modules)]))"
+    )
+    duration, modules = json.loads(subprocess.check_output([sys.executable, "-c", code]))
+    return set(modules), duration
+
+
+def test_import_nwbwidgets(record_property):
+    modules, duration = import_in_subprocess("import nwbwidgets")
+    record_property("import_time", duration)
+    assert not {"nwbwidgets.panel", "nwbwidgets.view", "dandi", "aiohttp", "fsspec"} & modules
+
+
+def test_import_vis_spec(record_property):
+    modules, duration = import_in_subprocess("from nwbwidgets import default_neurodata_vis_spec, nwb2widget")
+    record_property("import_time", duration)
+    assert "nwbwidgets.view" in modules
+    assert not {"nwbwidgets.ecephys", "nwbwidgets.ophys", "nwbwidgets.timeseries", "scipy.signal"} & modules
+
+
+def test_import_timeseries_widgets():
+    modules, _ = import_in_subprocess("import nwbwidgets.timeseries")
+    assert not {"aiohttp", "fsspec", "nwbwidgets.panel"} & modules
+
+
+def test_import_panel():
+    modules, _ = import_in_subprocess("from nwbwidgets import Panel")
+    assert "nwbwidgets.panel" in modules
+
+
+@pytest.mark.parametrize("import_first", [True, False])
+def test_extension_widgets_from_file(tmp_path, import_first):
+    path = str(tmp_path / "spectrum.nwb")
+    write = (
+        "from datetime import datetime; import numpy as np; from dateutil.tz import tzlocal; "
+        "from pynwb import NWBHDF5IO, NWBFile; from ndx_spectrum import Spectrum; "
+        "nwbfile = NWBFile('description', 'id', datetime.now(tzlocal())); "
+        "nwbfile.add_acquisition(Spectrum(name='spectrum', frequencies=np.arange(10.0), power=np.ones(10))); "
+        f"io = NWBHDF5IO({path!r}, 'w'); io.write(nwbfile); io.close()"
+    )
+    subprocess.check_call([sys.executable, "-c", write])
+    # the file is read without importing the extension, before or after importing nwbwidgets
+    read_file = (
+        f"from pynwb import NWBHDF5IO; io = NWBHDF5IO({path!r}, 'r', load_namespaces=True); nwbfile = io.read(); "
+    )
+    import_nwbwidgets = "from nwbwidgets import default_neurodata_vis_spec, nwb2widget; "
+    read = (
+        (import_nwbwidgets + read_file if import_first else read_file + import_nwbwidgets)
+        + "assert 'ndx_spectrum' not in __import__('sys').modules; "
+        "spectrum = nwbfile.acquisition['spectrum']; nwb2widget(spectrum, default_neurodata_vis_spec); "
+        "print(default_neurodata_vis_spec[type(spectrum)].__name__)"
+    )
+    assert subprocess.check_output([sys.executable, "-c", read]).decode().split()[-1] == "show_spectrum"
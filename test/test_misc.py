@@ -3,6 +3,7 @@ from datetime import datetime
 
 import matplotlib.pyplot as plt
 import numpy as np
+import plotly.graph_objects as go
 from dateutil.tz import tzlocal
 from ipywidgets import widgets
 from pynwb import NWBFile
@@ -13,6 +14,9 @@ from nwbwidgets.misc import (
     PSTHWidget,
     RasterGridWidget,
     RasterWidget,
+    RasterWidgetPlotly,
+    plot_grouped_events,
+    plot_grouped_events_plotly,
     raster_grid,
     show_annotations,
     show_decomposition_series,
@@ -102,6 +106,35 @@ class ShowPSTHTestCase(unittest.TestCase):
     def test_show_session_raster(self):
         assert isinstance(show_session_raster(self.nwbfile.units), plt.Axes)
 
+    def test_show_session_raster_rasterized(self):
+        ax = show_session_raster(self.nwbfile.units, time_window=[0.0, 30.0], render_mode="raster")
+        assert len(ax.images) == 1
+        assert ax.images[0].get_array().shape == (3, 1000, 4)
+
+    def test_raster_widget_plotly_render_modes(self):
+        widget = RasterWidgetPlotly(self.nwbfile.units)
+        assert all(trace.type == "scattergl" for trace in widget.fig.data)
+
+        assert len(widget.fig.data) == 1
+        np.testing.assert_array_equal(widget.fig.data[0].y, [0, 0, 0, 1, 1, 2, 2, 2, 2])
+
+        # moving the window updates the existing trace instead of rebuilding the figure
+        uid = widget.fig.data[0].uid
+        widget.time_window_controller.value = (2.0, 4.0)
+        assert widget.fig.data[0].uid == uid
+        np.testing.assert_array_equal(widget.fig.data[0].x, [2.2, 3.0, 2.2, 3.0, 2.3, 3.3])
+
+        # one trace per group
+        data = [np.array([1.0, 2.0]), np.array([1.5]), np.array([3.0])]
+        fig = plot_grouped_events_plotly(
+            data, group_inds=np.array([0, 1, 0]), labels=np.array(["a", "b"]), fig=go.FigureWidget()
+        )
+        assert [(trace.type, trace.name) for trace in fig.data] == [("scattergl", "a"), ("scattergl", "b")]
+
+        widget = RasterWidgetPlotly(self.nwbfile.units, render_mode="raster")
+        assert [trace.type for trace in widget.fig.data] == ["heatmap"]
+        assert widget.fig.data[0].z.shape == (3, 1000)
+
     def test_raster_grid_widget(self):
         assert isinstance(RasterGridWidget(self.nwbfile.units), widgets.Widget)
 
@@ -133,3 +166,22 @@ class ShowDecompositionTestCase(unittest.TestCase):
 
     def test_show_decomposition_series(self):
         assert isinstance(show_decomposition_series(self.ds), widgets.Widget)
+
+
+def test_plot_grouped_events_plotly_auto_raster():
+    data = [np.sort(np.random.uniform(0, 100, 60_000)) for _ in range(2)]
+    fig = plot_grouped_events_plotly(
+        data, window=[0, 100], group_inds=np.array([0, 1]), labels=np.array(["a", "b"]), fig=go.FigureWidget()
+    )
+    assert [trace.type for trace in fig.data] == ["heatmap", "scattergl", "scattergl"]
+    z = fig.data[0].z
+    # the integer part of z encodes the group of each row
+    assert np.all(np.floor(z[0][np.isfinite(z[0])]) == 0)
+    assert np.all(np.floor(z[1][np.isfinite(z[1])]) == 1)
+
+
+def test_plot_grouped_events_raster_without_window():
+    data = [np.sort(np.random.uniform(5, 100, 1000)) for _ in range(3)]
+    ax = plot_grouped_events(data, window=None, render_mode="raster")
+    (image,) = ax.get_images()
+    np.testing.assert_allclose(image.get_extent()[:2], [min(x[0] for x in data), max(x[-1] for x in data)])
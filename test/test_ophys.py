@@ -108,6 +108,10 @@ class CalciumImagingTestCase(unittest.TestCase):
         wid = TwoPhotonSeriesWidget(self.image_series, default_neurodata_vis_spec)
         assert isinstance(wid, widgets.Widget)
         wid.controls["slider"].value = 50
+        reader = wid.reader
+        wid.close()
+        assert wid.reader is None
+        assert not reader._frames
 
     def test_show_3d_two_photon_series(self):
         image_series3 = TwoPhotonSeries(
@@ -1,5 +1,189 @@
+from datetime import datetime
+from functools import partial
+from types import SimpleNamespace
+
+import fsspec
+import numpy as np
+import pytest
+from dateutil.tz import tzlocal
+from pynwb import NWBHDF5IO, NWBFile, TimeSeries
+
+import nwbwidgets.panel as panel_module
+import nwbwidgets.utils.streaming as streaming_module
 from nwbwidgets import Panel
+from nwbwidgets.utils.pool import NWBFilePool
 
 
 def test_panel():
     Panel()
+
+
+def test_panel_dandi_index_error(tmp_path, monkeypatch):
+    def offline_client():
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(
+        panel_module, "DandisetIndex", partial(panel_module.DandisetIndex, client_factory=offline_client)
+    )
+    panel = Panel(cache_path=str(tmp_path / "cache"), enable_local_source=False)
+    panel.dandiset_index_thread.join(5)
+    assert panel.source_dandi_id.options == ()
+    assert "offline" in panel.dandi_index_status.value
+
+
+def test_panel_reuses_remote_files(tmp_path, monkeypatch):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100.0), rate=10.0, unit="m"))
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+
+    panel = Panel(cache_path=str(tmp_path / "cache"), disk_cache_size=2**20)
+    panel.fs = fsspec.filesystem("file")
+    nwbfile = panel.open_remote_file(path)
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[:10], np.arange(10.0))
+    assert panel.open_remote_file(path) is nwbfile
+    assert panel.range_cache.stats["disk_nbytes"] <= 2**20
+
+    # Panels over the same directory share its cache
+    assert Panel(cache_path=str(tmp_path / "cache")).range_cache is panel.range_cache
+
+    # a new session opens the file from its metadata snapshot
+    monkeypatch.setattr(streaming_module, "_range_caches", dict())
+    panel = Panel(cache_path=str(tmp_path / "cache"), disk_cache_size=0, file_pool=NWBFilePool())
+    panel.fs = fsspec.filesystem("file")
+    panel.open_remote_file(path)
+    assert panel.range_cache.stats["misses"] == 0
+
+
+def test_panel_close_releases_fetcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(streaming_module, "_default_fetcher", None)
+    panels = [Panel(cache_path=str(tmp_path / "cache"), enable_dandi_source=False) for _ in range(2)]
+    fetcher = panels[0].fetcher
+    assert panels[1].fetcher is fetcher
+    closed = []
+    monkeypatch.setattr(fetcher, "close", lambda: closed.append(True))
+    panels[0].close()
+    assert not closed
+    panels[1].close()
+    assert closed
+
+
+def test_panel_pools_local_files(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100.0), rate=10.0, unit="m"))
+    path = tmp_path / "test.nwb"
+    with NWBHDF5IO(str(path), "w") as io:
+        io.write(nwbfile)
+
+    file_pool = NWBFilePool()
+    panel = Panel(cache_path=str(tmp_path / "cache"), file_pool=file_pool)
+    panel.source_options_radio.value = "Local file"
+    panel.local_file_path.value = str(path)
+    panel.load_local_file()
+    widget = panel.widgets_panel.children[0]
+
+    # another Panel sharing the pool displays the same file and widgets without reading it again
+    panel = Panel(cache_path=str(tmp_path / "cache"), file_pool=file_pool)
+    panel.source_options_radio.value = "Local dir"
+    panel.local_dir_path.value = str(tmp_path)
+    panel.list_local_dir_files()
+    panel.local_dir_files.value = "test.nwb"
+    panel.load_local_dir_file()
+    assert panel.widgets_panel.children[0] is widget
+    assert len(file_pool) == 1
+
+
+def test_panels_share_pool_without_closing_displayed_files(tmp_path):
+    paths = []
+    for name in ("a", "b"):
+        nwbfile = NWBFile("description", name, datetime.now(tzlocal()))
+        nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100.0), rate=10.0, unit="m"))
+        paths.append(tmp_path / f"{name}.nwb")
+        with NWBHDF5IO(str(paths[-1]), "w") as io:
+            io.write(nwbfile)
+
+    file_pool = NWBFilePool(max_files=1)
+    panels = [Panel(cache_path=str(tmp_path / "cache"), file_pool=file_pool) for _ in paths]
+    for panel, path in zip(panels, paths):
+        panel.source_options_radio.value = "Local file"
+        panel.local_file_path.value = str(path)
+        panel.load_local_file()
+
+    # the first Panel still shows an open file
+    nwbfile = file_pool.get(str(paths[0].resolve()))
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[:3], [0.0, 1.0, 2.0])
+    assert len(file_pool) == 2
+
+
+def test_panel_zarr_requires_hdmf_zarr(tmp_path, monkeypatch):
+    monkeypatch.setattr(panel_module, "hdmf_zarr", False)
+    (tmp_path / "test.nwb.zarr").mkdir()
+    panel = Panel(cache_path=str(tmp_path / "cache"), stream_mode="zarr")
+    with pytest.raises(ImportError):
+        panel.open_remote_file(str(tmp_path / "test.nwb.zarr"))
+    with pytest.raises(ImportError):
+        panel.open_local_file(str(tmp_path / "test.nwb.zarr"))
+
+
+def test_panel_zarr(tmp_path):
+    hdmf_zarr = pytest.importorskip("hdmf_zarr", exc_type=ImportError)
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100.0), rate=10.0, unit="m"))
+    path = str(tmp_path / "test.nwb.zarr")
+    with hdmf_zarr.NWBZarrIO(path=path, mode="w") as io:
+        io.write(nwbfile)
+
+    panel = Panel(cache_path=str(tmp_path / "cache"), stream_mode="zarr")
+    nwbfile = panel.open_remote_file(path)
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[:10], np.arange(10.0))
+    nwbfile = panel.open_local_file(path)
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[:10], np.arange(10.0))
+
+
+def test_panel_zarr_stream_mode_opens_zarr_io(tmp_path, monkeypatch):
+    """Runs without hdmf-zarr: the NWB-Zarr IO class is replaced by one recording how it is opened"""
+    opened = []
+
+    class NWBZarrIO:
+        def __init__(self, path, mode):
+            opened.append((path, mode))
+            self.nwbfile = NWBFile("description", path, datetime.now(tzlocal()))
+
+        def read(self):
+            return self.nwbfile
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(panel_module, "hdmf_zarr", SimpleNamespace(NWBZarrIO=NWBZarrIO))
+    panel = Panel(cache_path=str(tmp_path / "cache"), stream_mode="zarr", file_pool=NWBFilePool())
+    for url in ("https://dandiarchive.s3.amazonaws.com/zarr/0123-abcd/", "s3://bucket/sub-1_ses-1.nwb.zarr"):
+        nwbfile = panel.open_remote_file(url)
+        assert nwbfile.identifier == url
+        assert panel.open_remote_file(url) is nwbfile
+    (tmp_path / "local.nwb.zarr").mkdir()
+    panel.open_local_file(str(tmp_path / "local.nwb.zarr"))
+    assert opened == [
+        ("https://dandiarchive.s3.amazonaws.com/zarr/0123-abcd/", "r"),
+        ("s3://bucket/sub-1_ses-1.nwb.zarr", "r"),
+        (str(tmp_path / "local.nwb.zarr"), "r"),
+    ]
+
+
+def test_panel_picks_backend_per_file(tmp_path):
+    panel = Panel(cache_path=str(tmp_path / "cache"), stream_mode="zarr")
+    assert panel.get_backend("sub-1/sub-1_ses-1.nwb") == "hdf5"
+    assert panel.get_backend("sub-1/sub-1_ses-1.nwb.zarr") == "zarr"
+    assert panel.get_backend("https://dandiarchive.s3.amazonaws.com/zarr/0123-abcd/") == "zarr"
+    assert Panel(cache_path=str(tmp_path / "cache")).get_backend("https://host/blobs/0123?x=1") == "hdf5"
+
+    # HDF5 files are streamed in "zarr" mode too
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100.0), rate=10.0, unit="m"))
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+    panel.fs = fsspec.filesystem("file")
+    nwbfile = panel.open_remote_file(path)
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[:10], np.arange(10.0))
@@ -21,6 +21,7 @@ from nwbwidgets.timeseries import (
     show_timeseries,
     show_timeseries_mpl,
     show_ts_fields,
+    trialize_time_series,
 )
 
 
@@ -240,6 +241,23 @@ class TestAlignMultiTraceTimeSeriesByTrials(unittest.TestCase):
         fig = amt.children[-1]
         assert len(fig.data) == len(gas.group_sm.value)
 
+    def test_align_by_rate_sem_and_align_to_zero(self):
+        amt = AlignMultiTraceTimeSeriesByTrialsConstant(time_series=self.ts_rate, trials=self.time_intervals)
+        data_before, _ = amt.align_data("start_time", 0.5, 2.0, 0)
+        data_before = data_before.copy()
+        amt.controls["align_to_zero"].value = True
+        amt.controls["sem"].value = True
+        data_after, _ = amt.align_data("start_time", 0.5, 2.0, 0)
+        np.testing.assert_array_equal(data_before, data_after)
+        assert len(amt.children[-1].data) == 3
+
+    def test_trialize_time_series(self):
+        df = trialize_time_series(self.ts_rate, self.time_intervals, data_column=1, duration=2.0)
+        assert len(df) == 2 * len(self.time_intervals)
+        row = df.iloc[0]
+        assert row.data == self.ts_rate.data[int(np.ceil(row.timestamps)), 1]
+        assert 0 <= row.centered_timestamps < 2.0
+
     def test_align_by_rate(self):
         amt = AlignMultiTraceTimeSeriesByTrialsConstant(time_series=self.ts_rate, trials=self.time_intervals)
         gas = amt.controls["gas"]
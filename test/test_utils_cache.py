@@ -0,0 +1,211 @@
+import gc
+import weakref
+from concurrent.futures import wait
+from datetime import datetime
+
+import h5py
+import numpy as np
+import pytest
+from dateutil.tz import tzlocal
+from ipywidgets import widgets
+from pynwb import NWBHDF5IO, NWBFile, TimeSeries
+
+from nwbwidgets.base import nwb2widget
+from nwbwidgets.controllers import StartAndDurationController
+from nwbwidgets.utils.cache import (
+    BlockCache,
+    WidgetCache,
+    get_block_cache,
+    get_widget_cache,
+)
+from nwbwidgets.utils.prefetch import TimeWindowPrefetcher
+from nwbwidgets.utils.timeseries import get_timeseries_in_units
+from nwbwidgets.view import default_neurodata_vis_spec
+
+
+class CountingDataset:
+    """Wraps an array and counts the slices read from it"""
+
+    def __init__(self, data, chunks=None):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.chunks = chunks
+        self.reads = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, item):
+        self.reads.append(item)
+        return self.data[item]
+
+
+@pytest.fixture
+def h5_timeseries(tmp_path):
+    data = np.random.rand(10000, 4)
+    f = h5py.File(tmp_path / "data.h5", "w")
+    dataset = f.create_dataset("data", data=data, chunks=(100, 4))
+    yield TimeSeries(name="test", data=dataset, rate=100.0, unit="m", conversion=2.0), data
+    f.close()
+
+
+def test_block_cache_read():
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2), chunks=(30, 2))
+    cache = BlockCache(block_bytes=16 * 50)
+    assert cache.get_block_rows(dataset) == 60
+
+    np.testing.assert_array_equal(cache.read(dataset, 10, 130), dataset.data[10:130])
+    # blocks 0-2 were read at once
+    assert dataset.reads == [slice(0, 180)]
+    np.testing.assert_array_equal(cache.read(dataset, 100, 170), dataset.data[100:170])
+    assert len(dataset.reads) == 1
+    np.testing.assert_array_equal(cache.read(dataset, 150, 250), dataset.data[150:250])
+    assert dataset.reads[1:] == [slice(180, 300)]
+    np.testing.assert_array_equal(cache.read(dataset), dataset.data)
+
+
+def test_block_cache_eviction():
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2))
+    cache = BlockCache(max_bytes=16 * 200, block_bytes=16 * 50)
+    for istart in range(0, 500, 50):
+        cache.read(dataset, istart, istart + 50)
+    assert cache.nbytes <= cache.max_bytes
+    n_reads = len(dataset.reads)
+    cache.read(dataset, 450, 500)
+    assert len(dataset.reads) == n_reads
+    cache.read(dataset, 0, 50)
+    assert len(dataset.reads) == n_reads + 1
+
+
+def test_block_cache_bypasses_windows_larger_than_budget():
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2))
+    cache = BlockCache(max_bytes=16 * 200, block_bytes=16 * 50)
+    cache.read(dataset, 0, 50)
+    n_bytes = cache.nbytes
+    np.testing.assert_array_equal(cache.read(dataset, 100, 400), dataset.data[100:400])
+    # read once, straight from the dataset, without evicting the cached block
+    assert dataset.reads[1:] == [slice(100, 400)]
+    assert cache.nbytes == n_bytes
+
+
+def test_block_cache_releases_datasets():
+    cache = BlockCache(block_bytes=16 * 50)
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2))
+    cache.read(dataset, 0, 100)
+    dataset_ref = weakref.ref(dataset)
+    del dataset
+    gc.collect()
+    assert dataset_ref() is None
+    # the blocks of the collected dataset are dropped on the next write
+    other_dataset = CountingDataset(np.arange(10).reshape(5, 2))
+    cache.read(other_dataset, 0, 5)
+    assert cache.nbytes == 16 * 5
+
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2))
+    cache.read(dataset, 0, 100)
+    cache.unregister(dataset)
+    assert cache.nbytes == 16 * 5
+
+
+def test_block_cache_prefetch_skips_large_windows():
+    dataset = CountingDataset(np.arange(1000).reshape(500, 2))
+    cache = BlockCache(max_bytes=16 * 200, block_bytes=16 * 10)
+    cache.prefetch(dataset, 0, 100)
+    assert dataset.reads == []
+    cache.prefetch(dataset, 0, 40)
+    assert cache.nbytes == 16 * 40
+
+
+def test_time_window_prefetcher(h5_timeseries):
+    time_series, data = h5_timeseries
+    controller = StartAndDurationController(tmax=100, tmin=0)
+    controller.slider.value = 10
+    cache = BlockCache()
+    prefetcher = TimeWindowPrefetcher(controller, [time_series], cache=cache)
+    assert get_block_cache(time_series) is cache
+    wait(prefetcher._futures)
+    # next page, previous page and zoomed out window
+    assert cache.nbytes >= 1000 * 4 * 8
+
+    controller.move_up(None)
+    assert controller.value == (15, 20)
+    wait(prefetcher._futures)
+    values, unit = get_timeseries_in_units(time_series, 1500, 2000)
+    np.testing.assert_allclose(values, data[1500:2000] * 2)
+    values, unit = get_timeseries_in_units(time_series, 1500, 2000, data_column=1)
+    np.testing.assert_allclose(values, data[1500:2000, 1] * 2)
+
+
+def test_time_window_prefetcher_in_memory():
+    time_series = TimeSeries(name="test", data=np.random.rand(100), rate=10.0, unit="m")
+    controller = StartAndDurationController(tmax=10, tmin=0)
+    prefetcher = TimeWindowPrefetcher(controller, [time_series], cache=BlockCache())
+    assert prefetcher.time_series_list == []
+    assert get_block_cache(time_series) is None
+
+
+def test_widget_cache():
+    cache = WidgetCache(max_widgets=2)
+    nodes = [TimeSeries(name=f"test{i}", data=np.arange(10.0), rate=1.0, unit="m") for i in range(3)]
+    labels = [widgets.Label(str(i)) for i in range(3)]
+    assert cache.get(nodes[0], "key") is None
+    cache.put(nodes[0], "key", labels[0])
+    cache.put(nodes[1], "key", labels[1])
+    assert cache.get(nodes[0], "key") is labels[0]
+    assert cache.get(nodes[0], "other key") is None
+
+    # nodes[1] is the least recently used
+    cache.put(nodes[2], "key", labels[2])
+    assert cache.get(nodes[1], "key") is None
+    assert len(cache) == 2
+
+    labels[2].close()
+    assert cache.get(nodes[2], "key") is None
+
+    cache.invalidate(nodes[0])
+    assert cache.get(nodes[0], "key") is None
+    assert not cache.put(dict(), "key", labels[0])
+
+
+def test_widget_cache_checks_objects(tmp_path):
+    cache = WidgetCache(max_widgets=2)
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(10.0), rate=1.0, unit="m"))
+    with NWBHDF5IO(str(tmp_path / "test.nwb"), "w") as io:
+        io.write(nwbfile)
+    # objects read twice from the same file share their object_id
+    with NWBHDF5IO(str(tmp_path / "test.nwb"), "r") as io, NWBHDF5IO(str(tmp_path / "test.nwb"), "r") as io2:
+        time_series = io.read().acquisition["test"]
+        reread_time_series = io2.read().acquisition["test"]
+        assert time_series.object_id == reread_time_series.object_id
+        cache.put(time_series, "key", widgets.Label())
+        assert cache.get(reread_time_series, "key") is None
+
+    # entries of collected objects are dropped before live ones
+    nodes = [TimeSeries(name=f"test{i}", data=np.arange(10.0), rate=1.0, unit="m") for i in range(3)]
+    labels = [widgets.Label(str(i)) for i in range(3)]
+    cache.put(nodes[0], "key", labels[0])
+    cache.put(nodes[1], "key", labels[1])
+    del nodes[1]
+    gc.collect()
+    cache.put(nodes[1], "key", labels[2])
+    assert cache.get(nodes[0], "key") is labels[0]
+
+
+def test_nwb2widget_cache_key_holds_specs():
+    time_series = TimeSeries(name="test", data=np.random.rand(100, 3), rate=10.0, unit="m")
+    widget = nwb2widget(time_series, {TimeSeries: lambda node, **kwargs: widgets.Label("first")})
+    # a new spec never reuses the widget built with a collected one, even if it gets its id
+    for _ in range(10):
+        assert nwb2widget(time_series, {TimeSeries: lambda node, **kwargs: widgets.Label("other")}) is not widget
+
+
+def test_nwb2widget_reuses_widgets():
+    time_series = TimeSeries(name="test", data=np.random.rand(100, 3), rate=10.0, unit="m")
+    widget = nwb2widget(time_series, default_neurodata_vis_spec)
+    assert nwb2widget(time_series, default_neurodata_vis_spec) is widget
+    assert nwb2widget(time_series, default_neurodata_vis_spec, use_cache=False) is not widget
+
+    get_widget_cache().invalidate(time_series)
+    assert nwb2widget(time_series, default_neurodata_vis_spec) is not widget
@@ -0,0 +1,107 @@
+import threading
+
+from nwbwidgets.utils.dandi import DandisetIndex, has_nwb_raw
+
+
+def make_metadata(name, nwb=True):
+    data_standard = [dict(identifier="RRID:SCR_015242" if nwb else "RRID:SCR_016124")]
+    return dict(name=name, description=f"{name} description", assetsSummary=dict(dataStandard=data_standard))
+
+
+class StubDandiset:
+    def __init__(self, identifier, metadata, modified="2023-01-01"):
+        self.identifier = identifier
+        self.modified = modified
+        self.metadata = metadata
+        self.n_calls = 0
+
+    def get_raw_metadata(self):
+        self.n_calls += 1
+        if self.metadata is None:
+            raise ValueError("invalid metadata")
+        return self.metadata
+
+
+class StubClient:
+    def __init__(self, dandisets):
+        self.dandisets = dandisets
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get_dandisets(self):
+        return iter(self.dandisets)
+
+
+def test_has_nwb_raw():
+    assert has_nwb_raw(make_metadata("a"))
+    assert not has_nwb_raw(make_metadata("a", nwb=False))
+    assert not has_nwb_raw(dict(name="a"))
+
+
+def test_dandiset_index(tmp_path):
+    dandisets = [
+        StubDandiset("000002", make_metadata("second")),
+        StubDandiset("000001", make_metadata("first")),
+        StubDandiset("000003", make_metadata("not nwb", nwb=False)),
+        StubDandiset("000004", None),
+    ]
+    path = tmp_path / "dandisets.json"
+    index = DandisetIndex(path=path, client_factory=lambda: StubClient(dandisets), max_workers=2)
+    assert index.is_stale()
+    assert index.get_options() == []
+
+    progress = []
+    index.refresh(on_progress=lambda index: progress.append(len(index.entries)), page_size=2)
+    assert progress == [2, 3, 3]
+    assert index.get_options() == ["000001 - first", "000002 - second"]
+    assert index.get_description("000002") == "second description"
+    assert not index.is_stale()
+
+    # the index is available offline on the next launch
+    def offline_client():
+        raise ConnectionError()
+
+    index = DandisetIndex(path=path, client_factory=offline_client)
+    assert not index.is_stale()
+    assert index.get_options() == ["000001 - first", "000002 - second"]
+
+    # only new or modified dandisets are fetched again, and deleted ones are dropped
+    dandisets[0].metadata = make_metadata("second, renamed")
+    dandisets[0].modified = "2023-02-01"
+    dandisets = dandisets[:3] + [StubDandiset("000005", make_metadata("fifth"))]
+    dandisets.pop(1)
+    index.client_factory = lambda: StubClient(dandisets)
+    index.refresh()
+    assert index.get_options() == ["000002 - second, renamed", "000005 - fifth"]
+    assert [dandiset.n_calls for dandiset in dandisets] == [2, 1, 1]
+
+
+def test_dandiset_index_ttl_and_background(tmp_path):
+    dandisets = [StubDandiset("000001", make_metadata("first"))]
+    index = DandisetIndex(path=tmp_path / "dandisets.json", ttl=0, client_factory=lambda: StubClient(dandisets))
+    done = threading.Event()
+    thread = index.refresh_in_background(on_progress=lambda index: done.set())
+    thread.join(5)
+    assert done.is_set()
+    assert index.get_options() == ["000001 - first"]
+    assert index.is_stale()
+
+
+def test_dandiset_index_background_error(tmp_path):
+    dandisets = [StubDandiset("000001", make_metadata("first"))]
+    path = tmp_path / "dandisets.json"
+    DandisetIndex(path=path, client_factory=lambda: StubClient(dandisets)).refresh()
+
+    def offline_client():
+        raise ConnectionError("offline")
+
+    index = DandisetIndex(path=path, ttl=0, client_factory=offline_client)
+    errors = []
+    index.refresh_in_background(on_error=errors.append).join(5)
+    assert isinstance(errors[0], ConnectionError)
+    assert index.get_options() == ["000001 - first"]
+    assert index.is_stale()
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import tifffile
+from pynwb.ophys import TwoPhotonSeries
+from pynwb.testing.mock.ophys import mock_ImagingPlane
+
+from nwbwidgets.ophys import TwoPhotonSeriesWidget
+from nwbwidgets.utils.frames import FrameReader
+from nwbwidgets.view import default_neurodata_vis_spec
+
+
+class CountingFrames:
+    """Wraps an array and counts the frames read from it"""
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.data[index]
+
+
+def test_frame_reader():
+    frames = CountingFrames(np.random.rand(20, 4, 5))
+    executor = ThreadPoolExecutor(max_workers=1)
+    reader = FrameReader.from_array(frames, max_frames=4, read_ahead=3, executor=executor)
+    assert len(reader) == 20
+
+    np.testing.assert_array_equal(reader.get_frame(2), frames.data[2])
+    reader.get_frame(2)
+    assert frames.reads == [2]
+    assert reader.stats == dict(hits=1, misses=1)
+
+    reader.prefetch(2)
+    executor.shutdown(wait=True)
+    assert sorted(frames.reads) == [2, 3, 4, 5]
+    np.testing.assert_array_equal(reader.get_frame(5), frames.data[5])
+    assert len(frames.reads) == 4
+    # only the last 4 frames are kept
+    reader.get_frame(0)
+    assert list(reader._frames) == [3, 4, 5, 0]
+
+
+def test_frame_reader_tiff(tmp_path):
+    data = (np.random.rand(10, 8, 6) * 255).astype("uint8")
+    path = str(tmp_path / "frames.tif")
+    tifffile.imwrite(path, data)
+    reader = FrameReader.from_tiff(path)
+    assert len(reader) == 10
+    for index in (3, 9, 0):
+        np.testing.assert_array_equal(reader.get_frame(index), data[index])
+    reader.close()
+    assert reader.file.filehandle.closed
+
+
+def test_two_photon_series_widget_tiff(tmp_path):
+    data = (np.random.rand(10, 8, 6) * 255).astype("uint8")
+    path = str(tmp_path / "frames.tif")
+    tifffile.imwrite(path, data)
+    two_photon_series = TwoPhotonSeries(
+        name="external",
+        imaging_plane=mock_ImagingPlane(),
+        external_file=[path],
+        starting_frame=[0],
+        format="external",
+        rate=10.0,
+        unit="n.a.",
+    )
+    widget = TwoPhotonSeriesWidget(two_photon_series, default_neurodata_vis_spec, fps=20.0)
+    assert widget.controls["play"].interval == 50
+    widget.controls["fps"].value = 5.0
+    assert widget.controls["play"].interval == 200
+
+    widget.controls["play"].playing = True
+    widget.controls["slider"].value = 1
+    widget.controls["slider"].value = 2
+    assert widget.fps_label.value.endswith("fps")
+    np.testing.assert_array_equal(widget.reader.get_frame(2), data[2])
@@ -0,0 +1,69 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from nwbwidgets.utils.images import (
+    apply_lut,
+    encode_image,
+    get_colormap_lut,
+    get_contrast_limits,
+    to_data_uri,
+    to_uint8_image,
+)
+
+
+def test_get_colormap_lut():
+    lut = get_colormap_lut()
+    assert lut.shape == (256,)
+    assert lut[0] == 0 and lut[-1] == 255
+
+    lut = get_colormap_lut("viridis", n_colors=16)
+    assert lut.shape == (16, 3)
+    assert lut.dtype == np.uint8
+
+
+def test_apply_lut_float():
+    lut = get_colormap_lut()
+    frame = np.array([[0.0, 0.5], [1.0, np.nan]])
+    image = apply_lut(frame, lut, 0.0, 1.0)
+    np.testing.assert_array_equal(image, [[0, 128], [255, 0]])
+
+    # values out of the contrast limits are clipped
+    np.testing.assert_array_equal(apply_lut(frame * 4 - 2, lut, 0.0, 1.0), [[0, 0], [255, 0]])
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16"])
+def test_apply_lut_integer_table(dtype):
+    lut = get_colormap_lut("viridis")
+    frame = np.random.randint(0, 200, size=(20, 30)).astype(dtype)
+    image = apply_lut(frame, lut, 10, 150)
+    assert image.shape == (20, 30, 3)
+    np.testing.assert_array_equal(image, apply_lut(frame.astype(float), lut, 10, 150))
+
+
+def test_to_uint8_image_rgb():
+    frame = np.random.randint(0, 256, size=(4, 5, 3)).astype("uint8")
+    assert to_uint8_image(frame, get_colormap_lut(), 0, 255) is frame
+    np.testing.assert_array_equal(to_uint8_image(frame / 255, get_colormap_lut(), 0.0, 1.0), frame)
+
+
+def test_get_contrast_limits():
+    frame = np.arange(101.0)
+    assert get_contrast_limits(frame) == (0.0, 100.0)
+    assert get_contrast_limits(frame, (1, 99)) == (1.0, 99.0)
+
+
+@pytest.mark.parametrize("format", ["png", "jpeg"])
+def test_encode_image(format):
+    image = np.tile(np.arange(64, dtype="uint8"), (32, 1))
+    data = encode_image(image, format)
+    decoded = np.asarray(Image.open(io.BytesIO(data)))
+    assert decoded.shape == image.shape
+    if format == "png":
+        np.testing.assert_array_equal(decoded, image)
+    assert to_data_uri(data, format).startswith(f"data:image/{format};base64,")
+
+    with pytest.raises(ValueError):
+        encode_image(image, "gif")
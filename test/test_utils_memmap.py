@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from dateutil.tz import tzlocal
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO, NWBFile, TimeSeries
+
+from nwbwidgets import Panel
+from nwbwidgets.timeseries import _prep_timeseries, plot_traces
+from nwbwidgets.utils.memmap import get_memmap, memmap_dataset, memmap_nwbfile
+from nwbwidgets.utils.timeseries import get_timeseries_in_units, read_rows
+
+
+@pytest.fixture
+def nwbfile_path(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(
+        TimeSeries(name="contiguous", data=np.arange(4000, dtype="int16").reshape(1000, 4), rate=10.0, unit="V")
+    )
+    nwbfile.add_acquisition(
+        TimeSeries(name="compressed", data=H5DataIO(np.random.rand(1000, 4), compression="gzip"), rate=10.0, unit="V")
+    )
+    nwbfile.add_acquisition(TimeSeries(name="text", data=["a", "b"], rate=10.0, unit="n.a."))
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+    return path
+
+
+def test_memmap_dataset(nwbfile_path):
+    with NWBHDF5IO(nwbfile_path, "r") as io:
+        nwbfile = io.read()
+        memmap = memmap_dataset(nwbfile.acquisition["contiguous"].data)
+        assert isinstance(memmap, np.memmap)
+        np.testing.assert_array_equal(memmap, nwbfile.acquisition["contiguous"].data[:])
+        assert memmap_dataset(nwbfile.acquisition["compressed"].data) is None
+        assert memmap_dataset(nwbfile.acquisition["text"].data) is None
+        assert memmap_dataset(np.arange(10)) is None
+
+
+def test_memmap_nwbfile(nwbfile_path):
+    with NWBHDF5IO(nwbfile_path, "r") as io:
+        nwbfile = io.read()
+        assert memmap_nwbfile(nwbfile) == 1
+        time_series = nwbfile.acquisition["contiguous"]
+        expected = np.arange(4000).reshape(1000, 4)
+
+        assert isinstance(read_rows(time_series, 10, 20), np.memmap)
+        data, unit = get_timeseries_in_units(time_series, 10, 20)
+        np.testing.assert_array_equal(data, expected[10:20])
+        data, unit = get_timeseries_in_units(time_series, 10, 20, data_column=2)
+        np.testing.assert_array_equal(data, expected[10:20, 2])
+
+        mini_data, tt, offsets = _prep_timeseries(time_series, (1.0, 2.0), order=[3, 1])
+        np.testing.assert_array_equal(mini_data - offsets, expected[10:20][:, [3, 1]])
+        assert isinstance(plot_traces(time_series, (1.0, 2.0)), plt.Figure)
+
+
+def test_panel_memmap_local_files(nwbfile_path, tmp_path):
+    panel = Panel(cache_path=str(tmp_path / "cache"), memmap_local_files=True)
+    nwbfile = panel.open_local_file(nwbfile_path)
+    assert get_memmap(nwbfile.acquisition["contiguous"]) is not None
+    assert get_memmap(nwbfile.acquisition["compressed"]) is None
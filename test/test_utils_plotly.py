@@ -0,0 +1,23 @@
+import numpy as np
+
+from nwbwidgets.utils.plotly import categorical_colorscale, event_raster_traces
+
+
+def test_event_raster_traces_colorscale():
+    counts = np.array([[0, 1, 3], [2, 0, 1], [1, 1, 0]])
+    traces = event_raster_traces(counts, [0.0, 3.0], row_groups=[0, 1, 1], colors=["Black", "red"], labels=["a", "b"])
+    heatmap = traces[0]
+    colorscale = heatmap.colorscale
+    assert colorscale[0][0] == 0
+    assert colorscale[-1][0] == 1
+    assert all(low[0] <= high[0] for low, high in zip(colorscale, colorscale[1:]))
+    # every row stays within the color of its group
+    z = np.asarray(heatmap.z)
+    assert np.nanmax(z[0]) < 1 and np.nanmin(z[1:]) >= 1 and np.nanmax(z) < heatmap.zmax
+    assert [trace.name for trace in traces[1:]] == ["a", "b"]
+
+
+def test_categorical_colorscale():
+    colorscale = categorical_colorscale(["red", "green", "blue"])
+    assert colorscale[0][0] == 0
+    assert colorscale[-1][0] == 1
@@ -0,0 +1,64 @@
+from nwbwidgets.utils.pool import NWBFilePool, get_default_file_pool
+
+
+class StubIO:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class StubWidget(StubIO):
+    pass
+
+
+def test_file_pool_lru():
+    pool = NWBFilePool(max_files=2)
+    ios = [StubIO() for _ in range(3)]
+    pool.add("a", ios[0], "nwbfile a")
+    pool.add("b", ios[1], "nwbfile b", file=StubIO())
+    assert pool.get("a") == "nwbfile a"
+    widget = pool.get_widget("b", lambda nwbfile: StubWidget())
+    assert pool.get_widget("b", lambda nwbfile: StubWidget()) is widget
+
+    # "b" is the least recently used file
+    pool.add("c", ios[2], "nwbfile c")
+    assert "b" not in pool and len(pool) == 2
+    assert ios[1].closed and widget.closed
+    assert pool.get("b") is None
+    assert not ios[0].closed
+
+    pool.close()
+    assert len(pool) == 0
+    assert all(io.closed for io in ios)
+
+
+def test_file_pool_keeps_files_in_use():
+    pool = NWBFilePool(max_files=1)
+    ios = [StubIO() for _ in range(3)]
+    first_user, second_user = StubIO(), StubIO()
+    pool.add("a", ios[0], "nwbfile a")
+    pool.use("a", first_user)
+
+    # another user opening files does not close the file in use
+    pool.add("b", ios[1], "nwbfile b")
+    pool.use("b", second_user)
+    assert not ios[0].closed and not ios[1].closed and len(pool) == 2
+
+    # switching to another file releases the previous one
+    pool.add("c", ios[2], "nwbfile c")
+    pool.use("c", second_user)
+    assert ios[1].closed and not ios[0].closed
+
+    pool.release(first_user)
+    assert ios[0].closed and list(pool._entries) == ["c"]
+
+    # users that are garbage collected release their file
+    del second_user
+    pool.add("a", StubIO(), "nwbfile a")
+    assert ios[2].closed
+
+
+def test_default_file_pool():
+    assert get_default_file_pool() is get_default_file_pool()
@@ -0,0 +1,91 @@
+import numpy as np
+from pynwb import TimeSeries
+
+from nwbwidgets.timeseries import _prep_timeseries, show_indexed_timeseries_plotly
+from nwbwidgets.utils.pyramid import (
+    TimeSeriesPyramid,
+    get_pyramid,
+    load_or_build_pyramid,
+)
+from nwbwidgets.utils.timeseries import get_timeseries_envelope_in_units
+
+
+def make_timeseries(n_samples=200_010, n_channels=3):
+    data = np.random.randn(n_samples, n_channels).astype("float32")
+    data[n_samples // 2, -1] = 100.0
+    return TimeSeries(name="name", data=data, unit="V", starting_time=1.0, rate=1000.0, conversion=2.0)
+
+
+def test_build_levels():
+    ts = make_timeseries()
+    pyramid = TimeSeriesPyramid.build(ts, base_factor=64, block_size=10_000)
+
+    level0 = pyramid.levels[0]
+    assert len(level0["min"]) == int(np.ceil(len(ts.data) / 64))
+    np.testing.assert_array_equal(level0["max"][0], ts.data[:64].max(axis=0))
+    np.testing.assert_array_equal(level0["min"][-1], ts.data[-(len(ts.data) % 64) :].min(axis=0))
+    np.testing.assert_allclose(level0["mean"][-1], ts.data[-(len(ts.data) % 64) :].mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(pyramid.tt[1][:2], [1.0, 1.128])
+
+    for level in pyramid.levels:
+        np.testing.assert_array_equal(level["max"].max(axis=0), ts.data[:].max(axis=0))
+        np.testing.assert_array_equal(level["min"].min(axis=0), ts.data[:].min(axis=0))
+    assert len(pyramid.levels[-1]["min"]) < 256
+
+
+def test_select_level():
+    pyramid = TimeSeriesPyramid.build(make_timeseries(), base_factor=64)
+    assert pyramid.select_level(10_000, n_bins=1000) is None
+    assert pyramid.select_level(64_000, n_bins=1000) == 0
+    assert pyramid.select_level(200_000, n_bins=1000) == 1
+    assert pyramid.select_level(10**9, n_bins=1000) == len(pyramid.levels) - 1
+
+
+def test_envelope_uses_pyramid(tmp_path):
+    ts = make_timeseries()
+    assert get_pyramid(ts) is None
+    pyramid = load_or_build_pyramid(ts, cache_path=tmp_path)
+    assert get_pyramid(ts) is pyramid
+
+    tt, data, unit = get_timeseries_envelope_in_units(ts, istart=0, istop=len(ts.data), n_bins=500)
+    assert unit == "V"
+    assert len(data) <= 2 * 500
+    assert data[:, -1].max() == 200.0
+    assert np.all(np.diff(tt[:, 0]) >= 0)
+
+    # the mean of each bin is aligned with its envelope, in the same units
+    tt, data, unit, mean = get_timeseries_envelope_in_units(
+        ts, istart=0, istop=len(ts.data), n_bins=500, return_mean=True
+    )
+    assert mean.shape == data.shape
+    assert np.all((data[0::2] <= mean[0::2] + 1e-5) & (mean[1::2] <= data[1::2] + 1e-5))
+    bin_size = int(round((tt[2, 0] - tt[0, 0]) * ts.rate))
+    np.testing.assert_allclose(mean[0], 2.0 * ts.data[:bin_size].mean(axis=0), rtol=1e-4, atol=1e-5)
+
+    mini_data, tt, offsets = _prep_timeseries(ts, time_window=(1.0, 200.0), order=[2, 1])
+    assert mini_data.shape[1] == 2
+    assert len(tt) == len(mini_data) < len(ts.data)
+
+    # the first render of the trace widgets reads the pyramid too
+    for level in pyramid.levels:
+        level["max"][:, 0] = 1000.0
+    fig = show_indexed_timeseries_plotly(ts, trace_range=[0, 1], n_bins=500)
+    assert len(fig.data[0].y) <= 2 * 500
+    assert max(fig.data[0].y) == 2000.0
+    assert len(fig.data[0].customdata) == len(fig.data[0].y)
+    assert "mean" in fig.data[0].hovertemplate
+
+
+def test_save_load(tmp_path):
+    ts = make_timeseries(n_samples=50_000, n_channels=1)
+    pyramid = load_or_build_pyramid(ts, cache_path=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    loaded = TimeSeriesPyramid.load(next(tmp_path.iterdir()))
+    assert loaded.n_samples == pyramid.n_samples
+    assert loaded.base_factor == pyramid.base_factor
+    for a, b in zip(loaded.levels, pyramid.levels):
+        np.testing.assert_array_equal(a["max"], b["max"])
+        np.testing.assert_array_equal(a["mean"], b["mean"])
+    for a, b in zip(loaded.tt, pyramid.tt):
+        np.testing.assert_array_equal(a, b)
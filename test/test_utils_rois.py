@@ -0,0 +1,185 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from dateutil.tz import tzlocal
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.ophys import ImageSegmentation, OpticalChannel, PlaneSegmentation
+from pynwb.testing.mock.ophys import mock_PlaneSegmentation
+
+from nwbwidgets.ophys import PlaneSegmentation2DWidget, route_plane_segmentation
+from nwbwidgets.utils.rois import (
+    RoiOutlines,
+    SparseRoiMasks,
+    compute_outline,
+    load_or_compute_outlines,
+)
+from nwbwidgets.utils.sidecar import get_sidecar_path
+from nwbwidgets.view import default_neurodata_vis_spec
+
+
+def make_image_masks(n_rois, size=20, seed=0):
+    rng = np.random.default_rng(seed)
+    image_masks = np.zeros((n_rois, size, size))
+    for image_mask in image_masks:
+        x, y = rng.integers(0, size - 5, 2)
+        image_mask[x : x + rng.integers(2, 5), y : y + rng.integers(2, 5)] = 1
+    return image_masks
+
+
+@pytest.fixture
+def plane_seg_path(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    device = nwbfile.create_device("microscope")
+    imaging_plane = nwbfile.create_imaging_plane(
+        name="imaging_plane",
+        optical_channel=OpticalChannel("channel", "description", 500.0),
+        description="description",
+        device=device,
+        excitation_lambda=600.0,
+        indicator="GFP",
+        location="V1",
+    )
+    plane_seg = ImageSegmentation().create_plane_segmentation("description", imaging_plane, "plane_seg")
+    plane_seg.add_column("category", "category")
+    for i, image_mask in enumerate(make_image_masks(30)):
+        plane_seg.add_roi(image_mask=image_mask, category=str(i % 3))
+    nwbfile.create_processing_module("ophys", "description").add(plane_seg.parent)
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+    return path
+
+
+def test_compute_outline():
+    image_mask = np.zeros((10, 10))
+    image_mask[2:5, 3:6] = 1
+    x, y = compute_outline(image_mask)
+    assert x.min() > 1 and x.max() < 5 and y.min() > 2 and y.max() < 6
+    x, y = compute_outline(np.zeros((10, 10)))
+    assert len(x) == len(y) == 0
+
+
+def test_roi_outlines():
+    image_masks = make_image_masks(10)
+    outlines = RoiOutlines.compute(image_masks, block_bytes=3 * image_masks[0].nbytes)
+    assert len(outlines) == 10
+    for i, image_mask in enumerate(image_masks):
+        np.testing.assert_array_equal(outlines.get_outline(i), compute_outline(image_mask))
+
+    x, y, roi_indices = outlines.merge([4, 1])
+    n_4 = len(outlines.get_outline(4)[0])
+    np.testing.assert_array_equal(x[:n_4], outlines.get_outline(4)[0])
+    np.testing.assert_array_equal(y[n_4 + 1 : -1], outlines.get_outline(1)[1])
+    assert np.isnan(x[n_4]) and np.isnan(x[-1])
+    assert set(roi_indices) == {-1, 1, 4}
+
+
+def test_roi_outlines_process_pool():
+    image_masks = make_image_masks(40)
+    progress = []
+    outlines = RoiOutlines.compute(
+        image_masks,
+        block_bytes=4 * image_masks[0].nbytes,
+        max_workers=2,
+        min_parallel_rois=0,
+        on_progress=progress.append,
+    )
+    expected = RoiOutlines.compute(image_masks, max_workers=1)
+    np.testing.assert_array_equal(outlines.offsets, expected.offsets)
+    np.testing.assert_array_equal(outlines.x, expected.x)
+    assert sum(progress) == 40
+
+
+def test_roi_outlines_single_cpu_in_process(monkeypatch):
+    import nwbwidgets.utils.rois as rois_module
+
+    def pool(*args, **kwargs):
+        raise AssertionError("the outlines should be extracted in this process")
+
+    monkeypatch.setattr(rois_module.os, "cpu_count", lambda: 1)
+    monkeypatch.setattr(rois_module, "ProcessPoolExecutor", pool)
+    outlines = RoiOutlines.compute(make_image_masks(10), min_parallel_rois=0)
+    assert len(outlines) == 10
+
+
+def test_load_or_compute_outlines(plane_seg_path, tmp_path):
+    with NWBHDF5IO(plane_seg_path, "r") as io:
+        plane_seg = io.read().processing["ophys"]["ImageSegmentation"]["plane_seg"]
+        outlines = load_or_compute_outlines(plane_seg, cache_path=tmp_path / "cache")
+        path = get_sidecar_path(plane_seg["image_mask"], ".outlines-0.01.npz", cache_path=tmp_path / "cache")
+        assert path.exists()
+
+        progress = []
+        reloaded = load_or_compute_outlines(plane_seg, cache_path=tmp_path / "cache", on_progress=progress.append)
+        assert progress == []
+        np.testing.assert_array_equal(reloaded.x, outlines.x)
+
+        widget = PlaneSegmentation2DWidget(plane_seg, cache_path=tmp_path / "cache")
+        widget.button.click()
+        # one trace per category
+        assert [trace.name for trace in widget.children[0].data] == ["0", "1", "2"]
+
+
+def test_sparse_roi_masks():
+    image_masks = make_image_masks(10)
+    image_masks[1, 0, 0] = 0.5
+    image_masks[2, 0, 0] = 0.8
+    masks = SparseRoiMasks.from_image_masks(image_masks, block_bytes=3 * image_masks[0].nbytes)
+    assert len(masks) == 10
+    assert masks.shape == (20, 20)
+    assert masks.nbytes < image_masks.nbytes / 10
+
+    labels = masks.label_image()
+    # overlapping pixels go to the ROI with the largest weight
+    assert labels[0, 0] == 2
+    assert set(np.unique(labels)) == set(range(-1, 10))
+    for i, image_mask in enumerate(image_masks):
+        assert np.all(image_mask[labels == i] > 0)
+
+    # the same ROIs, from (x, y, weight) pixel masks
+    pixel_masks = [PlaneSegmentation.image_to_pixel(image_mask) for image_mask in image_masks]
+    pixel_mask_index = np.cumsum([len(pixel_mask) for pixel_mask in pixel_masks])
+    from_pixels = SparseRoiMasks.from_pixel_masks(
+        [pixel for pixel_mask in pixel_masks for pixel in pixel_mask], pixel_mask_index, shape=(20, 20)
+    )
+    np.testing.assert_array_equal(from_pixels.label_image(), labels)
+
+    # the same pixel listed twice by a ROI, and equal weights
+    masks = SparseRoiMasks.from_pixel_masks(
+        [(0, 0, 0.5), (0, 0, 0.9), (1, 1, 0.3), (0, 0, 0.7), (1, 1, 0.3)], [3, 5], shape=(2, 2)
+    )
+    np.testing.assert_array_equal(masks.label_image(), [[0, -1], [-1, 1]])
+
+
+def test_plane_segmentation_labels(plane_seg_path):
+    with NWBHDF5IO(plane_seg_path, "r") as io:
+        plane_seg = io.read().processing["ophys"]["ImageSegmentation"]["plane_seg"]
+        widget = PlaneSegmentation2DWidget(plane_seg, style="labels")
+        widget.button.click()
+        fig = widget.children[0]
+        assert fig.data[0].type == "heatmap"
+        assert [trace.name for trace in fig.data[1:]] == ["0", "1", "2"]
+
+        # the hover callback is registered once, including when the figure is updated in place
+        widget.fig = fig
+        widget.update_fig("category")
+        assert len(fig.data[0]._hover_callbacks) == 1
+
+        labels = widget.get_label_image(0.01)
+        x, y = np.argwhere(labels == 4)[0]
+        widget.show_roi_info(x, y)
+        assert "id: 4" in widget.roi_info.value
+        widget.show_roi_info(-1, 0)
+        assert widget.roi_info.value == ""
+
+
+def test_route_pixel_mask_plane_segmentation():
+    plane_seg = mock_PlaneSegmentation(n_rois=0)
+    for i in range(3):
+        plane_seg.add_roi(pixel_mask=[(i, 2 * i, 1.0), (i + 1, 2 * i, 1.0)])
+    widget = route_plane_segmentation(plane_seg, default_neurodata_vis_spec)
+    assert widget.style == "labels"
+    widget.button.click()
+    assert widget.get_fov_shape() == (4, 5)
+    assert widget.get_label_image(0.01)[3, 4] == 2
@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import fsspec
+import h5py
+import numpy as np
+import pytest
+from dateutil.tz import tzlocal
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO, NWBFile, TimeSeries
+
+from nwbwidgets.utils.streaming import (
+    CachedRemoteFile,
+    MetadataSnapshot,
+    ParallelRangeFetcher,
+    RangeCache,
+    coalesce_ranges,
+    get_chunk_byte_ranges,
+    get_range_cache,
+    get_snapshot_path,
+    prefetch_chunks,
+    register_remote_file,
+    use_metadata_snapshot,
+)
+from nwbwidgets.utils.timeseries import get_timeseries_in_units
+
+
+def make_fetch(data, requests):
+    def fetch(start, stop):
+        requests.append((start, stop))
+        return data[start:stop]
+
+    return fetch
+
+
+def test_range_cache_read(tmp_path):
+    data = bytes(range(256)) * 40
+    requests = []
+    cache = RangeCache(cache_path=tmp_path, block_size=1000)
+    fetch = make_fetch(data, requests)
+
+    assert cache.read("url", 1500, 3500, fetch) == data[1500:3500]
+    # consecutive missing blocks are fetched at once
+    assert requests == [(1000, 4000)]
+    assert cache.stats["misses"] == 3
+
+    assert cache.read("url", 3000, 5000, fetch) == data[3000:5000]
+    assert requests[1:] == [(4000, 5000)]
+    assert cache.stats["memory_hits"] == 1
+
+    assert cache.read("url", 9500, 10240, fetch) == data[9500:]
+    assert cache.read("other_url", 0, 10, fetch) == data[:10]
+    assert len(list((tmp_path / "blocks").iterdir())) == 7
+
+
+def test_range_cache_tiers(tmp_path):
+    data = bytes(range(256)) * 40
+    requests = []
+    fetch = make_fetch(data, requests)
+    cache = RangeCache(cache_path=tmp_path, block_size=1000, memory_bytes=2000, disk_bytes=5000)
+    for start in range(0, 10000, 1000):
+        cache.read("url", start, start + 1000, fetch)
+    assert cache.memory_nbytes <= 2000
+    assert cache.disk_nbytes <= 5000
+    assert len(list((tmp_path / "blocks").iterdir())) == 5
+
+    # block 6 is on disk only
+    assert cache.read("url", 6000, 6010, fetch) == data[6000:6010]
+    assert cache.stats["disk_hits"] == 1
+    assert len(requests) == 10
+
+    # a new session resumes from the disk tier
+    cache = RangeCache(cache_path=tmp_path, block_size=1000, memory_bytes=2000, disk_bytes=5000)
+    assert cache.read("url", 5000, 10000, fetch) == data[5000:10000]
+    assert cache.stats["disk_hits"] == 5
+    assert len(requests) == 10
+
+    cache.clear()
+    assert list((tmp_path / "blocks").iterdir()) == []
+
+
+def test_cached_remote_file(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(10000.0), rate=10.0, unit="m"))
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+
+    cache = RangeCache(cache_path=tmp_path / "cache", block_size=2**12)
+    fs = fsspec.filesystem("file")
+    with CachedRemoteFile(path, cache, fs=fs) as f:
+        with NWBHDF5IO(file=h5py.File(f, "r"), load_namespaces=True) as io:
+            data = io.read().acquisition["test"].data[100:200]
+    np.testing.assert_array_equal(data, np.arange(100.0, 200.0))
+
+    misses = cache.stats["misses"]
+    with CachedRemoteFile(path, cache, fs=fs) as f:
+        with NWBHDF5IO(file=h5py.File(f, "r"), load_namespaces=True) as io:
+            io.read().acquisition["test"].data[100:200]
+    assert cache.stats["misses"] == misses
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files with support for single byte ranges"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        if range_header is None:
+            return super().do_GET()
+        path = self.translate_path(self.path)
+        with open(path, "rb") as f:
+            data = f.read()
+        start, stop = map(int, range_header.split("=")[1].split("-"))
+        body = data[start : stop + 1]
+        self.server.range_requests.append((start, stop + 1))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{start + len(body) - 1}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_nwbfile(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    data = np.random.rand(2000, 32)
+    nwbfile.add_acquisition(
+        TimeSeries(name="test", data=H5DataIO(data, chunks=(100, 4)), rate=100.0, unit="m"),
+    )
+    with NWBHDF5IO(str(tmp_path / "test.nwb"), "w") as io:
+        io.write(nwbfile)
+
+    handler = partial(RangeRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.range_requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/test.nwb", str(tmp_path / "test.nwb"), data, server
+    server.shutdown()
+
+
+def test_coalesce_ranges():
+    assert coalesce_ranges([(10, 20), (0, 10), (30, 40), (35, 50)]) == [(0, 20), (30, 50)]
+    assert coalesce_ranges([(0, 10), (15, 20)], max_gap=5) == [(0, 20)]
+
+
+def test_get_chunk_byte_ranges(http_nwbfile):
+    _, path, _, _ = http_nwbfile
+    with h5py.File(path, "r") as f:
+        dataset = f["acquisition/test/data"]
+        # rows 150-450 touch 4 row chunks, columns 2-9 touch 3 column chunks
+        ranges = get_chunk_byte_ranges(dataset, (slice(150, 450), slice(2, 10)))
+        assert len(ranges) == 12
+        assert all(stop - start == 100 * 4 * 8 for start, stop in ranges)
+        assert len(get_chunk_byte_ranges(dataset, (slice(0, 100), [0, 31]))) == 2
+        assert len(get_chunk_byte_ranges(dataset, slice(None))) == 160
+
+
+def test_parallel_range_fetcher(http_nwbfile):
+    url, path, _, server = http_nwbfile
+    with open(path, "rb") as f:
+        content = f.read()
+    fetcher = ParallelRangeFetcher(max_connections=4)
+    ranges = [(0, 100), (1000, 3000), (50, 60)]
+    assert fetcher.fetch(url, ranges) == [content[start:stop] for start, stop in ranges]
+    assert sorted(server.range_requests) == sorted(ranges)
+    fetcher.close()
+
+
+def test_parallel_range_fetcher_users(http_nwbfile):
+    url, path, _, server = http_nwbfile
+    fetcher = ParallelRangeFetcher()
+
+    class User:
+        pass
+
+    users = [User(), User()]
+    for user in users:
+        fetcher.use(user)
+    fetcher.fetch(url, [(0, 100)])
+    loop = fetcher._loop
+    fetcher.release(users.pop())
+    assert fetcher._loop is loop
+    # the session is closed, and its loop stopped, once the last user is gone
+    users.clear()
+    assert fetcher._loop is None
+    for _ in range(100):
+        if loop.is_closed():
+            break
+        time.sleep(0.01)
+    assert loop.is_closed()
+    # and started again by the next fetch
+    with open(path, "rb") as f:
+        assert fetcher.fetch(url, [(0, 100)]) == [f.read(100)]
+    fetcher.close()
+
+
+def test_prefetch_chunks(http_nwbfile, tmp_path):
+    url, _, data, server = http_nwbfile
+    fetcher = ParallelRangeFetcher()
+    cache = RangeCache(cache_path=tmp_path / "cache", block_size=2**12, disk_bytes=0)
+    f = CachedRemoteFile(url, cache, fetcher=fetcher)
+    file = h5py.File(f, "r")
+    register_remote_file(file, f)
+    with NWBHDF5IO(file=file, load_namespaces=True) as io:
+        time_series = io.read().acquisition["test"]
+        prefetch_chunks(time_series.data, (slice(150, 450), slice(2, 10)))
+        misses = cache.stats["misses"]
+        np.testing.assert_array_equal(time_series.data[150:450, 2:10], data[150:450, 2:10])
+        # every chunk was already fetched
+        assert cache.stats["misses"] == misses
+
+        values, unit = get_timeseries_in_units(time_series, 1000, 1200)
+        np.testing.assert_array_equal(values, data[1000:1200])
+    fetcher.close()
+
+
+def test_metadata_snapshot(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    nwbfile.add_acquisition(TimeSeries(name="test", data=np.arange(100000.0), rate=10.0, unit="m"))
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+    fs = fsspec.filesystem("file")
+
+    def open_nwbfile(cache):
+        f = CachedRemoteFile(path, cache, fs=fs)
+        with use_metadata_snapshot(f, cache_path=tmp_path) as snapshot:
+            io = NWBHDF5IO(file=h5py.File(f, "r"), load_namespaces=True)
+            nwbfile = io.read()
+        return snapshot, io, nwbfile, f
+
+    cache = RangeCache(cache_path=tmp_path, block_size=2**12)
+    snapshot, io, nwbfile, f = open_nwbfile(cache)
+    assert snapshot is None
+    assert cache.stats["misses"] > 0
+    io.close()
+
+    snapshot_path = get_snapshot_path(path, cache_path=tmp_path)
+    assert snapshot_path.exists()
+    assert snapshot_path in cache.disk
+    # the data itself is not part of the snapshot
+    assert sum(len(block) for block in MetadataSnapshot.load(snapshot_path).blocks.values()) < 800000
+
+    # the blocks of the disk tier are dropped, so that only the snapshot can serve the metadata
+    for block_path in (tmp_path / "blocks").glob("*.bin"):
+        block_path.unlink()
+    cache = RangeCache(cache_path=tmp_path, block_size=2**12)
+    snapshot, io, nwbfile, f = open_nwbfile(cache)
+    assert snapshot is not None
+    # opening the file did not fetch anything
+    assert cache.stats["misses"] == 0
+    assert cache.stats["pinned_nbytes"] > 0
+    np.testing.assert_array_equal(nwbfile.acquisition["test"].data[50000:50010], np.arange(50000.0, 50010.0))
+    assert cache.stats["misses"] > 0
+    io.close()
+    # closing the file releases the snapshot
+    f.close()
+    assert cache.stats["pinned_nbytes"] == 0
+
+
+def test_metadata_snapshot_version(tmp_path):
+    path = str(tmp_path / "test.nwb")
+    fs = fsspec.filesystem("file")
+
+    def write(value):
+        nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+        nwbfile.add_acquisition(TimeSeries(name="test", data=np.full(1000, value), rate=10.0, unit="m"))
+        with NWBHDF5IO(path, "w") as io:
+            io.write(nwbfile)
+
+    def read(cache):
+        with CachedRemoteFile(path, cache, fs=fs) as f:
+            with use_metadata_snapshot(f, cache_path=tmp_path) as snapshot:
+                with NWBHDF5IO(file=h5py.File(f, "r"), load_namespaces=True) as io:
+                    return snapshot, io.read().acquisition["test"].data[0]
+
+    cache = RangeCache(cache_path=tmp_path, block_size=2**12)
+    write(1.0)
+    assert read(cache) == (None, 1.0)
+    assert read(cache)[0] is not None
+
+    # a file of the same size but of another version is read again
+    write(2.0)
+    os.utime(path, (1, 1))
+    assert read(cache) == (None, 2.0)
+    assert read(cache)[1] == 2.0
+
+
+def test_get_range_cache(tmp_path):
+    cache = get_range_cache(tmp_path / "a", disk_bytes=1000)
+    assert get_range_cache(str(tmp_path / "a")) is cache
+    assert cache.disk_bytes == 1000
+    assert get_range_cache(tmp_path / "b") is not cache
+
+
+def test_range_cache_budgets(tmp_path):
+    data = bytes(range(256)) * 40
+    fetch = make_fetch(data, [])
+    cache = RangeCache(cache_path=tmp_path, block_size=1000, memory_bytes=4000, disk_bytes=6000)
+    cache.pin("pinned", {0: b"x" * 1000, 1: b"x" * 1000})
+    cache.pin("pinned", {})
+    for start in range(0, 5000, 1000):
+        cache.read("url", start, start + 1000, fetch)
+    # pinned blocks count against the memory budget
+    assert cache.memory_nbytes + cache.pinned_nbytes <= 4000
+    cache.unpin("pinned")
+    assert cache.pinned_nbytes == 2000
+    cache.unpin("pinned")
+    assert cache.pinned_nbytes == 0
+
+    # snapshots count against the disk budget, and are evicted like blocks
+    snapshot_path = tmp_path / "snapshots" / "snapshot.npz"
+    snapshot_path.parent.mkdir()
+    snapshot_path.write_bytes(b"x" * 2000)
+    cache.add_disk_file(snapshot_path)
+    assert cache.disk_nbytes <= 6000
+    for start in range(5000, 10000, 1000):
+        cache.read("url", start, start + 1000, fetch)
+    assert not snapshot_path.exists()
+    assert cache.disk_nbytes <= 6000
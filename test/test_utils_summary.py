@@ -0,0 +1,202 @@
+from datetime import datetime
+
+import ipywidgets as widgets
+import numpy as np
+import pytest
+import tifffile
+from dateutil.tz import tzlocal
+from hdmf.backends.hdf5 import H5DataIO
+from pynwb import NWBHDF5IO, NWBFile
+from pynwb.ophys import OpticalChannel, TwoPhotonSeries
+from pynwb.testing.mock.ophys import (
+    mock_ImagingPlane,
+    mock_PlaneSegmentation,
+    mock_TwoPhotonSeries,
+)
+
+from nwbwidgets.image import SummaryImagesWidget
+from nwbwidgets.ophys import PlaneSegmentation2DWidget
+from nwbwidgets.utils.frames import FrameReader
+from nwbwidgets.utils.summary import (
+    compute_summary_images,
+    get_summary_images_path,
+    load_or_compute_summary_images,
+)
+from nwbwidgets.view import default_neurodata_vis_spec, nwb2widget
+
+
+def make_frames(n_frames=40, shape=(9, 7), seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.random((n_frames,) + shape) * 1000 + 5000).astype("uint16")
+
+
+def local_correlation(frames):
+    zscored = (frames - frames.mean(axis=0)) / frames.std(axis=0)
+    height, width = frames.shape[1:]
+    correlation = np.zeros((height, width))
+    for i in range(height):
+        for j in range(width):
+            neighbors = [
+                (zscored[:, i, j] * zscored[:, i + di, j + dj]).mean()
+                for di in (-1, 0, 1)
+                for dj in (-1, 0, 1)
+                if (di or dj) and 0 <= i + di < height and 0 <= j + dj < width
+            ]
+            correlation[i, j] = np.mean(neighbors)
+    return correlation
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_compute_summary_images(max_workers):
+    data = make_frames()
+    progress = []
+    # blocks of 5 frames, the first of which is cut by the start of the range
+    images = compute_summary_images(
+        FrameReader.from_array(data),
+        start=3,
+        stop=37,
+        block_bytes=5 * 9 * 7 * 8,
+        max_workers=max_workers,
+        on_progress=progress.append,
+    )
+    frames = data[3:37].astype(float)
+    assert progress[0] == 2 and sum(progress) == 34
+    np.testing.assert_allclose(images["mean"], frames.mean(axis=0))
+    np.testing.assert_allclose(images["max"], frames.max(axis=0))
+    np.testing.assert_allclose(images["std"], frames.std(axis=0))
+    np.testing.assert_allclose(images["correlation"], local_correlation(frames), atol=1e-10)
+
+
+def test_compute_summary_images_pending_bytes():
+    data = make_frames()
+    reader = FrameReader.from_array(data)
+    read_frames = reader.read_frames
+    # +1 per block read, -1 per block accumulated
+    events = []
+
+    def counting_read_frames(start, stop):
+        events.append(1)
+        return read_frames(start, stop)
+
+    reader.read_frames = counting_read_frames
+    block_bytes = 5 * 9 * 7 * 8
+    images = compute_summary_images(
+        reader,
+        start=5,
+        block_bytes=block_bytes,
+        max_workers=4,
+        max_pending_bytes=2 * block_bytes,
+        on_progress=lambda n_frames: events.append(-1),
+    )
+    # the first read is of the offset frame
+    assert max(np.cumsum(events[1:])) == 2
+    np.testing.assert_allclose(images["mean"], data[5:].mean(axis=0))
+
+
+def test_compute_summary_images_tiff(tmp_path):
+    data = make_frames(n_frames=12)
+    path = str(tmp_path / "frames.tif")
+    tifffile.imwrite(path, data)
+    reader = FrameReader.from_tiff(path)
+    np.testing.assert_array_equal(reader.read_frames(4, 5), data[4:5])
+    images = compute_summary_images(reader, block_bytes=1)
+    expected = compute_summary_images(FrameReader.from_array(data))
+    for name, image in images.items():
+        np.testing.assert_allclose(image, expected[name])
+
+
+def test_compute_summary_images_errors():
+    with pytest.raises(ValueError):
+        compute_summary_images(FrameReader.from_array(make_frames()), start=10, stop=10)
+    with pytest.raises(ValueError):
+        compute_summary_images(FrameReader.from_array(np.zeros((4, 3, 3, 3))))
+
+
+@pytest.fixture
+def two_photon_series_path(tmp_path):
+    nwbfile = NWBFile("description", "id", datetime.now(tzlocal()))
+    device = nwbfile.create_device("microscope")
+    imaging_plane = nwbfile.create_imaging_plane(
+        name="imaging_plane",
+        optical_channel=OpticalChannel("channel", "description", 500.0),
+        description="description",
+        device=device,
+        excitation_lambda=600.0,
+        indicator="GFP",
+        location="V1",
+    )
+    two_photon_series = TwoPhotonSeries(
+        name="two_photon_series",
+        data=H5DataIO(make_frames(), chunks=(4, 9, 7)),
+        imaging_plane=imaging_plane,
+        rate=10.0,
+        unit="n.a.",
+    )
+    nwbfile.add_acquisition(two_photon_series)
+    path = str(tmp_path / "test.nwb")
+    with NWBHDF5IO(path, "w") as io:
+        io.write(nwbfile)
+    return path
+
+
+def test_load_or_compute_summary_images(two_photon_series_path, tmp_path):
+    cache_path = tmp_path / "cache"
+    with NWBHDF5IO(two_photon_series_path, "r") as io:
+        two_photon_series = io.read().acquisition["two_photon_series"]
+        assert FrameReader.from_image_series(two_photon_series).chunks == (4, 9, 7)
+
+        images = load_or_compute_summary_images(two_photon_series, cache_path=cache_path)
+        assert get_summary_images_path(two_photon_series, 0, 40, cache_path).exists()
+        progress = []
+        reloaded = load_or_compute_summary_images(two_photon_series, cache_path=cache_path, on_progress=progress.append)
+        assert not progress
+        np.testing.assert_array_equal(reloaded["correlation"], images["correlation"])
+
+        # the saved summary images are shown right away
+        widget = SummaryImagesWidget(two_photon_series, cache_path=cache_path)
+        assert widget.image_view.out_fig.layout.images[0].source.startswith("data:image/png")
+        widget.controls["image"].value = "std"
+        assert widget.image_view.out_fig.layout.title.text == "std of frames 0 to 40"
+
+
+def test_summary_images_widget():
+    data = make_frames()
+    widget = SummaryImagesWidget(mock_TwoPhotonSeries(data=data))
+    assert widget.images is None
+    widget.controls["frames"].value = (10, 20)
+    widget.button.click()
+    np.testing.assert_allclose(widget.images["mean"], data[10:20].mean(axis=0))
+    # frames are shown transposed
+    assert widget.image_view.out_fig.layout.images[0].sizex == 9
+
+    # an empty range of frames is reported, and keeps the images shown
+    widget.controls["frames"].value = (15, 15)
+    widget.button.click()
+    assert "at least one frame" in widget.status.value
+    assert widget.frame_range == (10, 20)
+
+    closed = []
+    widget.reader.close = lambda: closed.append(True)
+    widget.close()
+    assert closed and widget.reader is None
+
+
+def test_two_photon_series_tabs():
+    two_photon_series = TwoPhotonSeries(
+        name="two_photon_series", data=make_frames(), imaging_plane=mock_ImagingPlane(), rate=10.0, unit="n.a."
+    )
+    widget = nwb2widget(two_photon_series, default_neurodata_vis_spec)
+    assert isinstance(widget, widgets.Tab)
+    widget.selected_index = 1
+    assert isinstance(widget.children[1], SummaryImagesWidget)
+
+
+def test_plane_segmentation_summary_ref_image():
+    data = make_frames(shape=(20, 20))
+    plane_seg = mock_PlaneSegmentation(reference_images=[mock_TwoPhotonSeries(data=data)])
+    widget = PlaneSegmentation2DWidget(plane_seg, ref_image="correlation")
+    widget.button.click()
+    np.testing.assert_allclose(widget.children[0].data[0].z, local_correlation(data.astype(float)).T, atol=1e-10)
+
+    with pytest.raises(ValueError):
+        PlaneSegmentation2DWidget(mock_PlaneSegmentation(), ref_image="mean").get_ref_image("mean")
@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime
 
+import h5py
 import numpy as np
 from dateutil.tz import tzlocal
 from pynwb import NWBFile, TimeSeries
@@ -8,12 +9,17 @@ from pynwb.epoch import TimeIntervals
 
 from nwbwidgets.utils.timeseries import (
     align_by_time_intervals,
+    align_by_times_ragged,
+    align_by_times_with_rate,
     align_by_trials,
     bisect_timeseries_by_times,
+    decimate_min_max,
+    get_timeseries_envelope_in_units,
     get_timeseries_in_units,
     get_timeseries_maxt,
     get_timeseries_mint,
     get_timeseries_tt,
+    read_windows,
     timeseries_time_to_ind,
 )
 
@@ -131,3 +137,91 @@ class TimeSeriesTimeStampTestCase(unittest.TestCase):
             align_by_time_intervals(timeseries=self.ts_rate, intervals=intervals),
             np.array([]),
         )
+
+
+def test_decimate_min_max_keeps_extrema():
+    tt = np.arange(10000) / 1000.0
+    data = np.zeros(10000)
+    data[1234] = 5.0
+    data[8765] = -3.0
+
+    tt_out, data_out = decimate_min_max(tt, data, n_bins=100)
+
+    assert len(data_out) == 200
+    assert data_out.max() == 5.0
+    assert data_out.min() == -3.0
+    assert tt_out[np.argmax(data_out)] == tt[1234]
+    assert np.all(np.diff(tt_out) >= 0)
+
+
+def test_decimate_min_max_raw_when_zoomed_in():
+    tt = np.arange(50) / 10.0
+    data = np.random.rand(50, 3)
+
+    tt_out, data_out = decimate_min_max(tt, data, n_bins=100)
+
+    np.testing.assert_array_equal(data_out, data)
+    np.testing.assert_array_equal(tt_out[:, 2], tt)
+
+
+def test_get_timeseries_envelope_in_units():
+    ts = TimeSeries(name="test_timeseries", data=np.random.rand(5000, 2), unit="m", starting_time=0.0, rate=100.0)
+
+    tt, data, unit = get_timeseries_envelope_in_units(ts, 0, 4000, n_bins=50)
+
+    assert unit == "m"
+    assert data.shape == (100, 2)
+    assert tt.shape == (100, 2)
+
+
+class CountingDataset:
+    """Wraps an h5py.Dataset and counts the number of reads"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.n_reads = 0
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, item):
+        return getattr(self.dataset, item)
+
+    def __getitem__(self, item):
+        self.n_reads += 1
+        return self.dataset[item]
+
+
+def test_read_windows_merges_nearby_windows(tmp_path):
+    data = np.arange(10_000 * 2).reshape(10_000, 2)
+    with h5py.File(tmp_path / "data.h5", "w") as file:
+        dataset = CountingDataset(file.create_dataset("data", data=data, chunks=(100, 2)))
+        idx_start = np.array([5000, 50, 120, 9990, 180])
+        idx_stop = idx_start + 20
+
+        windows = read_windows(dataset, idx_start, idx_stop, traces=1)
+
+        assert dataset.n_reads == 3
+        for window, i_start, i_stop in zip(windows, idx_start, idx_stop):
+            np.testing.assert_array_equal(window, data[i_start : min(i_stop, len(data)), 1])
+
+
+def test_align_by_times_with_rate_pads_with_nan():
+    ts = TimeSeries(name="name", data=np.arange(10.0), unit="m", starting_time=0.0, rate=1.0)
+    aligned = align_by_times_with_rate(ts, [-2.0, 3.0, 8.0], duration=4.0)
+    np.testing.assert_array_equal(
+        aligned,
+        [[np.nan, np.nan, 0.0, 1.0], [3.0, 4.0, 5.0, 6.0], [8.0, 9.0, np.nan, np.nan]],
+    )
+
+
+def test_align_by_times_ragged():
+    data = np.arange(100, 200, 10)
+    timestamps = list(range(1, 4)) + list(range(7, 10)) + list(range(17, 21))
+    ts = TimeSeries(name="name", data=data, unit="m", timestamps=timestamps)
+
+    offsets, tt, values = align_by_times_ragged(ts, [0.5, 5.0, 10.0], duration=3.0)
+
+    np.testing.assert_array_equal(offsets, [0, 3, 5, 5])
+    np.testing.assert_array_equal(values, [100, 110, 120, 130, 140])
+    np.testing.assert_array_equal(tt, [0.5, 1.5, 2.5, 2.0, 3.0])
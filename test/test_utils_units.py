@@ -1,4 +1,5 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import ipywidgets as widgets
@@ -8,11 +9,24 @@ from pynwb import NWBFile
 from pynwb.epoch import TimeIntervals
 
 from nwbwidgets.base import TimeIntervalsSelector
-from nwbwidgets.misc import TuningCurveExtendedWidget, TuningCurveWidget
+from nwbwidgets.misc import (
+    TuningCurveExtendedWidget,
+    TuningCurveWidget,
+    draw_tuning_curve_1d,
+    draw_tuning_curve_2d,
+)
 from nwbwidgets.utils.units import (
+    SpikeTrainIndex,
     align_by_time_intervals,
     align_by_trials,
+    align_units_by_time_intervals,
+    bin_aligned_spikes,
+    compute_population_psth,
+    get_max_spike_time,
     get_min_spike_time,
+    get_spike_times,
+    get_spike_train_index,
+    get_trial_spike_counts,
 )
 
 
@@ -194,3 +208,161 @@ class ShowPSTHTestCase(UnitsTrialsTestCase):
         ]
 
         np.testing.assert_array_equal(ati, compare_to_ati)
+
+
+class SpikeTrainIndexTestCase(UnitsTrialsTestCase):
+    def test_get_spike_times(self):
+        units = self.nwbfile.units
+        np.testing.assert_array_equal(get_spike_times(units, 1, (2.2, 25.0)), [2.2, 3.0, 25.0])
+        np.testing.assert_array_equal(get_spike_times(units, 0, (5.0, 100.0)), [])
+        np.testing.assert_array_equal(get_spike_times(units, 2, (-100.0, 1.5)), [1.2])
+
+    def test_matches_per_unit_search(self):
+        units = self.nwbfile.units
+        spike_train_index = get_spike_train_index(units)
+        for time_window in [(0.0, 3.0), (2.2, 4.5), (4.6, 24.0), (-10.0, 100.0), (30.0, 40.0)]:
+            data = spike_train_index.get_spike_times([2, 0, 1], time_window)
+            for unit, spikes in zip([2, 0, 1], data):
+                all_spikes = np.asarray(units["spike_times"][unit])
+                expected = all_spikes[(all_spikes >= time_window[0]) & (all_spikes <= time_window[1])]
+                np.testing.assert_array_equal(spikes, expected)
+
+    def test_min_max_spike_time(self):
+        assert get_max_spike_time(self.nwbfile.units) == 26.0
+        assert get_min_spike_time(self.nwbfile.units) == 1.2
+
+    def test_shared(self):
+        assert get_spike_train_index(self.nwbfile.units) is get_spike_train_index(self.nwbfile.units)
+
+    def test_memmap(self):
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as cache_path:
+            spike_train_index = SpikeTrainIndex(self.nwbfile.units, cache_path=cache_path)
+            assert isinstance(spike_train_index.spike_times, np.memmap)
+            np.testing.assert_array_equal(spike_train_index.get_unit(2), [1.2, 2.3, 3.3, 4.5])
+            del spike_train_index
+
+
+class AlignUnitsTestCase(UnitsTrialsTestCase):
+    def test_align_units_by_time_intervals(self):
+        offsets, relative_times, unit_idx, trial_idx = align_units_by_time_intervals(
+            self.nwbfile.units, [2, 1], self.nwbfile.trials, stop_label="start_time", start=-1.0, end=2.0
+        )
+        n_trials = len(self.nwbfile.trials)
+        assert len(offsets) == 2 * n_trials + 1
+        for i, unit in enumerate([2, 1]):
+            expected = align_by_time_intervals(
+                self.nwbfile.units, unit, self.nwbfile.trials, "start_time", "start_time", -1.0, 2.0
+            )
+            for j in range(n_trials):
+                this = relative_times[offsets[i * n_trials + j] : offsets[i * n_trials + j + 1]]
+                np.testing.assert_allclose(this, expected[j])
+                assert np.all(unit_idx[(unit_idx == i) & (trial_idx == j)] == i)
+        assert len(unit_idx) == len(trial_idx) == len(relative_times)
+
+    def test_bin_aligned_spikes(self):
+        counts = bin_aligned_spikes([-0.5, 0.1, 0.2, 0.99, 1.0, 1.5], [0, 0, 1, 1, 1, 0], 2, 0.0, 1.0, 2)
+        np.testing.assert_array_equal(counts, [[1, 0], [1, 2]])
+
+
+def test_spike_train_index_window_boundaries():
+    nwbfile = NWBFile(
+        session_description="session_description",
+        identifier="identifier",
+        session_start_time=datetime(2017, 4, 3, 11, tzinfo=tzlocal()),
+    )
+    rng = np.random.default_rng(0)
+    spike_trains = [np.sort(rng.uniform(0, 1000, 500)).round(3) for _ in range(50)]
+    for spike_times in spike_trains:
+        nwbfile.add_unit(spike_times=spike_times)
+    spike_train_index = SpikeTrainIndex(nwbfile.units)
+
+    # windows starting and stopping exactly on spikes
+    unit_inds = np.arange(50)
+    starts = spike_trains[7][::25]
+    stops = starts + 10.0
+    counts = spike_train_index.count(unit_inds, starts, stops)
+    for unit, spike_times in enumerate(spike_trains):
+        expected = [np.sum((spike_times >= t0) & (spike_times < t1)) for t0, t1 in zip(starts, stops)]
+        np.testing.assert_array_equal(counts[unit], expected)
+        for t in (spike_times[100], spike_times[-1]):
+            (spikes,) = spike_train_index.get_spike_times([unit], (t, t + 5.0))
+            np.testing.assert_array_equal(spikes, spike_times[(spike_times >= t) & (spike_times <= t + 5.0)])
+
+
+def test_compute_population_psth_single_pass(monkeypatch):
+    nwbfile = NWBFile(
+        session_description="session_description",
+        identifier="identifier",
+        session_start_time=datetime(2017, 4, 3, 11, tzinfo=tzlocal()),
+    )
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        nwbfile.add_unit(spike_times=np.sort(rng.uniform(0, 1000, 5000)))
+    for start_time in np.arange(1, 990, 5.0):
+        nwbfile.add_trial(start_time=start_time, stop_time=start_time + 1)
+
+    searches = []
+    search = SpikeTrainIndex._search
+    monkeypatch.setattr(
+        SpikeTrainIndex, "_search", lambda self, *args, **kwargs: searches.append(args) or search(self, *args, **kwargs)
+    )
+    bin_edges, rates = compute_population_psth(nwbfile.units, nwbfile.trials, start=-0.5, end=1.0, nbins=30)
+    # the window starts and stops of all the units and trials are searched at once
+    assert len(searches) == 2
+
+    assert rates.shape == (300, 30)
+    assert len(bin_edges) == 31
+    # homogeneous Poisson spiking at 5 Hz
+    assert 4.0 < rates.mean() < 6.0
+    align_times = nwbfile.trials["start_time"][:]
+    for unit in (0, 299):
+        spike_times = np.asarray(nwbfile.units["spike_times"][unit])
+        relative_times = np.concatenate(
+            [spike_times[(spike_times >= t - 0.5) & (spike_times < t + 1.0)] - t for t in align_times]
+        )
+        counts, _ = np.histogram(relative_times, bin_edges)
+        np.testing.assert_allclose(rates[unit], counts / len(align_times) / np.diff(bin_edges[:2]))
+
+
+class TrialSpikeCountsTestCase(UnitsTrialsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.nwbfile.add_trial_column(name="contrast", description="contrast", data=[0.5, 1.0, np.nan, 0.5, 1.0, 1.0])
+
+    def test_get_trial_spike_counts(self):
+        counts = get_trial_spike_counts(self.nwbfile.units, self.nwbfile.trials, "start_time", -1.0, 2.0)
+        assert counts.shape == (len(self.nwbfile.trials), len(self.nwbfile.units))
+        for unit in range(len(self.nwbfile.units)):
+            expected = [len(x) for x in align_by_trials(self.nwbfile.units, unit, start=-1.0, end=2.0)]
+            np.testing.assert_array_equal(counts[:, unit], expected)
+        assert get_trial_spike_counts(self.nwbfile.units, self.nwbfile.trials, "start_time", -1.0, 2.0) is counts
+
+    def test_get_trial_spike_counts_threads(self):
+        # the fetch functions of the widgets share the cache of counts from several render threads
+        windows = [(-1.0, float(end)) for end in range(1, 9)] * 20
+        units, trials = self.nwbfile.units, self.nwbfile.trials
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(lambda window: get_trial_spike_counts(units, trials, "start_time", *window, 2), windows)
+            )
+        spike_train_index = get_spike_train_index(units)
+        assert len(spike_train_index.trial_counts) == 2
+        align_times = np.asarray(trials["start_time"][:])
+        for (start, end), counts in zip(windows, results):
+            expected = spike_train_index.count(np.arange(len(units)), align_times + start, align_times + end).T
+            np.testing.assert_array_equal(counts, expected)
+
+    def test_draw_tuning_curve_1d(self):
+        fig = draw_tuning_curve_1d(self.nwbfile.units, self.nwbfile.trials, 2, -1.0, 2.0, "contrast")
+        # trials 0 and 3 have contrast 0.5; the trial with a missing contrast is ignored
+        heights = [rect.get_height() for rect in fig.axes[0].patches]
+        np.testing.assert_allclose(heights, [(1 + 0) / (2 * 3.0), (3 + 0 + 0) / (3 * 3.0)])
+
+    def test_draw_tuning_curve_2d(self):
+        fig = draw_tuning_curve_2d(self.nwbfile.units, self.nwbfile.trials, 2, -1.0, 2.0, "stim", "contrast")
+        avg_rates = fig.axes[0].images[0].get_array().T
+        assert avg_rates.shape == (3, 2)
+        assert avg_rates[0, 0] == 1 / 6.0  # person, 0.5: trials 0 and 3
+        assert avg_rates[1, 1] == 3 / 6.0  # ocean, 1.0: trials 1 and 4
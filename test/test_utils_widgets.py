@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+from ipywidgets import widgets
+
+from nwbwidgets.utils.widgets import (
+    RenderScheduler,
+    call_on_event_loop,
+    interactive_output,
+)
+
+
+def test_render_scheduler_sync():
+    painted = []
+    scheduler = RenderScheduler(lambda **kwargs: painted.append(kwargs), fetch=lambda x: dict(y=x * 2))
+    scheduler.request(x=1)
+    scheduler.request(x=2)
+    assert painted == [dict(x=1, y=2), dict(x=2, y=4)]
+
+
+def test_render_scheduler_coalesces_and_drops_stale():
+    painted = []
+    fetch_threads = []
+    release = threading.Event()
+
+    def fetch(x):
+        fetch_threads.append(threading.current_thread())
+        if x == 0:
+            # an in-flight fetch that finishes after newer requests arrived
+            release.wait(1)
+        return dict(y=x * 2)
+
+    async def run():
+        scheduler = RenderScheduler(lambda **kwargs: painted.append(kwargs), fetch=fetch, wait=0.01)
+        scheduler.request(x=0)
+        await asyncio.sleep(0.05)
+        for x in range(1, 5):
+            scheduler.request(x=x)
+        release.set()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+
+    assert painted == [dict(x=4, y=8)]
+    # the burst of requests 1-3 never reached fetch
+    assert len(fetch_threads) == 2
+    assert threading.main_thread() not in fetch_threads
+
+
+def test_render_scheduler_error():
+    errors = []
+
+    def fetch(x):
+        raise ValueError(x)
+
+    async def run():
+        scheduler = RenderScheduler(lambda **kwargs: None, fetch=fetch, wait=0.01, on_error=errors.append)
+        scheduler.request(x=1)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
+
+
+def test_call_on_event_loop():
+    assert call_on_event_loop(print) is print
+    called = []
+
+    async def run():
+        callback = call_on_event_loop(lambda value: called.append((value, threading.get_ident())))
+        thread = threading.Thread(target=callback, args=(1,))
+        thread.start()
+        thread.join()
+        assert called == []
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert called == [(1, threading.get_ident())]
+
+
+def test_interactive_output_fetch():
+    calls = []
+    slider = widgets.IntSlider(value=1)
+
+    def f(x, scale, y):
+        calls.append((x, scale, y))
+
+    interactive_output(f, dict(x=slider), fixed=dict(scale=3), fetch=lambda x, scale: dict(y=x * scale))
+    slider.value = 2
+    assert calls == [(1, 3, 3), (2, 3, 6)]